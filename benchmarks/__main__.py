@@ -0,0 +1,4 @@
+# python3 -m benchmarks runs the pipeline benchmarks, see benchPipeline
+from .benchPipeline import main
+
+main()
@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+'''benchPipeline
+Feeds synthetic frames (bpc 1 and 2; 5, 8 and 10 touch points; zero lines)
+through the decoder, the touchEvt construction, the coordinate access and
+touchOut.handle, and reports frames per second and the time per frame.
+The uinput devices write to /dev/null, so neither root nor /dev/uinput is
+needed. Run from the repository root:
+    python3 -m benchmarks [--passes N] [--output results.json] [--compare old.json]
+'''
+import io
+import os
+import gc
+import json
+import time
+import platform
+import subprocess
+from argparse import ArgumentParser as ap
+from contextlib import redirect_stdout
+from time import perf_counter_ns
+
+import screeninfo
+
+from src import geometry, touchInput, touchOutput
+from src.config import Configuration
+from src.calibration import panelCalibration
+from src.timers import deadlineScheduler
+from src.touchInput import touchDecoder
+from src.touchIntermediate import touchEvt
+
+LAYOUTS = tuple((bpc, n) for bpc in (1, 2) for n in (5, 8, 10))
+STAGES = ('getEvent', 'getEvents', 'touchEvt', 'getState', 'absCoordinates', 'touchOut.handle')
+SCREEN = screeninfo.Monitor(0, 0, 1024, 600)
+FRAME_TIME = 0.008  # the synthetic frames are 8 ms apart
+PAUSE = 0.5  # seconds between a release and the next frame (past gestureDeadTime and dblClickTime)
+READ_FRAMES = 4  # frames per hidraw read in the getEvents stage
+
+
+class nullUInput(object):
+    # stands in for evdev.UInput, the reports are written to /dev/null
+    def __init__(self, cap=None, name='', version=0, **kw):
+        self.name = name
+        self.fd = os.open(os.devnull, os.O_WRONLY | os.O_CLOEXEC)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def frame(press, points, bpc, n):
+    # aa <press> <x> <y> bb <flags> (<y> <x>) * (n - 1) cc 00
+    flags = sum(1 << i for i in range(min(len(points), 8))) if press else 0
+    c = lambda v: v.to_bytes(bpc, 'big')
+    x, y = points[0]
+    b = bytes([0xaa, press]) + c(x) + c(y) + bytes([0xbb, flags])
+    for i in range(1, n):
+        x, y = points[i] if i < len(points) else (0, 0)
+        b += c(y) + c(x)
+    return b + bytes([0xcc, 0])
+
+def zeroLine(bpc, n):
+    # aa 00 00 .. bb 00 00 .., as long as a frame
+    return bytes([0xaa]) + bytes(2 * bpc + 1) + b'\xbb' + bytes(2 * bpc * (n - 1) + 3)
+
+def stream(bpc, n, cycles=20):
+    '''stream(bpc, n, cycles=20)
+    Returns the frames of cycles times: a one finger drag, a release, a zero
+    line, a two finger swipe, a release and a zero line.
+    '''
+    if bpc == 1:
+        topX = topY = (1 << 8 * bpc) - 1
+    else:
+        # absolute mode, the raw coordinates are pixels of the panel (pixW x pixH)
+        topX, topY = SCREEN.width - 1, SCREEN.height - 1
+    step = max(1, topX // 64)
+    frames = []
+    for i in range(cycles):
+        x0, y0 = topX // 4 + i % 8, topY // 3
+        for k in range(24):
+            frames.append(frame(1, [(x0 + k * step // 4, y0)], bpc, n))
+        frames.append(frame(0, [(0, 0)], bpc, n))
+        frames.append(zeroLine(bpc, n))
+        for k in range(24):
+            y = y0 + k * step // 4
+            frames.append(frame(1, [(x0, y), (x0 + 8 * step, y)], bpc, n))
+        frames.append(frame(0, [(0, 0)], bpc, n))
+        frames.append(zeroLine(bpc, n))
+    return frames
+
+def newDecoder(calibration=None):
+    return touchDecoder(maxPoints=10, screen=geometry.default(), calibration=calibration)
+
+def decodeAll(frames, calibration):
+    # every frame as its own event, timed FRAME_TIME apart and PAUSE after a release
+    decoder = newDecoder(calibration)
+    buffer = b''.join(frames)
+    # a trailing zero line (no cc) stays in the buffer until more data arrives
+    ok, events, Len, pos = decoder.getEvents(buffer)
+    assert ok, 'synthetic frames could not be decoded'
+    t = time.time()
+    for event in events:
+        event.time = t
+        t += FRAME_TIME if event.pressed else PAUSE
+    return events
+
+def timed(f, items, samples):
+    for item in items:
+        t = perf_counter_ns()
+        f(item)
+        samples.append(perf_counter_ns() - t)
+
+def benchGetEvent(frames, samples):
+    decoder = newDecoder()
+    buffer = b''.join(frames)
+    # the first frame detects the layout
+    ok, event, Len, pos = decoder.getEvent(buffer, 0)
+    end = len(buffer)
+    while pos < end:
+        t = perf_counter_ns()
+        ok, event, Len, pos = decoder.getEvent(buffer, pos, end)
+        samples.append(perf_counter_ns() - t)
+
+def benchGetEvents(frames, samples):
+    decoder = newDecoder()
+    decoder.getEvent(frames[0])
+    for i in range(1, len(frames), READ_FRAMES):
+        chunk = b''.join(frames[i:i + READ_FRAMES])
+        t = perf_counter_ns()
+        ok, events, Len, pos = decoder.getEvents(chunk)
+        dt = perf_counter_ns() - t
+        if events:
+            # the time per frame of this read
+            samples.extend([dt // len(events)] * len(events))
+
+def benchTouchEvt(events, samples):
+    values = [(e.absmode, e.bpc, e.pressed, list(e.aIDs), e.rawCoords) for e in events]
+    timed(lambda v: touchEvt(*v), values, samples)
+
+def benchGetState(events, samples):
+    def getState(e):
+        e.absCache = None
+        e.getState()
+    timed(getState, events, samples)
+
+def benchAbsCoordinates(events, samples):
+    def absCoordinates(e):
+        e.absCache = None
+        e.absCoordinates
+    timed(absCoordinates, events, samples)
+
+def benchHandle(events, samples, options, calibration):
+    # the gesture timers run on the synthetic event times
+    now = [events[0].time]
+    scheduler = deadlineScheduler(clock=lambda: now[0])
+    with redirect_stdout(io.StringIO()):
+        tout = touchOutput.touchOut(options, screen=geometry.default(), calibration=calibration,
+            scheduler=scheduler)
+    try:
+        for event in events:
+            now[0] = event.time
+            # like the main loop, the due timers fire before the frame is handled
+            scheduler.runDue()
+            t = perf_counter_ns()
+            tout.handle(event)
+            samples.append(perf_counter_ns() - t)
+    finally:
+        with redirect_stdout(io.StringIO()):
+            tout.close()
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def summarize(samples):
+    '''summarize(samples)
+    Returns frames per second and the distribution of the time per frame
+    (microseconds) of the samples in nanoseconds.
+    '''
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'frames': len(ordered),
+        'fps': len(ordered) * 1e9 / total if total else 0.0,
+        'mean': total / len(ordered) / 1e3,
+        'min': ordered[0] / 1e3,
+        'p50': percentile(ordered, 50) / 1e3,
+        'p90': percentile(ordered, 90) / 1e3,
+        'p99': percentile(ordered, 99) / 1e3,
+        'max': ordered[-1] / 1e3,
+    }
+
+def commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+def run(passes=5):
+    '''run(passes=5)
+    Runs all stages for all layouts and returns the results as a dict.
+    '''
+    touchInput.debug = False
+    touchOutput.UInput = nullUInput
+    geometry.monitors = [SCREEN]
+    options = Configuration()
+    results = {}
+    for bpc, n in LAYOUTS:
+        frames = stream(bpc, n)
+        samples = {s: [] for s in STAGES}
+        for i in range(passes):
+            gc.collect()
+            benchGetEvent(frames, samples['getEvent'])
+            benchGetEvents(frames, samples['getEvents'])
+            events = decodeAll(frames, None)
+            benchTouchEvt(events, samples['touchEvt'])
+            benchGetState(events, samples['getState'])
+            benchAbsCoordinates(events, samples['absCoordinates'])
+            # the daemon hands calibrated screen pixels to touchOut
+            calibration = panelCalibration(options, geometry.default())
+            events = decodeAll(frames, calibration)
+            benchHandle(events, samples['touchOut.handle'], options, calibration)
+        results['bpc%d-%dpt' % (bpc, n)] = {s: summarize(samples[s]) for s in STAGES}
+    return {
+        'commit': commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'numpy': getattr(touchInput.np, '__version__', None),
+        'passes': passes,
+        'results': results,
+    }
+
+def show(report, old=None):
+    print('commit %s, python %s, numpy %s, %d passes' % (report['commit'], report['python'], report['numpy'],
+        report['passes']))
+    print('%-12s %-16s %10s %9s %9s %9s %9s %9s' % ('layout', 'stage', 'fps', 'mean', 'p50', 'p90', 'p99', 'max'))
+    for layout, stages in report['results'].items():
+        for stage, r in stages.items():
+            line = '%-12s %-16s %10.0f %9.2f %9.2f %9.2f %9.2f %9.2f' % (layout, stage, r['fps'], r['mean'],
+                r['p50'], r['p90'], r['p99'], r['max'])
+            if old is not None:
+                o = old['results'].get(layout, {}).get(stage)
+                if o is not None and o['fps']:
+                    line += ' %6.2fx' % (r['fps'] / o['fps'])
+            print(line)
+    print('(times per frame in microseconds%s)' % ('' if old is None else
+        ', fps relative to %s' % old.get('commit')))
+
+def main(argv=None):
+    p = ap(prog='python3 -m benchmarks', description='benchmark the decoder, events and gesture handling')
+    p.add_argument('--passes', '-n', type=int, default=5, help='runs over the synthetic frames per layout')
+    p.add_argument('--output', '-o', default=None, help='JSON file for the results (default: bench-<commit>.json)')
+    p.add_argument('--compare', '-c', default=None, help='JSON file of an earlier run to compare with')
+    args = p.parse_args(argv)
+    old = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+    report = run(args.passes)
+    show(report, old)
+    output = args.output or 'bench-%s.json' % (report['commit'] or time.strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results saved to %r' % output)
+
+
+if __name__ == '__main__':
+    main()
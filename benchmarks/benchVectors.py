@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+'''benchVectors
+Compares the gesture vector math of vec with vec2, direction() and the numpy
+batch functions. Run from the repository root:
+    python3 -m benchmarks.benchVectors
+'''
+import random
+from timeit import repeat
+
+from src import vectors
+from src.vectors import vec, vec2, direction
+
+AXES = ((0, 1), (0, -1), (1, 0), (-1, 0))
+
+
+def classifyVec(x, y, dt=15):
+    # the four vec.angle() calls touchOut used to classify a swipe
+    vm = vec([x, y])
+    for i, a in enumerate(AXES):
+        if vm.angle(vec(list(a)), todegrees=True) < dt:
+            return i
+    return None
+
+def accumulateVec(moves):
+    m = vec([0, 0])
+    for dx, dy in moves:
+        m += vec([dx, dy])
+    return m.length
+
+def accumulateVec2(moves):
+    m = vec2()
+    for dx, dy in moves:
+        m += (dx, dy)
+    return m.length
+
+def best(stmt, number):
+    # seconds per call, best of 5
+    return min(repeat(stmt, number=number, repeat=5)) / number
+
+def main():
+    random.seed(0)
+    moves = [(random.randint(-20, 20), random.randint(-20, 20)) for _ in range(1000)]
+    x, y = 3.0, 40.0
+    results = [
+        ('length', best(lambda: vec([x, y]).length, 20000), best(lambda: vec2(x, y).length, 20000)),
+        ('sub+length', best(lambda: (vec([x, y]) - vec([1, 2])).length, 20000),
+            best(lambda: (vec2(x, y) - (1, 2)).length, 20000)),
+        ('angle', best(lambda: vec([x, y]).angle(vec([1, 0])), 20000),
+            best(lambda: vec2(x, y).angle((1, 0)), 20000)),
+        ('direction', best(lambda: classifyVec(x, y), 5000), best(lambda: direction(x, y), 20000)),
+        ('1000 moves', best(lambda: accumulateVec(moves), 20), best(lambda: accumulateVec2(moves), 20)),
+    ]
+    print('%-12s %12s %12s %8s' % ('operation', 'vec [us]', 'vec2 [us]', 'speedup'))
+    for name, old, new in results:
+        print('%-12s %12.3f %12.3f %7.1fx' % (name, old * 1e6, new * 1e6, old / new))
+    if vectors.np is not None:
+        np = vectors.np
+        d = np.array(moves, dtype=float)
+        batch = best(lambda: vectors.directions(d), 200)
+        single = best(lambda: [direction(dx, dy) for dx, dy in moves], 20)
+        print('%-12s %12.3f %12.3f %7.1fx  (direction() loop vs directions(), 1000 vectors)' % ('batch', single * 1e6,
+            batch * 1e6, single / batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import geometry
+
+debug = False
+
+ROTATIONS = {
+    # clockwise rotation of the panel -> normalized (u, v) to screen (u', v')
+    0: ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    90: ((0, -1, 1), (1, 0, 0), (0, 0, 1)),
+    180: ((-1, 0, 1), (0, -1, 1), (0, 0, 1)),
+    270: ((0, 1, 0), (-1, 0, 1), (0, 0, 1)),
+}
+LENGTH = re.compile('(?P<value>[\\d]+[,.]?[\\d]*) ?(?P<unit>[a-zA-Z]*)')
+
+
+def mul(a, b):
+    # product of two 3x3 matrices (tuples of rows)
+    return tuple(tuple(sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)) for i in range(3))
+
+def scale(sx, sy):
+    return ((sx, 0, 0), (0, sy, 0), (0, 0, 1))
+
+def millimeters(value):
+    '''millimeters(value)
+    Converts '15 cm', '6.2in', '153.6 mm' (or a number in mm) to millimeters.
+    '''
+    if not isinstance(value, str):
+        return value
+    m = LENGTH.fullmatch(value.strip())
+    if not m:
+        raise ValueError('%r cannot be parsed!' % value)
+    v, u = float(m.group('value').replace(',', '.')), m.group('unit')
+    if u == 'in':
+        return v * 25.4
+    elif u == 'cm':
+        return v * 10
+    elif u == 'mm':
+        return v
+    raise ValueError('Unknown unit %r' % u)
+
+def pixels(value, ppmm):
+    '''pixels(value, ppmm)
+    Converts '15 px', '1 cm', '4mm', '0.2 in' (or a number of pixels) to pixels
+    with ppmm pixels per millimeter.
+    '''
+    if not isinstance(value, str):
+        return value
+    m = LENGTH.fullmatch(value.strip())
+    if not m:
+        raise ValueError('%r cannot be parsed!' % value)
+    if m.group('unit') in ('px', 'PX', ''):
+        return int(float(m.group('value').replace(',', '.')))
+    return int(millimeters(value) * ppmm)
+
+def parsePoints(value):
+    '''parsePoints(value)
+    Parses 'x y X Y; x y X Y; ...' (raw touch coordinates and the screen
+    pixels they belong to) into a list of 4-tuples.
+    '''
+    if value is None or value == '':
+        return []
+    points = []
+    for p in str(value).split(';'):
+        if p.strip():
+            t = tuple(float(x) for x in p.replace(',', ' ').split())
+            if len(t) != 4:
+                raise ValueError('calibration point %r must be "x y X Y"' % p)
+            points.append(t)
+    if len(points) < 3:
+        raise ValueError('at least 3 calibration points are needed, not %d' % len(points))
+    return points
+
+def solve3(a, b):
+    # solves the 3x3 system a * x = b (Cramer's rule)
+    def det(m):
+        return (m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
+              - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
+              + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0]))
+    d = det(a)
+    if abs(d) < 1e-12:
+        raise ValueError('calibration points are collinear')
+    x = []
+    for j in range(3):
+        m = [[b[i] if k == j else a[i][k] for k in range(3)] for i in range(3)]
+        x.append(det(m) / d)
+    return x
+
+def fitAffine(points):
+    '''fitAffine(points)
+    Least squares fit of the affine matrix mapping (x, y) to (X, Y) for a
+    list of (x, y, X, Y).
+    '''
+    sxx = sum(p[0] * p[0] for p in points)
+    sxy = sum(p[0] * p[1] for p in points)
+    syy = sum(p[1] * p[1] for p in points)
+    sx = sum(p[0] for p in points)
+    sy = sum(p[1] for p in points)
+    a = ((sxx, sxy, sx), (sxy, syy, sy), (sx, sy, len(points)))
+    rows = []
+    for t in (2, 3):
+        b = (sum(p[0] * p[t] for p in points), sum(p[1] * p[t] for p in points), sum(p[t] for p in points))
+        rows.append(tuple(solve3(a, b)))
+    return (rows[0], rows[1], (0, 0, 1))
+
+def checkAffine(m):
+    '''checkAffine(m)
+    Returns the affine matrix m, raises ValueError if it is not finite or
+    maps the panel onto a line (e.g. collinear screen points).
+    '''
+    if not all(abs(v) < float('inf') for row in m for v in row):
+        raise ValueError('calibration points give an invalid matrix %r' % (m,))
+    if abs(m[0][0] * m[1][1] - m[0][1] * m[1][0]) < 1e-12:
+        raise ValueError('calibration points map the panel onto a line')
+    return m
+
+
+class panelCalibration(object):
+    '''class panelCalibration(object)
+    The panel setup of a touch device (devW/devH, pixW/pixH, rotation,
+    mirroring, calibration points) compiled into one affine matrix from raw
+    touch coordinates to screen pixels.
+    '''
+    def __init__(self, options, screen=None):
+        '''panelCalibration(options, screen=None)
+        Reads the panel setup from a Configuration and the screenGeometry of
+        the device. Raises ValueError for invalid settings.
+        '''
+        self.screen = geometry.default() if screen is None else screen
+        self.pixW = options.get('pixW', self.screen.width, vtype=int)
+        self.pixH = options.get('pixH', self.screen.height, vtype=int)
+        self.rotation = options.get('rotation', 0, vtype=int) % 360
+        if self.rotation not in ROTATIONS:
+            raise ValueError('rotation must be 0, 90, 180 or 270, not %r' % self.rotation)
+        if self.pixW <= 0 or self.pixH <= 0:
+            raise ValueError('pixW and pixH must be positive, not %r x %r' % (self.pixW, self.pixH))
+        self.mirrorX = options.get('mirrorX', False, vtype=bool)
+        self.mirrorY = options.get('mirrorY', False, vtype=bool)
+        self.points = parsePoints(options.get('calibrationPoints', ''))
+        # fitted now, so bad points fail at load (or reload) time and not at the first frame
+        self.fitted = checkAffine(fitAffine(self.points)) if self.points else None
+        self.devW = millimeters(options.get('devW', '16cm'))
+        self.devH = millimeters(options.get('devH', '9cm'))
+        if self.devW <= 0 or self.devH <= 0:
+            raise ValueError('devW and devH must be positive, not %r x %r' % (self.devW, self.devH))
+        self.update()
+
+    def update(self):
+        '''update()
+        Recomputes the pixels per millimeter of the screen, e.g. after the
+        screen geometry changed.
+        '''
+        # the gestures see screen pixels, the panel covers the whole screen
+        if self.rotation in (90, 270):
+            w, h = self.devH, self.devW
+        else:
+            w, h = self.devW, self.devH
+        self.ppmmX = self.screen.width / w
+        self.ppmmY = self.screen.height / h
+        self.ppmm = (self.ppmmX + self.ppmmY) / 2
+        self.lengths = {}
+
+    def pixels(self, value):
+        '''pixels(value)
+        Like pixels(value, ppmm), the result is cached for every value.
+        '''
+        try:
+            return self.lengths[value]
+        except KeyError:
+            p = self.lengths[value] = pixels(value, self.ppmm)
+            return p
+
+    def matrix(self, bpc, absmode):
+        '''matrix(bpc, absmode)
+        Returns the affine matrix for the detected layout of the device.
+        '''
+        if self.fitted is not None:
+            return self.fitted
+        if absmode:
+            rawW, rawH = self.pixW, self.pixH
+        else:
+            rawW = rawH = (1 << 8 * bpc) - 1
+        m = scale(1 / rawW, 1 / rawH)
+        if self.mirrorX:
+            m = mul(((-1, 0, 1), (0, 1, 0), (0, 0, 1)), m)
+        if self.mirrorY:
+            m = mul(((1, 0, 0), (0, -1, 1), (0, 0, 1)), m)
+        m = mul(ROTATIONS[self.rotation], m)
+        return mul(scale(self.screen.width, self.screen.height), m)
+
+    def compile(self, bpc, absmode):
+        '''compile(bpc, absmode)
+        Returns the affineTransform for the detected layout and the current
+        screen geometry.
+        '''
+        self.update()
+        if debug:
+            print('calibration matrix: %r' % (self.matrix(bpc, absmode),))
+        return affineTransform(self.matrix(bpc, absmode), self.screen.width - 1, self.screen.height - 1)
+
+
+class affineTransform(object):
+    '''class affineTransform(object)
+    Applies a compiled matrix to the flat coordinates x0, y0, x1, y1, ... of
+    a frame and clamps the results to the screen.
+    '''
+    def __init__(self, matrix, maxX, maxY):
+        (self.a, self.b, self.c), (self.d, self.e, self.f) = matrix[0], matrix[1]
+        self.maxX = maxX
+        self.maxY = maxY
+        if np is not None:
+            self.linear = np.array([[self.a, self.d], [self.b, self.e]])
+            self.offset = np.array([self.c, self.f])
+
+    def __call__(self, coords):
+        a, b, c, d, e, f = self.a, self.b, self.c, self.d, self.e, self.f
+        maxX, maxY = self.maxX, self.maxY
+        out = []
+        for i in range(0, len(coords), 2):
+            x, y = coords[i], coords[i + 1]
+            X = int(a * x + b * y + c)
+            Y = int(d * x + e * y + f)
+            out.append(0 if X < 0 else maxX if X > maxX else X)
+            out.append(0 if Y < 0 else maxY if Y > maxY else Y)
+        return out
+
+    def applyArray(self, coords):
+        '''applyArray(coords)
+        Vectorized version for an (..., 2) numpy array, returns a new array.
+        '''
+        out = np.floor(coords @ self.linear + self.offset)
+        np.clip(out, 0, (self.maxX, self.maxY), out=out)
+        return out.astype(coords.dtype)
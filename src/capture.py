@@ -0,0 +1,234 @@
+import os
+import select
+import struct
+from time import monotonic, monotonic_ns, sleep
+
+from .touchInput import frameBuffer
+
+debug = False
+
+# file header: magic, version, number of devices, then every device path as
+# length (H) and utf-8 bytes
+HEADER = struct.Struct('<4sBB')
+PATH = struct.Struct('<H')
+# every report: microseconds since the previous report, device index, length
+RECORD = struct.Struct('<IBH')
+MAGIC = b'PTDC'
+VERSION = 1
+MAX_DELAY = 0xffffffff
+
+
+class captureWriter(object):
+    '''class captureWriter(object)
+    Writes the raw reports of one or more hidraw devices with their
+    monotonic timestamps to a compact binary capture file.
+    '''
+    def __init__(self, path, devices, clock=monotonic):
+        '''captureWriter(path, devices, clock=monotonic)
+        Inititalises the writer with:
+            - path: the capture file (overwritten)
+            - devices: the paths of the recorded devices (at most 255)
+            - clock: returns the current time in seconds
+        '''
+        assert 0 < len(devices) < 256, 'between 1 and 255 devices can be recorded, not %d' % len(devices)
+        self.path = path
+        self.clock = clock
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(devices)))
+        for device in devices:
+            name = device.encode()
+            self.file.write(PATH.pack(len(name)) + name)
+        self.last = None
+        self.reports = 0
+        self.bytes = 0
+
+    def write(self, index, data, t=None):
+        '''write(index, data, t=None)
+        Appends one report of the device with the given index, received at
+        the clock time t (default: now).
+        '''
+        t = self.clock() if t is None else t
+        delay = 0 if self.last is None else round((t - self.last) * 1e6)
+        self.last = t
+        self.file.write(RECORD.pack(min(max(delay, 0), MAX_DELAY), index, len(data)))
+        self.file.write(data)
+        self.reports += 1
+        self.bytes += len(data)
+
+    def counters(self):
+        return {'reports': self.reports, 'bytes': self.bytes}
+
+    def close(self):
+        self.file.close()
+
+
+class captureReader(object):
+    '''class captureReader(object)
+    Reads a capture file, iterating yields (time, index, data) with the time
+    in seconds since the first report.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        magic, version, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%r is no capture file (version %d)' % (path, VERSION))
+        pos = HEADER.size
+        self.devices = []
+        for i in range(count):
+            n, = PATH.unpack_from(self.data, pos)
+            pos += PATH.size
+            self.devices.append(self.data[pos:pos + n].decode())
+            pos += n
+        self.start = pos
+
+    def __iter__(self):
+        data, pos, end = self.data, self.start, len(self.data)
+        view = memoryview(data)
+        t = 0.0
+        while pos + RECORD.size <= end:
+            delay, index, n = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            if pos + n > end:
+                if debug:
+                    print('%r: truncated report at byte %d' % (self.path, pos))
+                return
+            t += delay / 1e6
+            yield t, index, view[pos:pos + n]
+            pos += n
+
+
+class captureTarget(frameBuffer):
+    '''class captureTarget(frameBuffer)
+    Stands in for the hidrawReader of a recorded device during a replay.
+    '''
+    def __init__(self, path, callback, decoder=None, coalescer=None):
+        frameBuffer.__init__(self, callback, decoder=decoder, coalescer=coalescer)
+        self.path = path
+
+    def close(self):
+        pass
+
+
+class capturePlayer(object):
+    '''class capturePlayer(object)
+    Feeds the reports of a capture through the decoders and outputs, either
+    with the recorded timing or as fast as possible.
+    '''
+    def __init__(self, capture, targets, realtime=True, clock=monotonic):
+        '''capturePlayer(capture, targets, realtime=True, clock=monotonic)
+        Inititalises the player with:
+            - capture: a captureReader
+            - targets: a frameBuffer for every recorded device
+            - realtime: keep the recorded delays (False: as fast as possible,
+              gesture timers then see a compressed time)
+        '''
+        assert len(targets) == len(capture.devices), '%d devices recorded, %d targets' % (len(capture.devices), len(targets))
+        self.capture = capture
+        self.targets = targets
+        self.realtime = realtime
+        self.clock = clock
+        self.schedulers = []
+        self.reports = 0
+        self.bytes = 0
+
+    def addScheduler(self, scheduler, after=None):
+        # see eventLoop.addScheduler
+        self.schedulers.append((scheduler, after))
+
+    def runTimers(self):
+        for scheduler, after in self.schedulers:
+            if scheduler.runDue() and after is not None:
+                after()
+
+    def wait(self, due):
+        # sleeps until due, running the gesture timers in between
+        while True:
+            timeout = due - self.clock()
+            for scheduler, after in self.schedulers:
+                t = scheduler.timeout()
+                if t is not None and t < timeout:
+                    timeout = t
+            if timeout > 0:
+                sleep(timeout)
+            self.runTimers()
+            if self.clock() >= due:
+                return
+
+    def run(self):
+        '''run()
+        Replays the whole capture and returns the counters. Raises
+        ValueError if a frame could not be decoded.
+        '''
+        start = self.clock()
+        for t, index, data in self.capture:
+            if self.realtime:
+                self.wait(start + t)
+            target = self.targets[index]
+            if target.latency is not None:
+                target.received = monotonic_ns()
+            target.feed(data)
+            if not target.decode():
+                raise ValueError('%r: report %d could not be decoded' % (self.capture.path, self.reports))
+            self.reports += 1
+            self.bytes += len(data)
+            if not self.realtime:
+                self.runTimers()
+        # let pending timers (e.g. a long press) fire
+        for scheduler, after in self.schedulers:
+            due = scheduler.next()
+            if self.realtime and due is not None:
+                self.wait(due)
+        self.runTimers()
+        return self.counters(self.clock() - start)
+
+    def counters(self, seconds=0.0):
+        frames = sum(t.decoder.counters()['frames'] for t in self.targets)
+        return {
+            'reports': self.reports,
+            'bytes': self.bytes,
+            'frames': frames,
+            'seconds': seconds,
+            'fps': frames / seconds if seconds > 0 else 0.0
+        }
+
+
+def record(devices, path, stop=None, clock=monotonic):
+    '''record(devices, path, stop=None, clock=monotonic)
+    Records the raw reports of the hidraw devices to the capture file path
+    until stop() returns True, all devices are closed or KeyboardInterrupt.
+    Returns the counters.
+    '''
+    writer = captureWriter(path, devices, clock)
+    fds = {}
+    poll = select.epoll()
+    try:
+        for i, device in enumerate(devices):
+            fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+            fds[fd] = i
+            poll.register(fd, select.EPOLLIN)
+        remaining = len(fds)
+        while remaining and (stop is None or not stop()):
+            for fd, mask in poll.poll(0.5):
+                while True:
+                    try:
+                        data = os.read(fd, 4096)
+                    except BlockingIOError:
+                        break
+                    if not data:
+                        if debug:
+                            print('%r was closed' % devices[fds[fd]])
+                        poll.unregister(fd)
+                        remaining -= 1
+                        break
+                    # hidraw hands over a whole report per read
+                    writer.write(fds[fd], data)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poll.close()
+        for fd in fds:
+            os.close(fd)
+        writer.close()
+    return writer.counters()
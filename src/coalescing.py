@@ -0,0 +1,60 @@
+debug = False
+
+
+class moveCoalescer(object):
+    '''class moveCoalescer(object)
+    Drops stale move frames if the daemon fell behind: of consecutive frames
+    that only move the same touch points, only the latest one is handled.
+    Presses and releases (frames that change the active touch points) are
+    always kept.
+    '''
+    def __init__(self):
+        self.last = (False, None)  # (pressed, aIDs) of the last handled frame
+        self.merging = False
+        self.merged = 0   # frames that replaced at least one stale move
+        self.dropped = 0  # stale moves
+
+    def isMove(self, event):
+        # the frame moves the touch points of the previous frame
+        pressed, aIDs = self.last
+        return pressed and event.pressed and event.aIDs == aIDs
+
+    def stale(self, event, following):
+        '''stale(event, following)
+        Returns True (and counts the frame as dropped) if the move event is
+        superseded by the pending frame following.
+        '''
+        if not following.pressed or following.aIDs != event.aIDs or not self.isMove(event):
+            return False
+        self.dropped += 1
+        if not self.merging:
+            self.merging = True
+            self.merged += 1
+        return True
+
+    def passed(self, event):
+        # event is handled, the next frame is compared to it
+        self.last = (event.pressed, event.aIDs)
+        self.merging = False
+
+    def coalesce(self, events):
+        '''coalesce(events)
+        Returns the decoded events without the stale moves.
+        '''
+        if len(events) < 2:
+            if events:
+                self.passed(events[-1])
+            return events
+        kept = []
+        for event, following in zip(events, events[1:]):
+            if not self.stale(event, following):
+                kept.append(event)
+                self.passed(event)
+        kept.append(events[-1])
+        self.passed(events[-1])
+        if debug and len(kept) < len(events):
+            print('coalesced %d frames into %d' % (len(events), len(kept)))
+        return kept
+
+    def counters(self):
+        return {'merged': self.merged, 'dropped': self.dropped}
@@ -2,11 +2,14 @@ import re
 from os import curdir
 from os.path import realpath, isfile, join
 from collections import namedtuple
+from copy import copy
 
 from .typehelper import guess, get
 # from configparser import ConfigParser as cp
 #
 item = namedtuple('item', ['indentwidth', 'type', 'name', 'value', 'ilcomment'])  # TODO continuation
+# [device:/dev/hidraw0] holds the options of one touch device, see Configuration.forDevice
+DEVICE_SECTION = 'device:'
 
 class Configuration(object):
     def __init__(self, filepath=None, *,
@@ -97,6 +100,8 @@ class Configuration(object):
                 
     def hasValue(self, value):
         for s in self.data.keys():
+            if s.startswith(DEVICE_SECTION):
+                continue
             if value in self.data[s].keys():
                 return True
         return False
@@ -107,6 +112,8 @@ class Configuration(object):
             return self.getv(value, section=section, vtype=vtype, fallback=fallback)
         v, count = None, 0
         for s in self.data.keys():
+            if s.startswith(DEVICE_SECTION):
+                continue
             if value in self.data[s].keys():
                 v = self.getv(value, section=s, vtype=vtype, fallback=fallback)
                 count += 1
@@ -128,6 +135,20 @@ class Configuration(object):
             self.data[section] = {}
         self.data[section][name] = value
 
+    def forDevice(self, path):
+        '''forDevice(path)
+        Returns a copy in which the values of the section [device:<path>]
+        replace all others, e.g. the filter or the calibration of one device.
+        '''
+        cfg = copy(self)
+        own = self.data.get(DEVICE_SECTION + path, {})
+        cfg.data = {}
+        for s, values in self.data.items():
+            if not s.startswith(DEVICE_SECTION):
+                cfg.data[s] = {k: v for k, v in values.items() if k not in own}
+        cfg.data['default'].update(own)
+        return cfg
+
     def __str__(self):
         l = ['<Configuration id=%r path=%r>' % (hex(id(self)), self.path)]
 
@@ -183,6 +204,26 @@ def readConfig(basepath, filename):
     cfg.setv('rightClickDelay', 0.4)
     cfg.setv('pinchScale', 1.0)
     cfg.setv('live', False) 
+    cfg.setv('idleTimeout', 1.0)
+    cfg.setv('outputMode', 'emulate')
+    cfg.setv('monitor', 0)
+    cfg.setv('queueSize', 64)
+    cfg.setv('eventPoolSize', 64)
+    cfg.setv('gcFreeze', True)
+    cfg.setv('gcIdleCollect', True)
+    cfg.setv('gcIdleOnly', False)
+    cfg.setv('overflowPolicy', 'block')
+    cfg.setv('coalesceMoves', True)
+    cfg.setv('slotIdleTimeout', 30.0)
+    cfg.setv('latencyStats', True)
+    cfg.setv('rotation', 0)
+    cfg.setv('mirrorX', False)
+    cfg.setv('mirrorY', False)
+    cfg.setv('calibrationPoints', '')
+    cfg.setv('filter', True)
+    cfg.setv('filterMinCutoff', 1.0)
+    cfg.setv('filterBeta', 0.01)
+    cfg.setv('filterDCutoff', 1.0)
     cfg.read()
     
     return fp, cfg
@@ -0,0 +1,131 @@
+import os
+import json
+import socket
+
+debug = False
+
+MAX_LINE = 4096  # longest command a client may send
+
+
+class controlServer(object):
+    '''class controlServer(object)
+    A Unix domain socket served by the main loop. Every line a client sends
+    is a command; the reply is one line of JSON:
+        {"ok": true, "result": ...} or {"ok": false, "error": "..."}
+    '''
+    def __init__(self, path, commands, mode=0o600):
+        '''controlServer(path, commands, mode=0o600)
+        Inititalises the server with:
+            - path: the socket file (replaced if it exists)
+            - commands: maps command names to functions returning a JSON
+              serializable result (raise ValueError for a bad request)
+            - mode: the permissions of the socket file
+        '''
+        self.path = path
+        self.commands = commands
+        self.clients = {}  # fd -> (socket, bytearray of unterminated input)
+        self.runner = None
+        self.requests = 0
+        if os.path.exists(path):
+            os.remove(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        os.chmod(path, mode)
+        self.sock.listen(4)
+        self.sock.setblocking(False)
+
+    def attach(self, runner):
+        '''attach(runner)
+        Serves the socket from the main loop (eventLoop or pipelineGroup,
+        anything with addReader and removeReader).
+        '''
+        self.runner = runner
+        runner.addReader(self.sock.fileno(), self.accept)
+
+    def accept(self, fd):
+        try:
+            client, address = self.sock.accept()
+        except BlockingIOError:
+            return
+        # replies are small, a slow client must not block the daemon for long
+        client.settimeout(1.0)
+        self.clients[client.fileno()] = (client, bytearray())
+        self.runner.addReader(client.fileno(), self.serve)
+
+    def drop(self, fd):
+        client, buffered = self.clients.pop(fd)
+        self.runner.removeReader(fd)
+        client.close()
+
+    def serve(self, fd):
+        client, buffered = self.clients[fd]
+        try:
+            data = client.recv(MAX_LINE)
+        except (BlockingIOError, socket.timeout):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(fd)
+            return
+        buffered += data
+        while b'\n' in buffered:
+            line, _, rest = buffered.partition(b'\n')
+            buffered[:] = rest
+            try:
+                client.sendall(self.reply(line.decode(errors='replace')).encode() + b'\n')
+            except OSError:
+                self.drop(fd)
+                return
+        if len(buffered) > MAX_LINE:
+            self.drop(fd)
+
+    def reply(self, line):
+        '''reply(line)
+        Runs the command of a line and returns the JSON reply.
+        '''
+        name, _, argument = line.strip().partition(' ')
+        self.requests += 1
+        if debug:
+            print('control: %r' % line)
+        if name not in self.commands:
+            return json.dumps({'ok': False, 'error': 'unknown command %r (known: %s)' % (name, ', '.join(self.commands))})
+        try:
+            f = self.commands[name]
+            result = f(argument.strip()) if argument.strip() else f()
+        except (ValueError, TypeError) as err:
+            return json.dumps({'ok': False, 'error': str(err)})
+        return json.dumps({'ok': True, 'result': result})
+
+    def close(self):
+        for fd in list(self.clients):
+            self.drop(fd)
+        if self.runner is not None:
+            self.runner.removeReader(self.sock.fileno())
+        self.sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def request(path, command, timeout=2.0):
+    '''request(path, command, timeout=2.0)
+    Sends one command to the daemon listening on path and returns the
+    result. Raises OSError if there is no daemon and ValueError if the
+    command failed.
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(command.encode() + b'\n')
+        data = bytearray()
+        while not data.endswith(b'\n'):
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    reply = json.loads(data.decode())
+    if not reply.get('ok'):
+        raise ValueError(reply.get('error', 'failed'))
+    return reply.get('result')
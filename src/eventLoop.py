@@ -0,0 +1,125 @@
+import os
+import select
+import signal
+from time import monotonic
+
+debug = False
+
+
+class eventLoop(object):
+    '''class eventLoop(object)
+    An epoll based main loop. Input devices, signals (delivered through
+    signal.set_wakeup_fd), timers and the idle timeout are all served by one
+    poll set.
+    '''
+    def __init__(self, idleTimeout=1.0):
+        '''eventLoop(idleTimeout=1.0)
+        Inititalises the loop with:
+            - idleTimeout: seconds without input after which the idle handlers
+              are called once (None disables the idle handlers)
+        '''
+        assert idleTimeout is None or idleTimeout > 0, 'idleTimeout must be positive, not %r' % idleTimeout
+        self.poll = select.epoll()
+        self.readers = {}
+        self.signalHandlers = {}
+        self.idleHandlers = []
+        self.schedulers = []
+        self.idleTimeout = idleTimeout
+        self.idle = False
+        self.lastInput = monotonic()
+        self.reason = None
+        self.sigRead, self.sigWrite = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.poll.register(self.sigRead, select.EPOLLIN)
+        signal.set_wakeup_fd(self.sigWrite)
+
+    @staticmethod
+    def wakeup(signum, frame):
+        # the signal number is written to the wakeup fd and handled in run()
+        pass
+
+    def addReader(self, fd, callback):
+        self.readers[fd] = callback
+        self.poll.register(fd, select.EPOLLIN)
+
+    def removeReader(self, fd):
+        if self.readers.pop(fd, None) is not None:
+            self.poll.unregister(fd)
+
+    def addSignal(self, signum, callback):
+        self.signalHandlers[signum] = callback
+        signal.signal(signum, self.wakeup)
+
+    def addIdle(self, callback):
+        self.idleHandlers.append(callback)
+
+    def addScheduler(self, scheduler, after=None):
+        '''addScheduler(scheduler, after=None)
+        Runs the due timers of a deadlineScheduler, after() is called if any
+        timer fired (e.g. to flush the output).
+        '''
+        self.schedulers.append((scheduler, after))
+
+    def timeout(self):
+        # seconds until the idle timeout or the next timer, None: forever
+        timeout = None
+        if not self.idle and self.idleTimeout is not None:
+            timeout = max(0.0, self.lastInput + self.idleTimeout - monotonic())
+        for scheduler, after in self.schedulers:
+            t = scheduler.timeout()
+            if t is not None and (timeout is None or t < timeout):
+                timeout = t
+        return timeout
+
+    def runTimers(self):
+        for scheduler, after in self.schedulers:
+            if scheduler.runDue() and after is not None:
+                after()
+
+    def stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+
+    def handleSignals(self):
+        global debug
+        try:
+            data = os.read(self.sigRead, 64)
+        except BlockingIOError:
+            return
+        for signum in data:
+            if debug:
+                print('signal %d received' % signum)
+            if signum in self.signalHandlers:
+                self.signalHandlers[signum](signum)
+
+    def run(self):
+        '''run()
+        Serves the poll set until stop() is called and returns the reason.
+        '''
+        self.lastInput = monotonic()
+        while self.reason is None:
+            timeout = self.timeout()
+            ready = self.poll.poll(-1 if timeout is None else timeout)
+            self.runTimers()
+            if not ready:
+                if not self.idle and self.idleTimeout is not None \
+                  and monotonic() - self.lastInput >= self.idleTimeout:
+                    self.idle = True
+                    for callback in self.idleHandlers:
+                        callback()
+                continue
+            for fd, mask in ready:
+                if fd == self.sigRead:
+                    self.handleSignals()
+                else:
+                    self.idle = False
+                    self.lastInput = monotonic()
+                    self.readers[fd](fd)
+                if self.reason is not None:
+                    break
+        return self.reason
+
+    def close(self):
+        signal.set_wakeup_fd(-1)
+        self.poll.close()
+        os.close(self.sigRead)
+        os.close(self.sigWrite)
@@ -0,0 +1,129 @@
+from math import pi
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+debug = False
+# shortest interval (in seconds) between two frames: frames decoded together
+# from one read have nearly the same time, they are still smoothed as if they
+# arrived this far apart (and the speed estimation stays finite)
+MIN_INTERVAL = 0.002
+
+
+def smoothing(cutoff, dt):
+    # smoothing factor of an exponential low-pass filter
+    return 1.0 / (1.0 + 1.0 / (2 * pi * cutoff * dt))
+
+
+class oneEuroFilter(object):
+    '''class oneEuroFilter(object)
+    An adaptive low-pass filter (One Euro filter) for the coordinates of all
+    touch points: slow moves are smoothed strongly (no jitter), fast moves
+    hardly (no lag). Every touch point starts unfiltered when it is pressed.
+    '''
+    def __init__(self, slots, minCutoff=1.0, beta=0.01, dCutoff=1.0):
+        '''oneEuroFilter(slots, minCutoff=1.0, beta=0.01, dCutoff=1.0)
+        Inititalises the filter with:
+            - slots: number of touch points of a frame
+            - minCutoff: cutoff frequency in Hz at rest
+            - beta: increase of the cutoff frequency per pixel/s of speed
+        The coordinates are filtered in the units of the events, i.e. screen
+        pixels for a calibrated device.
+            - dCutoff: cutoff frequency in Hz of the speed estimation
+        '''
+        assert minCutoff > 0 and dCutoff > 0, 'cutoff frequencies must be positive'
+        self.slots = slots
+        self.minCutoff = minCutoff
+        self.beta = beta
+        self.dCutoff = dCutoff
+        self.time = None
+        if np is not None:
+            self.x = np.zeros((slots, 2))
+            self.dx = np.zeros((slots, 2))
+            self.active = np.zeros(slots, dtype=bool)
+        else:
+            self.x = [0.0] * (2 * slots)
+            self.dx = [0.0] * (2 * slots)
+            self.active = [False] * slots
+        self.filtered = 0
+
+    def apply(self, event):
+        '''apply(event)
+        Replaces the coordinates of the pressed touch points of an event by
+        the filtered ones. A release resets all touch points.
+        '''
+        t = event.time
+        # the first frame has only new touch points, they start unfiltered
+        dt = MIN_INTERVAL if self.time is None else max(t - self.time, MIN_INTERVAL)
+        self.time = t
+        if np is not None:
+            self.applyArray(event, dt)
+        else:
+            self.applyList(event, dt)
+        event.absCache = None
+        event.relCache = None
+        self.filtered += 1
+
+    def applyArray(self, event, dt):
+        c = event.coords
+        raw = np.frombuffer(c, dtype=c.typecode, count=2 * self.slots).reshape(self.slots, 2)
+        pressed = np.array(event.aIDs[:self.slots], dtype=bool) & event.pressed
+        ad = smoothing(self.dCutoff, dt)
+        dx = (raw - self.x) / dt
+        edx = self.dx + ad * (dx - self.dx)
+        a = smoothing(self.minCutoff + self.beta * np.abs(edx), dt)
+        x = self.x + a * (raw - self.x)
+        # touch points that were just pressed start at the raw position
+        new = pressed & ~self.active
+        x[new] = raw[new]
+        edx[new] = 0.0
+        self.x = np.where(pressed[:, None], x, self.x)
+        self.dx = np.where(pressed[:, None], edx, 0.0)
+        self.active = pressed
+        raw[pressed] = np.rint(self.x[pressed])
+
+    def applyList(self, event, dt):
+        c = event.coords
+        aIDs = event.aIDs if event.pressed else (False,) * self.slots
+        x, dx, active = self.x, self.dx, self.active
+        ad = smoothing(self.dCutoff, dt)
+        for s in range(self.slots):
+            if not aIDs[s]:
+                active[s] = False
+                continue
+            for i in (2 * s, 2 * s + 1):
+                if not active[s]:
+                    # a new touch point
+                    x[i], dx[i] = c[i], 0.0
+                else:
+                    d = (c[i] - x[i]) / dt
+                    dx[i] += ad * (d - dx[i])
+                    x[i] += smoothing(self.minCutoff + self.beta * abs(dx[i]), dt) * (c[i] - x[i])
+                c[i] = round(x[i])
+            active[s] = True
+
+    def counters(self):
+        return {'filtered': self.filtered}
+
+
+def filterFor(f, event, opt):
+    '''filterFor(f, event, opt)
+    Returns the filter f or a new one from the settings opt if there is none
+    yet or the event has another number of touch points.
+    '''
+    if f is None or f.slots != len(event.aIDs):
+        f = oneEuroFilter(len(event.aIDs), opt.filterMinCutoff, opt.filterBeta, opt.filterDCutoff)
+        if debug:
+            print('new filter for %d touch points' % f.slots)
+    return f
+
+def retune(f, opt):
+    '''retune(f, opt)
+    Takes over the parameters of the settings opt (e.g. after a reload), the
+    state of the filter f (if any) is kept.
+    '''
+    if f is not None:
+        f.minCutoff, f.beta, f.dCutoff = opt.filterMinCutoff, opt.filterBeta, opt.filterDCutoff
+    return f
@@ -0,0 +1,81 @@
+import ast
+
+debug = False
+
+# functions a formula may call
+FUNCTIONS = {'min': min, 'max': max, 'abs': abs, 'round': round, 'int': int, 'float': float}
+OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call) + OPERATORS
+MAX_EXPONENT = 8  # largest exponent of **, it must be a number
+
+
+def exponent(node):
+    # the value of a constant exponent like 2, 0.5 or -1, None for anything else
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return sign * node.value
+    return None
+
+
+def check(tree, variables, text):
+    # raises ValueError for everything but arithmetic on numbers and variables
+    for node in ast.walk(tree):
+        if not isinstance(node, NODES):
+            raise ValueError('%r: %s is not allowed' % (text, type(node).__name__))
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise ValueError('%r: only numbers are allowed, not %r' % (text, node.value))
+        if isinstance(node, ast.Name) and node.id not in variables and node.id not in FUNCTIONS:
+            raise ValueError('%r: unknown name %r (allowed: %s)' % (text, node.id, ', '.join(variables)))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ValueError('%r: only %s can be called' % (text, ', '.join(FUNCTIONS)))
+            if node.keywords:
+                raise ValueError('%r: keyword arguments are not allowed' % text)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            # a variable or nested exponent could take forever at run time
+            e = exponent(node.right)
+            if e is None or abs(e) > MAX_EXPONENT:
+                raise ValueError('%r: the exponent of ** must be a number up to %d' % (text, MAX_EXPONENT))
+            if any(isinstance(n, ast.BinOp) and isinstance(n.op, ast.Pow) for n in ast.walk(node.left)):
+                raise ValueError('%r: ** cannot be nested' % text)
+
+
+def compileFormula(text, variables=('l',)):
+    '''compileFormula(text, variables=('l',))
+    Parses an arithmetic expression like 'max(1, l / 10)' once and returns a
+    function of the given variables (called with keyword arguments).
+    Only numbers, the variables, + - * / // % ** (with a number up to
+    MAX_EXPONENT as exponent) and min, max, abs, round, int, float are
+    allowed. Raises ValueError for everything else.
+    '''
+    text = str(text).strip()
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError as err:
+        raise ValueError('%r is no valid formula: %s' % (text, err.msg))
+    check(tree, variables, text)
+    # the checked expression becomes the body of lambda <variables>: ...
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(arg=v) for v in variables], vararg=None,
+        kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+    tree = ast.fix_missing_locations(ast.Expression(ast.Lambda(args, tree.body)))
+    f = eval(compile(tree, '<formula %r>' % text, 'eval'), {'__builtins__': {}, **FUNCTIONS})
+    f.text = text
+    if debug:
+        print('compiled formula %r(%s)' % (text, ', '.join(variables)))
+    return f
+
+
+def steps(f, **values):
+    '''steps(f, **values)
+    Returns int(f(**values)) for a compiled formula, or None if it cannot be
+    evaluated for these values (e.g. a division by zero or int(inf)), the
+    caller then skips its action.
+    '''
+    try:
+        return int(f(**values))
+    except (ArithmeticError, ValueError, TypeError) as err:
+        print('formula %r failed for %r: %s' % (getattr(f, 'text', f), values, err))
+        return None
@@ -0,0 +1,91 @@
+import gc
+from time import perf_counter
+
+debug = False
+
+
+def parseThresholds(value):
+    '''parseThresholds(value)
+    Parses '700, 10, 10' (or a number for generation 0 only) for gc.set_threshold.
+    '''
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return (int(value),)
+    try:
+        t = tuple(int(x) for x in str(value).split(','))
+    except ValueError:
+        raise ValueError('%r cannot be parsed as gc thresholds!' % value)
+    if not 1 <= len(t) <= 3 or any(x < 0 for x in t):
+        raise ValueError('%r are no valid gc thresholds!' % value)
+    return t
+
+
+class gcPolicy(object):
+    '''class gcPolicy(object)
+    Controls when the garbage collector runs and counts the collections.
+    '''
+    def __init__(self, thresholds=None, freeze=True, idleCollect=True, idleOnly=False):
+        '''gcPolicy(thresholds=None, freeze=True, idleCollect=True, idleOnly=False)
+        Inititalises the policy with:
+            - thresholds: generation thresholds for gc.set_threshold (None: keep)
+            - freeze: move everything allocated at startup to the permanent
+              generation (gc.freeze, python 3.7+)
+            - idleCollect: run a full collection when the input goes idle
+            - idleOnly: disable the automatic collection, i.e. only collect
+              while idle
+        '''
+        self.thresholds = thresholds
+        self.freeze = freeze
+        self.idleCollect = idleCollect or idleOnly
+        self.idleOnly = idleOnly
+        self.collections = [0, 0, 0]
+        self.idleCollections = 0
+        self.time = 0.0
+        self.maxTime = 0.0
+        self.started = None
+
+    def callback(self, phase, info):
+        if phase == 'start':
+            self.started = perf_counter()
+        elif self.started is not None:
+            dt = perf_counter() - self.started
+            self.started = None
+            self.collections[info['generation']] += 1
+            self.time += dt
+            self.maxTime = max(self.maxTime, dt)
+
+    def start(self):
+        '''start()
+        Applies the policy, to be called when the daemon is set up.
+        '''
+        global debug
+        if self.thresholds is not None:
+            gc.set_threshold(*self.thresholds)
+        gc.collect()
+        if self.freeze and hasattr(gc, 'freeze'):
+            gc.freeze()
+        if self.idleOnly:
+            gc.disable()
+        gc.callbacks.append(self.callback)
+        if debug:
+            print('gc: thresholds=%r frozen=%s automatic=%s' % (gc.get_threshold(),
+                getattr(gc, 'get_freeze_count', lambda: 0)(), gc.isenabled()))
+
+    def idle(self):
+        if self.idleCollect:
+            self.idleCollections += 1
+            gc.collect()
+
+    def stop(self):
+        if self.callback in gc.callbacks:
+            gc.callbacks.remove(self.callback)
+        gc.enable()
+
+    def counters(self):
+        return {
+            'collections': list(self.collections),
+            'idleCollections': self.idleCollections,
+            'time': self.time,
+            'maxTime': self.maxTime
+        }
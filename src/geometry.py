@@ -0,0 +1,83 @@
+from weakref import WeakSet
+
+import screeninfo
+
+debug = False
+
+fallback = screeninfo.Monitor(0, 0, 1920, 1080)
+try:
+    enumErrors = (NotImplementedError, screeninfo.common.ScreenInfoError)
+except AttributeError:
+    enumErrors = (NotImplementedError,)
+monitors = None  # cached result of screeninfo.get_monitors()
+geometries = WeakSet()  # refreshed by invalidate()
+defaultGeometry = None
+
+
+def getMonitors():
+    '''getMonitors()
+    Returns the cached list of monitors, enumerating them on first use.
+    '''
+    global monitors
+    if monitors is None:
+        try:
+            monitors = screeninfo.get_monitors()
+        except enumErrors as err:
+            if debug:
+                print('Could not enumerate monitors: %s' % err)
+            monitors = []
+        if debug:
+            print('Monitors: %r' % monitors)
+    return monitors
+
+def getMonitor(index=0):
+    ms = getMonitors()
+    if 0 <= index < len(ms):
+        return ms[index]
+    if debug:
+        print('Monitor #%d not found, using %r' % (index, fallback))
+    return fallback
+
+def invalidate():
+    '''invalidate()
+    Drops the cached monitors and re-resolves all screenGeometry objects,
+    e.g. after a SIGHUP.
+    '''
+    global monitors
+    monitors = None
+    for g in list(geometries):
+        g.refresh()
+
+def default():
+    global defaultGeometry
+    if defaultGeometry is None:
+        defaultGeometry = screenGeometry(0)
+    return defaultGeometry
+
+
+class screenGeometry(object):
+    '''class screenGeometry(object)
+    The resolved size of the monitor a touch device maps to.
+    '''
+    def __init__(self, monitor=0):
+        '''screenGeometry(monitor=0)
+        Resolves the monitor with the given index (see screeninfo).
+        '''
+        assert isinstance(monitor, int) and monitor >= 0, 'monitor must be a non-negative integer, not %r' % monitor
+        self.index = monitor
+        self.version = 0  # incremented by every refresh, see touchDecoder.calibrate
+        self.refresh()
+        geometries.add(self)
+
+    def refresh(self):
+        m = getMonitor(self.index)
+        self.monitor = m
+        self.x, self.y = m.x, m.y
+        self.width, self.height = m.width, m.height
+        # scale factors from absolute coordinates to fractions of the screen
+        self.relX = 1 / self.width
+        self.relY = 1 / self.height
+        self.version += 1
+
+    def __repr__(self):
+        return '<screenGeometry monitor=%d size=%dx%d>' % (self.index, self.width, self.height)
@@ -0,0 +1,422 @@
+from .vectors import vec2, direction
+from .timers import deadlineScheduler
+from .formula import steps
+
+debug = False
+
+# states of the gesture engine
+IDLE = 'idle'  # no touch point
+TOUCH = 'touch'  # one finger, not yet recognized
+DRAG = 'drag'  # one finger, dragging
+MULTI = 'multi'  # two or more fingers
+DEAD = 'dead'  # a multi finger gesture ended, wait for all fingers and gestureDeadTime
+# event kinds
+PRESS = 'press'
+RELEASE = 'release'
+
+# (state, finger count delta, event kind) -> gestureEngine method, all
+# other combinations are ignored
+TRANSITIONS = {
+    (IDLE, 1, PRESS): 'start',
+    (TOUCH, 0, PRESS): 'move',
+    (TOUCH, 1, PRESS): 'addFinger',
+    (TOUCH, 0, RELEASE): 'end',
+    (TOUCH, -1, RELEASE): 'end',
+    (DRAG, 0, PRESS): 'move',
+    (DRAG, 1, PRESS): 'addFinger',
+    (DRAG, 0, RELEASE): 'end',
+    (DRAG, -1, RELEASE): 'end',
+    (MULTI, 0, PRESS): 'move',
+    (MULTI, 1, PRESS): 'addFinger',
+    (MULTI, -1, PRESS): 'end',
+    (MULTI, 0, RELEASE): 'end',
+    (MULTI, -1, RELEASE): 'end',
+    (DEAD, 1, PRESS): 'restart',
+    (DEAD, 0, RELEASE): 'rest',
+    (DEAD, -1, RELEASE): 'rest',
+}
+
+
+class touchTrack(object):
+    '''class touchTrack(object)
+    The touch points of one gesture, from the first press to the end.
+    '''
+    __slots__ = ('start', 'time', 'fingers', 'slots', 'primary', 'first', 'last', 'moved', 'double',
+        'dragging', 'held')
+
+    def __init__(self, time, slots, coords):
+        '''touchTrack(time, slots, coords)
+        Inititalises the track with:
+            - time: the time of the first press
+            - slots: the active touch points
+            - coords: the absolute coordinates of all touch points
+        '''
+        self.start = self.time = time
+        self.fingers = len(slots)  # maximum number of fingers
+        self.slots = slots
+        self.primary = slots[0]
+        self.first = {s: coords[s] for s in slots}
+        self.last = dict(self.first)
+        self.moved = {s: vec2() for s in slots}
+        self.double = False
+        self.dragging = False
+        self.held = False  # a recognizer handled the long press
+
+    def restart(self, time, slots, coords):
+        '''restart(time, slots, coords)
+        Starts the movement of all fingers anew (when a finger joined), the
+        start time and the maximum number of fingers are kept.
+        '''
+        self.time = time
+        self.slots = slots
+        self.primary = slots[0]
+        self.first = {s: coords[s] for s in slots}
+        self.last = dict(self.first)
+        self.moved = {s: vec2() for s in slots}
+        if len(slots) > self.fingers:
+            self.fingers = len(slots)
+
+    def update(self, time, slots, coords):
+        self.time = time
+        first, last, moved = self.first, self.last, self.moved
+        for s in slots:
+            p = coords[s]
+            if s in last:
+                o = last[s]
+                moved[s] += (p[0] - o[0], p[1] - o[1])
+            else:
+                first[s] = p
+                moved[s] = vec2()
+            last[s] = p
+        self.slots = slots
+        if len(slots) > self.fingers:
+            self.fingers = len(slots)
+
+    @property
+    def duration(self):
+        return self.time - self.start
+
+    @property
+    def position(self):
+        # last position of the first finger
+        return self.last[self.primary]
+
+    def vectors(self):
+        # movement of all fingers, ordered by slot
+        return [self.moved[s] for s in sorted(self.moved)]
+
+
+class recognizer(object):
+    '''class recognizer(object)
+    Base class of the pluggable gesture recognizers. The engine offers the
+    gestures with the finger counts in self.fingers to all recognizers in
+    the order they were added, the first one that recognizes it wins.
+    '''
+    fingers = (1,)
+
+    def __init__(self):
+        self.engine = None  # set by gestureEngine.add
+
+    def move(self, track, event):
+        '''move(track, event)
+        Called for every frame of the gesture, returns a new engine state
+        (e.g. DRAG) or None.
+        '''
+        return None
+
+    def end(self, track):
+        '''end(track)
+        Called when the gesture ends, returns True if it was recognized.
+        '''
+        return False
+
+    def hold(self, track):
+        '''hold(track)
+        Called when the fingers were down for longClickTime without a drag,
+        returns True if it handled the long press.
+        '''
+        return False
+
+    def cancel(self, track):
+        # another finger joined the gesture
+        pass
+
+
+class dragRecognizer(recognizer):
+    def move(self, track, event):
+        engine = self.engine
+        if track.held:
+            # the long press was handled already
+            return None
+        if track.dragging:
+            engine.out.passThrough(event)
+            return None
+        m = track.moved[track.primary]
+        if m.x * m.x + m.y * m.y > engine.opt.dragDistSq:
+            if debug:
+                print('enh: entering DRAG mode')
+            track.dragging = True
+            x, y = track.first[track.primary]
+            engine.out.dragStart(x, y)
+            engine.out.passThrough(event)
+            return DRAG
+        return None
+
+    def end(self, track):
+        if track.dragging:
+            x, y = track.position
+            self.engine.out.dragEnd(x, y)
+        return track.dragging
+
+    def cancel(self, track):
+        if track.dragging:
+            x, y = track.position
+            self.engine.out.dragEnd(x, y)
+            track.dragging = False
+
+
+class longPressRecognizer(recognizer):
+    def hold(self, track):
+        if track.dragging or not self.engine.opt.holdForRightClick:
+            return False
+        if debug:
+            print('enh: long click -> right click')
+        x, y = self.engine.tapPosition(track)
+        self.engine.out.click(x, y, right=True)
+        return True
+
+    def end(self, track):
+        # the right click was sent when the long press was detected
+        return track.held
+
+
+class doubleTapRecognizer(recognizer):
+    def end(self, track):
+        if track.dragging or not track.double:
+            return False
+        if debug:
+            print('enh: double click')
+        # the second click at the position of the first one
+        self.engine.out.click()
+        return True
+
+
+class tapRecognizer(recognizer):
+    def end(self, track):
+        if track.dragging:
+            return False
+        x, y = self.engine.tapPosition(track)
+        if debug:
+            print('enh: click at (%d, %d)' % (x, y))
+        self.engine.out.click(x, y)
+        self.engine.lastTap = (x, y)
+        return True
+
+
+class pinchRecognizer(recognizer):
+    fingers = (2,)
+
+    def end(self, track):
+        opt = self.engine.opt
+        v1, v2 = track.vectors()[:2]
+        if v1.isNullVector or v2.isNullVector:
+            return False
+        alpha = v1.angle(v2, todegrees=True)
+        if abs(alpha - 180) >= opt.pinchAngleThreshold:
+            return False
+        slots = sorted(track.first)[:2]
+        # finger distance at the start and the end
+        d1 = (vec2.of(track.first[slots[0]]) - track.first[slots[1]]).length
+        d2 = (vec2.of(track.last[slots[0]]) - track.last[slots[1]]).length
+        if d1 == 0:
+            return False
+        k = d2 / d1
+        p = k * 100
+        if debug:
+            print('enh: pinch detected: %f -> %f (%f %%)' % (d1, d2, p))
+        nclicks = steps(opt.pinchToZoomClicks, k=k, p=p, d1=d1, d2=d2)
+        if nclicks is not None:
+            self.engine.out.zoom(k, nclicks)
+        return True
+
+
+class swipeRecognizer(recognizer):
+    '''class swipeRecognizer(recognizer)
+    Recognizes parallel moves of all fingers (two, three or four).
+    '''
+    def __init__(self, fingers=2):
+        recognizer.__init__(self)
+        self.fingers = (fingers,)
+
+    def end(self, track):
+        opt = self.engine.opt
+        vs = track.vectors()
+        if any(v.isNullVector for v in vs):
+            return False
+        if any(v.angle(vs[0], todegrees=True) >= opt.parallelAngleThreshold for v in vs[1:]):
+            return False
+        vm = vs[0]
+        for v in vs[1:]:
+            vm = vm + v
+        vm = vm * (1 / len(vs))
+        d = direction(vm.x, vm.y, opt.directionAngleThreshold)
+        if debug:
+            print('enh: %d finger swipe %r' % (len(vs), vm))
+        if d is None:
+            if debug:
+                print('enh: unhandled diagonal gesture')
+            return False
+        self.engine.out.swipe(len(vs), d, vm.length)
+        return True
+
+
+def defaultRecognizers():
+    return [dragRecognizer(), longPressRecognizer(), doubleTapRecognizer(), tapRecognizer(),
+        pinchRecognizer(), swipeRecognizer(2), swipeRecognizer(3), swipeRecognizer(4)]
+
+
+class gestureEngine(object):
+    '''class gestureEngine(object)
+    Recognizes gestures with a transition table keyed by (state, finger
+    count delta, event kind) and the pluggable recognizers.
+    '''
+    def __init__(self, out, opt, recognizers=None, scheduler=None):
+        '''gestureEngine(out, opt, recognizers=None, scheduler=None)
+        Inititalises the engine with:
+            - out: the output the recognizers call (click, dragStart,
+              passThrough, dragEnd, zoom, swipe; see touchOut)
+            - opt: the settings snapshot
+            - recognizers: a list of recognizers (None: defaultRecognizers())
+            - scheduler: the deadlineScheduler for the long press, double
+              click and dead time timers (None: a new one, its due timers
+              are run with every frame)
+        '''
+        self.out = out
+        self.opt = opt
+        self.scheduler = deadlineScheduler() if scheduler is None else scheduler
+        self.state = IDLE
+        self.count = 0  # active fingers of the last frame
+        self.track = None
+        self.lastTap = None  # position of the last click (while tapWindow is open)
+        self.tapWindow = None  # timer of the double click window
+        self.holdTimer = None
+        self.deadTimer = None
+        self.recognizers = []
+        self.byFingers = {}
+        self.table = {key: getattr(self, name) for key, name in TRANSITIONS.items()}
+        for r in defaultRecognizers() if recognizers is None else recognizers:
+            self.add(r)
+
+    def add(self, recognizer):
+        recognizer.engine = self
+        self.recognizers.append(recognizer)
+        for n in recognizer.fingers:
+            self.byFingers[n] = self.byFingers.get(n, ()) + (recognizer,)
+
+    def handle(self, event):
+        '''handle(event)
+        Dispatches a frame to the handler of the transition table.
+        '''
+        # timers that are due were missed by the main loop
+        self.scheduler.runDue()
+        aIDs = event.aIDs
+        # a release frame may still carry the active flags
+        count = sum(aIDs) if event.pressed else 0
+        kind = PRESS if event.pressed and count else RELEASE
+        delta = (count > self.count) - (count < self.count)
+        self.table.get((self.state, delta, kind), self.ignore)(event, aIDs)
+        self.count = count
+
+    def tapPosition(self, track):
+        # the middle of the press and the release position
+        (x0, y0), (x1, y1) = track.first[track.primary], track.position
+        return round((x0 + x1) / 2), round((y0 + y1) / 2)
+
+    def ignore(self, event, aIDs):
+        pass
+
+    def start(self, event, aIDs):
+        slots = [i for i, a in enumerate(aIDs) if a]
+        track = self.track = touchTrack(event.time, slots, event.absCoordinates)
+        sched = self.scheduler
+        if self.lastTap is not None and self.tapWindow is not None:
+            (x, y), (tx, ty) = track.position, self.lastTap
+            track.double = (x - tx) ** 2 + (y - ty) ** 2 < self.opt.dragDistSq
+        self.lastTap = None
+        sched.cancel(self.tapWindow)
+        self.tapWindow = sched.after(self.opt.dblClickTime, self.closeTapWindow)
+        self.state = TOUCH if len(slots) == 1 else MULTI
+        self.holdTimer = sched.after(self.opt.longClickTime, self.hold)
+        if debug:
+            print('gesture: %s with %d finger(s)%s' % (self.state, len(slots), ' (double)' * track.double))
+
+    def move(self, event, aIDs):
+        track = self.track
+        track.update(event.time, [i for i, a in enumerate(aIDs) if a], event.absCoordinates)
+        for r in self.byFingers.get(track.fingers, ()):
+            state = r.move(track, event)
+            if state is not None:
+                self.state = state
+        if track.dragging:
+            self.scheduler.cancel(self.holdTimer)
+
+    def addFinger(self, event, aIDs):
+        track = self.track
+        self.scheduler.cancel(self.holdTimer)
+        for r in self.byFingers.get(track.fingers, ()):
+            r.cancel(track)
+        # the multi finger gesture starts where all fingers are now
+        track.restart(event.time, [i for i, a in enumerate(aIDs) if a], event.absCoordinates)
+        self.state = MULTI
+        if debug:
+            print('gesture: %d fingers' % track.fingers)
+
+    def end(self, event, aIDs):
+        track = self.track
+        track.time = event.time
+        self.scheduler.cancel(self.holdTimer)
+        for r in self.byFingers.get(track.fingers, ()):
+            if r.end(track):
+                if debug:
+                    print('gesture: %s recognized' % type(r).__name__)
+                break
+        self.track = None
+        if track.fingers > 1:
+            self.state = DEAD
+            self.deadTimer = self.scheduler.after(self.opt.gestureDeadTime, self.deadOver)
+        else:
+            self.state = IDLE
+
+    def restart(self, event, aIDs):
+        if self.count == 0 and self.deadTimer is None:
+            self.start(event, aIDs)
+        elif debug:
+            print('discarding event %s' % event)
+
+    def rest(self, event, aIDs):
+        # all fingers are up (a release frame)
+        if self.deadTimer is None:
+            self.state = IDLE
+
+    # timer callbacks
+
+    def hold(self):
+        track = self.track
+        self.holdTimer = None
+        if track is None or track.dragging:
+            return
+        for r in self.byFingers.get(track.fingers, ()):
+            if r.hold(track):
+                track.held = True
+                if debug:
+                    print('gesture: long press handled by %s' % type(r).__name__)
+                break
+
+    def closeTapWindow(self):
+        self.tapWindow = None
+        self.lastTap = None
+
+    def deadOver(self):
+        self.deadTimer = None
+        if self.state == DEAD and self.count == 0:
+            self.state = IDLE
@@ -0,0 +1,108 @@
+from time import monotonic_ns
+
+debug = False
+
+SUB_BITS = 2  # 4 buckets per power of two, the error of a bucket is below 25 %
+BUCKETS = 64 << SUB_BITS
+# read -> decoded -> gesture handled -> output written, and read -> written
+STAGES = ('decode', 'gesture', 'output', 'total')
+
+
+def bucket(ns):
+    # index of the bucket of ns (nanoseconds >= 0)
+    b = ns.bit_length()
+    if b <= SUB_BITS + 1:
+        return ns
+    shift = b - SUB_BITS - 1
+    return (shift << SUB_BITS) + (ns >> shift)
+
+def upperBound(i):
+    # the smallest value of the next bucket
+    if i < 2 << SUB_BITS:
+        return i + 1
+    shift = (i >> SUB_BITS) - 1
+    return (i - (shift << SUB_BITS) + 1) << shift
+
+
+class logHistogram(object):
+    '''class logHistogram(object)
+    A histogram of nanosecond durations with a fixed number of logarithmic
+    buckets, cheap enough to record every frame.
+    '''
+    __slots__ = ('counts', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.max = 0
+
+    def add(self, ns):
+        if ns < 0:
+            ns = 0
+        self.counts[bucket(ns)] += 1
+        self.count += 1
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p):
+        '''percentile(p)
+        Returns the upper bound (ns) of the bucket that holds the p-th
+        percentile, at most the maximum.
+        '''
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if c and n >= rank:
+                return min(upperBound(i), self.max)
+        return self.max
+
+    def summary(self):
+        # count and percentiles in microseconds
+        return {
+            'count': self.count,
+            'p50': self.percentile(50) / 1e3,
+            'p95': self.percentile(95) / 1e3,
+            'p99': self.percentile(99) / 1e3,
+            'max': self.max / 1e3
+        }
+
+
+class latencyMonitor(object):
+    '''class latencyMonitor(object)
+    The latency histograms of one device. Every frame is stamped with the
+    monotonic clock when it was read and decoded (see frameBuffer), when the
+    gesture engine handled it and when its output was written.
+    '''
+    def __init__(self, name=''):
+        self.name = name
+        self.histograms = {s: logHistogram() for s in STAGES}
+        self.decode, self.gesture, self.output, self.total = (self.histograms[s] for s in STAGES)
+
+    def record(self, received, decoded, handled, written=None):
+        '''record(received, decoded, handled, written=None)
+        Adds the stamps (monotonic_ns) of one frame, written defaults to now.
+        '''
+        if written is None:
+            written = monotonic_ns()
+        self.decode.add(decoded - received)
+        self.gesture.add(handled - decoded)
+        self.output.add(written - handled)
+        self.total.add(written - received)
+
+    def summary(self):
+        return {s: h.summary() for s, h in self.histograms.items()}
+
+
+def formatSummary(name, summary):
+    '''formatSummary(name, summary)
+    Returns the latencyMonitor.summary of a device as a table.
+    '''
+    lines = ['%s (microseconds)' % name, '    %-8s %9s %9s %9s %9s %9s' % ('stage', 'frames', 'p50', 'p95', 'p99', 'max')]
+    for stage in STAGES:
+        s = summary.get(stage)
+        if s is not None:
+            lines.append('    %-8s %9d %9.1f %9.1f %9.1f %9.1f' % (stage, s['count'], s['p50'], s['p95'], s['p99'], s['max']))
+    return '\n'.join(lines)
@@ -0,0 +1,168 @@
+from collections import namedtuple
+
+from .typehelper import get
+from .calibration import LENGTH, pixels
+from .formula import compileFormula
+
+# name, type (a type or 'length' for px/mm/cm/in values), default, allowed values
+option = namedtuple('option', ['name', 'type', 'default', 'choices'])
+
+SCHEMA = (
+    option('debug', bool, False, None),
+    option('live', bool, False, None),
+    option('outputMode', str, 'emulate', ('emulate', 'multitouch')),
+    # gestures
+    option('sglClickTime', float, 0.2, None),
+    option('dblClickTime', float, 0.4, None),
+    option('longClickTime', float, 0.4, None),
+    option('rightClickDelay', float, 0.4, None),
+    option('gestureDeadTime', float, 0.1, None),
+    option('holdForRightClick', bool, False, None),
+    option('enhSglClick', bool, False, None),
+    option('enhDblClick', bool, False, None),
+    option('dragDist', 'length', 30, None),
+    option('pinchToZoom', bool, False, None),
+    option('pinchScale', float, 1.0, None),
+    option('pinchAngleThreshold', float, 30, None),
+    option('parallelAngleThreshold', float, 30, None),
+    option('directionAngleThreshold', float, 15, None),
+    option('zoomModeCtrlPlusMinus', bool, True, None),
+    option('enableHorizontalScroll', bool, True, None),
+    option('threeFingerSwipe', bool, True, None),
+    option('fourFingerSwipe', bool, True, None),
+    option('pinchToZoomClicksFormula', str, '1', None),
+    option('scrollAmountFormula', str, 'l / 10', None),
+    option('horScrollAmountFormula', str, 'l / 15', None),
+    option('moveGestureFormula', str, 'l / 10', None),
+    # panel and screen
+    option('devW', 'length', '16cm', None),
+    option('devH', 'length', '9cm', None),
+    option('monitor', int, 0, None),
+    option('rotation', int, 0, (0, 90, 180, 270)),
+    option('mirrorX', bool, False, None),
+    option('mirrorY', bool, False, None),
+    option('calibrationPoints', str, '', None),
+    option('filter', bool, True, None),
+    option('filterMinCutoff', float, 1.0, None),
+    option('filterBeta', float, 0.01, None),
+    option('filterDCutoff', float, 1.0, None),
+    # daemon
+    option('idleTimeout', float, 1.0, None),
+    option('eventPoolSize', int, 64, None),
+    option('queueSize', int, 64, None),
+    option('overflowPolicy', str, 'block', ('block', 'dropMoves')),
+    option('coalesceMoves', bool, True, None),
+    option('slotIdleTimeout', float, 30.0, None),
+    option('latencyStats', bool, True, None),
+    option('gcThresholds', str, '', None),
+    option('gcFreeze', bool, True, None),
+    option('gcIdleCollect', bool, True, None),
+    option('gcIdleOnly', bool, False, None),
+)
+# formula option -> (compiled function, variables it may use)
+FORMULAS = {
+    'pinchToZoomClicksFormula': ('pinchToZoomClicks', ('k', 'p', 'd1', 'd2')),
+    'scrollAmountFormula': ('scrollAmount', ('l',)),
+    'horScrollAmountFormula': ('horScrollAmount', ('l',)),
+    'moveGestureFormula': ('moveGesture', ('l',)),
+}
+# values computed from the options, see settings.compile and settings.derive
+DERIVED = tuple(f for f, v in FORMULAS.values()) + ('ppmm', 'dragDistPx', 'dragDistSq')
+
+INDEX = {o.name: i for i, o in enumerate(SCHEMA)}  # option name -> field index
+# options that are only read at startup, a reload keeps their values (see settings.reloaded)
+RESTART = ('debug', 'outputMode', 'monitor', 'idleTimeout', 'eventPoolSize', 'queueSize', 'overflowPolicy',
+    'coalesceMoves', 'latencyStats', 'gcThresholds', 'gcFreeze', 'gcIdleCollect', 'gcIdleOnly')
+UNITS = ('', 'px', 'PX', 'mm', 'cm', 'in')
+missing = object()
+
+
+def convert(o, value):
+    '''convert(o, value)
+    Returns value as the type of the option o. Raises ValueError if it cannot
+    be converted or is not allowed.
+    '''
+    if value is None or value == '':
+        return o.default
+    if o.type == 'length':
+        v = value if isinstance(value, (int, float)) else str(value).strip()
+        if isinstance(v, str):
+            m = LENGTH.fullmatch(v)
+            if not m or m.group('unit') not in UNITS:
+                raise ValueError('%s: %r is not a valid length' % (o.name, value))
+    elif o.type is float:
+        v = get(value, (int, float), missing)
+        v = missing if v is missing else float(v)
+    elif o.type is str:
+        v = value if isinstance(value, str) else str(value)
+    else:
+        v = get(value, o.type, missing)
+    if v is missing:
+        raise ValueError('%s: %r is not a valid %s' % (o.name, value, o.type.__name__))
+    if o.choices is not None and v not in o.choices:
+        raise ValueError('%s must be one of %r, not %r' % (o.name, o.choices, v))
+    return v
+
+
+class settings(namedtuple('settingsBase', [o.name for o in SCHEMA] + list(DERIVED))):
+    '''class settings(namedtuple)
+    An immutable snapshot of all options with their final types, compiled
+    once from a Configuration (and again on reload). The gesture code reads
+    plain attributes, e.g. settings.dragDistSq.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, options, calibration=None):
+        '''settings.compile(options, calibration=None)
+        Validates and converts all options of a Configuration (or dict).
+            - calibration: the panelCalibration for the derived pixel values
+        Raises ValueError for invalid options.
+        '''
+        values = []
+        for o in SCHEMA:
+            values.append(convert(o, options.get(o.name, None)))
+        for name in ('filterMinCutoff', 'filterDCutoff'):
+            if values[INDEX[name]] <= 0:
+                raise ValueError('%s must be positive, not %r' % (name, values[INDEX[name]]))
+        if values[INDEX['slotIdleTimeout']] < 0:
+            raise ValueError('slotIdleTimeout must not be negative, not %r' % values[INDEX['slotIdleTimeout']])
+        for name, (f, variables) in FORMULAS.items():
+            try:
+                values.append(compileFormula(values[INDEX[name]], variables))
+            except ValueError as err:
+                raise ValueError('%s: %s' % (name, err))
+        return cls(*values, *(None,) * (len(DERIVED) - len(FORMULAS))).derive(calibration)
+
+    def derive(self, calibration):
+        '''derive(calibration)
+        Returns a copy with the values that depend on the panel calibration
+        (None without a calibration if they need one).
+        '''
+        if calibration is not None:
+            dragDist = calibration.pixels(self.dragDist)
+            return self._replace(ppmm=calibration.ppmm, dragDistPx=dragDist, dragDistSq=dragDist * dragDist)
+        if isinstance(self.dragDist, str) and LENGTH.fullmatch(self.dragDist).group('unit') not in UNITS[:3]:
+            # physical units need the ppmm of a device
+            return self._replace(ppmm=None, dragDistPx=None, dragDistSq=None)
+        dragDist = pixels(self.dragDist, None)
+        return self._replace(ppmm=None, dragDistPx=dragDist, dragDistSq=dragDist * dragDist)
+
+    def changes(self, other):
+        '''changes(other)
+        Returns the names of the options that differ from the snapshot other.
+        '''
+        return [o.name for i, o in enumerate(SCHEMA) if self[i] != other[i]]
+
+    def reloaded(self, active):
+        '''reloaded(active)
+        Returns (snapshot, restart): a copy with the RESTART options of the
+        active snapshot and the names of those that would need a restart.
+        '''
+        restart = [name for name in RESTART if self.get(name) != active.get(name)]
+        return self._replace(**{name: active.get(name) for name in RESTART}), restart
+
+    def get(self, name, fallback=None):
+        # O(1) lookup by name, like Configuration.get
+        i = INDEX.get(name)
+        return fallback if i is None else self[i]
@@ -0,0 +1,81 @@
+import os
+from time import monotonic, clock_gettime
+
+try:
+    from time import CLOCK_BOOTTIME
+except ImportError:
+    CLOCK_BOOTTIME = None
+
+
+def sinceBoot():
+    # seconds since boot (None if the platform has no CLOCK_BOOTTIME)
+    return None if CLOCK_BOOTTIME is None else clock_gettime(CLOCK_BOOTTIME)
+
+def processStarted():
+    '''processStarted()
+    Returns the seconds since boot when this process was started (None if
+    /proc is not available).
+    '''
+    try:
+        with open('/proc/self/stat') as f:
+            stat = f.read()
+        # the command name may contain spaces, starttime is field 22 (the 20th after it)
+        ticks = int(stat.rpartition(')')[2].split()[19])
+        return ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class startupReport(object):
+    '''class startupReport(object)
+    The duration of every phase of the daemon startup, from the start of the
+    interpreter up to the first frame.
+    '''
+    def __init__(self):
+        self.phases = []
+        self.created = self.last = monotonic()
+        self.boot = sinceBoot()  # seconds since boot at the creation
+        self.ready = None  # seconds since boot when the main loop started
+        self.first = None  # seconds from the start of the main loop to the first frame
+        started = processStarted()
+        if started is not None and self.boot is not None:
+            # the interpreter, up to the first line of touchd.py
+            self.phases.append(('python', max(self.boot - started, 0.0)))
+
+    def phase(self, name):
+        '''phase(name)
+        Ends the phase name, it started when the previous one ended.
+        '''
+        t = monotonic()
+        self.phases.append((name, t - self.last))
+        self.last = t
+
+    def started(self):
+        # the main loop is set up, ends the last phase
+        self.phase('loop')
+        if self.boot is not None:
+            self.ready = self.boot + self.last - self.created
+
+    def firstFrame(self):
+        self.first = monotonic() - self.last
+
+    def summary(self):
+        # the phases in milliseconds, see format
+        s = {name: t * 1e3 for name, t in self.phases}
+        s['total'] = sum(t for name, t in self.phases) * 1e3
+        if self.ready is not None:
+            s['sinceBoot'] = self.ready * 1e3
+        if self.first is not None:
+            s['firstFrame'] = self.first * 1e3
+        return s
+
+    def format(self):
+        lines = ['startup (milliseconds)']
+        for name, t in self.phases:
+            lines.append('    %-10s %9.1f' % (name, t * 1e3))
+        lines.append('    %-10s %9.1f' % ('total', sum(t for name, t in self.phases) * 1e3))
+        if self.ready is not None:
+            lines.append('    ready %.2f s after boot' % self.ready)
+        if self.first is not None:
+            lines.append('    first frame %.1f ms after the start of the main loop' % (self.first * 1e3))
+        return '\n'.join(lines)
@@ -0,0 +1,94 @@
+import heapq
+from itertools import count
+from time import monotonic
+
+debug = False
+
+
+class deadlineScheduler(object):
+    '''class deadlineScheduler(object)
+    A heap of deadlines. The main loop polls with timeout() and calls
+    runDue(), so callbacks fire at their due time independent of the input.
+    '''
+    def __init__(self, clock=monotonic):
+        '''deadlineScheduler(clock=monotonic)
+        Inititalises the scheduler with:
+            - clock: returns the current time in seconds
+        '''
+        self.clock = clock
+        self.heap = []  # [due, seq, callback], callback is None if cancelled or fired
+        self.seq = count()
+        self.onChange = None  # called if a new timer is due before all others
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.slop = 0.0  # sum of the delays between due time and callback
+        self.maxSlop = 0.0
+
+    def at(self, due, callback):
+        '''at(due, callback)
+        Calls callback() at the clock time due, returns a handle for cancel().
+        '''
+        timer = [due, next(self.seq), callback]
+        heapq.heappush(self.heap, timer)
+        self.scheduled += 1
+        if self.heap[0] is timer and self.onChange is not None:
+            self.onChange()
+        return timer
+
+    def after(self, delay, callback):
+        return self.at(self.clock() + delay, callback)
+
+    def cancel(self, timer):
+        if timer is not None and timer[2] is not None:
+            timer[2] = None
+            self.cancelled += 1
+
+    def next(self):
+        '''next()
+        Returns the due time of the next timer or None.
+        '''
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def timeout(self):
+        '''timeout()
+        Returns the seconds until the next timer is due (0 if it is overdue)
+        or None if there is none, e.g. for poll().
+        '''
+        due = self.next()
+        if due is None:
+            return None
+        return max(0.0, due - self.clock())
+
+    def runDue(self):
+        '''runDue()
+        Calls all callbacks that are due and returns how many were called.
+        '''
+        heap = self.heap
+        n = 0
+        while heap and heap[0][0] <= self.clock():
+            timer = heapq.heappop(heap)
+            callback = timer[2]
+            if callback is None:
+                continue
+            timer[2] = None
+            slop = self.clock() - timer[0]
+            self.slop += slop
+            if slop > self.maxSlop:
+                self.maxSlop = slop
+            self.fired += 1
+            n += 1
+            callback()
+        return n
+
+    def counters(self):
+        return {
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'meanSlop': self.slop / self.fired if self.fired else 0.0,
+            'maxSlop': self.maxSlop
+        }
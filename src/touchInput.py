@@ -1,101 +1,495 @@
-from .touchIntermediate import touchEvt
+import os
+import struct
+from array import array
+from time import monotonic_ns
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .touchIntermediate import touchEvt, eventPool, typecode
 
 byteorder = 'big'
 
 # TODO options integration
-bpc = None
-coordmode = None
-numPoints = None
 allowZeroLine = True
 minPoints = 5
 maxPoints = 8
-debug = True
+debug = False
+batchMin = 32  # decode at least this many buffered frames at once with numpy (below, struct is faster)
+
+# activeFlags byte -> active state of the touch points (only the first 8 can be flagged)
+ACTIVE = tuple(tuple(bool(flags & 1 << x) for x in range(16)) for flags in range(256))
+CTYPES = {1: 'B', 2: 'H', 4: 'I'}
+
+
+def allocEvent():
+    # an uninitialised event, see touchEvt.fill
+    return touchEvt.__new__(touchEvt)
+
+
+class lockedDecoder(object):
+    '''class lockedDecoder(object)
+    Decodes frames with a known, fixed layout:
+        aa <press> <x> <y> bb <activeFlags> (<y> <x>) * (numPoints - 1) cc <pad>
+    '''
+    def __init__(self, bpc, coordmode, numPoints, screen=None, newEvent=None, transform=None):
+        '''lockedDecoder(bpc, coordmode, numPoints, screen=None, newEvent=None, transform=None)
+        newEvent returns an event to fill (e.g. eventPool.acquire).
+        transform maps the raw coordinates to screen pixels (see calibration).
+        Raises ValueError if there is no struct format for bpc.
+        '''
+        global byteorder
+        if bpc not in CTYPES:
+            raise ValueError('cannot lock layout with bpc=%r' % bpc)
+        c = CTYPES[bpc]
+        self.bpc = bpc
+        self.coordmode = coordmode
+        self.numPoints = numPoints
+        self.screen = screen
+        self.newEvent = newEvent or allocEvent
+        self.transform = transform
+        self.struct = struct.Struct('%sBB%sBB%sB' % ('><'[byteorder == 'little'], c * 2, c * 2 * (numPoints - 1)))
+        self.size = self.struct.size  # frame up to and including cc, see Len
+        self.step = self.size + 1  # offset of the next frame
+        self.active = tuple(ACTIVE[flags][:numPoints] for flags in range(256))
+        self.typecode = typecode(bpc)
+        # struct fields -> x0, y0, x1, y1, ... (all but the first point are sent as y, x)
+        order = [2, 3]
+        for i in range(numPoints - 1):
+            order += [7 + 2 * i, 6 + 2 * i]
+        self.order = itemgetter(*order)
+        self.dtype = None
+        if np is not None:
+            e = '><'[byteorder == 'little'] + 'u%d' % bpc
+            self.dtype = np.dtype([
+                ('aa', 'u1'), ('press', 'u1'), ('first', e, (2,)),
+                ('bb', 'u1'), ('flags', 'u1'), ('points', e, (numPoints - 1, 2)),
+                ('cc', 'u1'), ('pad', 'u1')
+            ])
+
+    def decode(self, buffer, pos, end):
+        '''decode(buffer, pos, end)
+        Returns (event, pos) for the frame at buffer[pos] or None if the data
+        does not match the layout (zero line, garbage, incomplete frame).
+        '''
+        if end - pos < self.size:
+            return None
+        v = self.struct.unpack_from(buffer, pos)
+        if v[0] != 0xaa or v[4] != 0xbb or v[-1] != 0xcc:
+            return None
+        t = self.transform
+        if t is None:
+            return self.newEvent().fill(self.coordmode, self.bpc, bool(v[1]), self.active[v[5]],
+                array(self.typecode, self.order(v)), self.screen), pos + self.step
+        return self.newEvent().fill(True, 2, bool(v[1]), self.active[v[5]],
+            array('H', t(self.order(v))), self.screen), pos + self.step
+
+    def decodeBatch(self, buffer, pos, end):
+        '''decodeBatch(buffer, pos, end)
+        Decodes all complete frames in buffer[pos:end] in one call (numpy only).
+        Returns (press, active, coords, pos) with the shapes (N,), (N, numPoints)
+        and (N, numPoints, 2). Decoding stops at the first frame that does not
+        match the layout.
+        '''
+        n = (end - pos) // self.step
+        frames = np.frombuffer(buffer, self.dtype, n, pos)
+        bad = np.flatnonzero((frames['aa'] != 0xaa) | (frames['bb'] != 0xbb) | (frames['cc'] != 0xcc))
+        if bad.size:
+            frames = frames[:bad[0]]
+            n = len(frames)
+        coords = np.empty((n, self.numPoints, 2), dtype=np.dtype(self.typecode))
+        coords[:, 0] = frames['first']
+        coords[:, 1:] = frames['points'][:, :, ::-1]
+        active = np.unpackbits(frames['flags'][:, None], axis=1, bitorder='little')[:, :self.numPoints]
+        if self.numPoints > 8:
+            active = np.pad(active, ((0, 0), (0, self.numPoints - 8)))
+        if self.transform is not None:
+            coords = self.transform.applyArray(coords)
+        return frames['press'] != 0, active.astype(bool), coords, pos + n * self.step
+
+    def decodeAll(self, buffer, pos, end):
+        '''decodeAll(buffer, pos, end)
+        Returns (events, pos) for all consecutive frames matching the layout.
+        '''
+        global batchMin
+        events = []
+        if self.dtype is not None and (end - pos) // self.step >= batchMin:
+            press, active, coords, pos = self.decodeBatch(buffer, pos, end)
+            if self.transform is None:
+                absmode, bpc = self.coordmode, self.bpc
+            else:
+                absmode, bpc = True, 2
+            for p, a, c in zip(press.tolist(), active.tolist(), coords):
+                events.append(self.newEvent().fill(absmode, bpc, p, tuple(a),
+                    array(self.typecode, c.tobytes()), self.screen))
+        while True:
+            decoded = self.decode(buffer, pos, end)
+            if decoded is None:
+                return events, pos
+            event, pos = decoded
+            events.append(event)
+
 
 
-def readCoord(buffer, ctr, bpc, invert=True):
+def readCoord(view, ctr, bpc, invert=True):
     global byteorder
-    a = int.from_bytes(b''.join(buffer[ctr:ctr + bpc]), byteorder)
+    a = int.from_bytes(view[ctr:ctr + bpc], byteorder)
     ctr += bpc
-    b = int.from_bytes(b''.join(buffer[ctr:ctr + bpc]), byteorder)
+    b = int.from_bytes(view[ctr:ctr + bpc], byteorder)
     ctr += bpc
     return (a, b)[::1 - 2 * invert], ctr
 
-def getEvent(buffer):
-    global bpc, coordmode, numPoints, allowZeroLine
-    global minPoints, maxPoints
-    global debug
-    global byteorder
 
-    s = ''.join(chr(int.from_bytes(x, byteorder)) for x in buffer)
-    coords = []
-    tmp = 0
-    event = None
-
-    start = s.index(chr(0xaa))
-    tmp = start + 1
-    pressflag = bool(int.from_bytes(buffer[tmp], byteorder))
-    tmp += 1
-
-    mid = s.index(chr(0xbb), start + 4)
-    if bpc is None:
-        if (mid - start - 2) % 2 == 1:
-            return False, None, None, buffer
-        bpc = (mid - start - 2) // 2
-        if debug:
-            print('Set bpc to %d' % bpc)
-    if coordmode is None:
-        coordmode = bpc is 2
-        if debug:
-            print('Set absmode to %s' % coordmode)
-   
-    pt, tmp = readCoord(buffer, tmp, bpc, False)
-    coords.append(pt)
-
-    if tmp is not mid and buffer[tmp].hex() != 'bb':
-        print('tmp != mid', b''.join(buffer).hex())
-        return False, None, None, buffer
-    tmp += 1
-
-    activeFlags = int.from_bytes(buffer[tmp], byteorder)
-    active = [bool(activeFlags & 2 ** x) for x in range(8)]
-    tmp += 1
-
-    checkForZero = False
-    if numPoints is None:
-        i = 1
-        while i <= maxPoints:
-            if buffer[tmp] == b'\xcc':
+class touchDecoder(object):
+    '''class touchDecoder(object)
+    The format detection and decoder state of one touch device.
+    '''
+    def __init__(self, allowZeroLine=True, minPoints=5, maxPoints=8, screen=None, poolSize=0, calibration=None):
+        '''touchDecoder(allowZeroLine=True, minPoints=5, maxPoints=8, screen=None, poolSize=0, calibration=None)
+        Inititalises the decoder with:
+            - allowZeroLine: allow aa 00 00 .. bb 00 00 .. with 00 instead of cc
+            - minPoints, maxPoints: how many touch points a frame may have
+            - screen: the screenGeometry the device maps to
+            - poolSize: size of the eventPool events are taken from (0: none)
+            - calibration: a panelCalibration, if given all events carry the
+              screen pixels (absmode, bpc 2) instead of the raw coordinates
+        '''
+        self.bpc = None
+        self.coordmode = None
+        self.numPoints = None
+        self.locked = None  # lockedDecoder, set as soon as the layout is known
+        self.allowZeroLine = allowZeroLine
+        self.minPoints = minPoints
+        self.maxPoints = maxPoints
+        self.screen = screen
+        self.pool = eventPool(poolSize) if poolSize else None
+        self.newEvent = self.pool.acquire if self.pool else allocEvent
+        self.calibration = calibration
+        self.transform = None
+        self.version = None  # screen geometry version the transform was compiled for
+        self.frames = 0
+        self.zeroLines = 0
+        self.errors = 0
+
+    def counters(self):
+        c = {'frames': self.frames, 'zeroLines': self.zeroLines, 'errors': self.errors}
+        if self.pool is not None:
+            c['pool'] = self.pool.counters()
+        return c
+
+    def calibrate(self):
+        '''calibrate()
+        (Re-)compiles the calibration for the detected layout and the current
+        screen geometry.
+        '''
+        cal = self.calibration
+        self.transform = cal.compile(self.bpc, self.coordmode)
+        self.version = cal.screen.version
+        if self.locked is not None:
+            self.locked.transform = self.transform
+
+    def recalibrate(self, calibration):
+        '''recalibrate(calibration)
+        Sets or replaces the panelCalibration (e.g. after a configuration
+        reload) and its screen, the detected layout is kept.
+        '''
+        self.calibration = calibration
+        self.screen = calibration.screen
+        if self.transform is not None:
+            self.calibrate()
+
+    def getEvent(self, buffer, pos=0, end=None):
+        '''getEvent(buffer, pos=0, end=None)
+        Decodes the first frame found in buffer[pos:end] without copying it.
+            - buffer: a bytes or bytearray object (e.g. the preallocated read buffer)
+            - pos, end: the part of the buffer that holds unconsumed data
+        Returns (success, event, Len, pos) where pos is the offset of the next
+        possible frame in buffer.
+        '''
+        global debug
+
+        if end is None:
+            end = len(buffer)
+        if self.locked is not None:
+            decoded = self.locked.decode(buffer, pos, end)
+            if decoded is not None:
+                self.frames += 1
+                return (True, decoded[0], self.locked.size, decoded[1])
+        view = memoryview(buffer)
+        coords = []
+        tmp = 0
+        event = None
+
+        start = buffer.index(b'\xaa', pos, end)
+        tmp = start + 1
+        pressflag = bool(view[tmp])
+        tmp += 1
+
+        mid = buffer.index(b'\xbb', start + 4, end)
+        if self.bpc is None:
+            if (mid - start - 2) % 2 == 1:
+                self.errors += 1
+                return False, None, None, pos
+            self.bpc = (mid - start - 2) // 2
+            if debug:
+                print('Set bpc to %d' % self.bpc)
+        if self.coordmode is None:
+            self.coordmode = self.bpc == 2
+            if debug:
+                print('Set absmode to %s' % self.coordmode)
+        if self.calibration is not None and self.transform is None:
+            self.calibrate()
+        bpc = self.bpc
+        numPoints = self.numPoints
+
+        pt, tmp = readCoord(view, tmp, bpc, False)
+        coords.append(pt)
+
+        if tmp != mid and view[tmp] != 0xbb:
+            print('tmp != mid', view[pos:end].hex())
+            self.errors += 1
+            return False, None, None, pos
+        tmp += 1
+
+        activeFlags = view[tmp]
+        active = ACTIVE[activeFlags]
+        tmp += 1
+
+        checkForZero = False
+        if numPoints is None:
+            i = 1
+            while i <= self.maxPoints:
+                if view[tmp] == 0xcc:
+                    if debug:
+                        print('Set numPoints to %d' % i)
+                    numPoints = self.numPoints = i
+                    break
+                i += 1
+                pt, tmp = readCoord(view, tmp, bpc)
+                coords.append(pt)
+        else:
+            for i in range(numPoints - 1):
+                pt, tmp = readCoord(view, tmp, bpc)
+                coords.append(pt)
+            if not view[tmp] == 0xcc:
+                checkForZero = True
+
+        tmp += 2  # start of next possible event
+        if checkForZero:
+            # as long as a frame: flags, points, cc and the pad byte are 00
+            ref = 'aa' + '00' * (2 * bpc + 1) + 'bb' + '00' * (2 * bpc * (numPoints - 1) + 3)
+        if checkForZero and not self.allowZeroLine:
+            self.errors += 1
+            return False, None, None, pos
+        elif checkForZero and self.allowZeroLine:
+            if view[start:tmp].hex() == ref:
+                # okay:
+                self.zeroLines += 1
+                absmode, zbpc = (self.coordmode, bpc) if self.transform is None else (True, 2)
+                event = self.newEvent().fill(absmode, zbpc, False,
+                        (False,) * numPoints, array(typecode(zbpc), [0]) * (2 * numPoints), self.screen)
+            else:
+                print(view[start:tmp].hex())
+                print(ref)
+        else:
+            if len(active[:numPoints]) != len(coords):
+                print('ERROR:\n active=%r\ncoords=%r' % (active[:numPoints], coords))
+            self.frames += 1
+            coords = [c for pt in coords for c in pt]
+            if self.transform is None:
+                event = self.newEvent().fill(self.coordmode, bpc, pressflag, active[:numPoints],
+                    array(typecode(bpc), coords), self.screen)
+            else:
+                event = self.newEvent().fill(True, 2, pressflag, active[:numPoints],
+                    array('H', self.transform(coords)), self.screen)
+
+        if self.locked is None and numPoints is not None:
+            try:
+                self.locked = lockedDecoder(bpc, self.coordmode, numPoints, self.screen, self.newEvent, self.transform)
                 if debug:
-                    print('Set numPoints to %d' % i)
-                numPoints = i
-                break
-            i += 1
-            pt, tmp = readCoord(buffer, tmp, bpc)
-            coords.append(pt)
-    else:
-        for i in range(numPoints - 1):
-            pt, tmp = readCoord(buffer, tmp, bpc)
-            coords.append(pt)
-        if not buffer[tmp] == b'\xcc':
-            checkForZero = True
-
-    tmp += 2  # start of next possible event
-    if checkForZero:
-        ref = 'aa' + '00' * (2 * bpc + 1) + 'bb' + '00' * (2 * bpc * (numPoints - 1) + 2)
-    if checkForZero and not allowZeroLine:
-        return False, None, None, buffer
-    elif checkForZero and allowZeroLine:
-        if b''.join(buffer[start:tmp]).hex() == ref:
-            # okay:
-            event = touchEvt(coordmode, bpc, False,
-                    [False for x in range(numPoints)], [(0, 0) for x in range(numPoints)])
+                    print('Locked frame layout: %d bytes' % self.locked.size)
+            except ValueError as err:
+                if debug:
+                    print(err)
+        return True, event, tmp - start - 1, tmp
+
+    def getEvents(self, buffer, pos=0, end=None):
+        '''getEvents(buffer, pos=0, end=None)
+        Like getEvent, but decodes all complete frames in buffer[pos:end].
+        Returns (success, events, Len, pos).
+        '''
+        if end is None:
+            end = len(buffer)
+        events = []
+        Len = None
+        if self.transform is not None and self.version != self.calibration.screen.version:
+            self.calibrate()
+        while True:
+            if self.locked is not None:
+                decoded, pos = self.locked.decodeAll(buffer, pos, end)
+                self.frames += len(decoded)
+                events.extend(decoded)
+                Len = self.locked.size
+            if end - pos < (Len or 1) or buffer.find(b'\xcc', pos, end) < 0:
+                return True, events, Len, pos
+            success, event, Len, pos = self.getEvent(buffer, pos, end)
+            if not success:
+                return False, events, Len, pos
+            if event is not None:
+                events.append(event)
+
+
+# the decoder used by the module level functions
+decoder = touchDecoder(allowZeroLine, minPoints, maxPoints)
+
+def getEvent(buffer, pos=0, end=None):
+    return decoder.getEvent(buffer, pos, end)
+
+def getEvents(buffer, pos=0, end=None):
+    return decoder.getEvents(buffer, pos, end)
+
+
+class frameBuffer(object):
+    '''class frameBuffer(object)
+    A preallocated buffer that raw reports are fed into and decoded from
+    without copying.
+    '''
+    def __init__(self, callback, bufferSize=16384, maxReport=4096, decoder=None, coalescer=None):
+        '''frameBuffer(callback, bufferSize=16384, maxReport=4096, decoder=None, coalescer=None)
+        Inititalises the buffer with:
+            - callback: called with every decoded touchEvt
+            - decoder: the touchDecoder (a new one if None)
+            - coalescer: a moveCoalescer that drops stale moves if several
+              frames were pending (None: every frame is handled)
+        Set latency to a latencyMonitor to stamp the events with the time
+        of the last read (received) and of the decoding (decoded).
+            - bufferSize: size of the preallocated buffer
+            - maxReport: free space offered to every read (hidraw truncates
+              reports that do not fit into the buffer)
+        '''
+        assert bufferSize >= 2 * maxReport, 'bufferSize must be at least 2 * maxReport'
+        self.callback = callback
+        self.decoder = touchDecoder(allowZeroLine, minPoints, maxPoints) if decoder is None else decoder
+        self.coalescer = coalescer
+        self.latency = None
+        self.received = None  # monotonic_ns of the last read
+        self.buffer = bytearray(bufferSize)
+        self.view = memoryview(self.buffer)
+        self.maxReport = maxReport
+        self.fill, self.pos = 0, 0  # buffer[pos:fill] holds the data not yet decoded
+        self.Len = None
+        self.bytes = 0
+        self.discarded = 0
+
+    def counters(self):
+        c = self.decoder.counters()
+        c.update(bytes=self.bytes, discarded=self.discarded)
+        if self.coalescer is not None:
+            c['coalesced'] = self.coalescer.counters()
+        return c
+
+    def compact(self):
+        if len(self.buffer) - self.fill >= self.maxReport:
+            return
+        if self.pos == 0:
+            if debug:
+                print('discarding %d undecodable bytes' % self.fill)
+            self.discarded += self.fill
+            self.fill = 0
         else:
-            print(b''.join(buffer[start:tmp]).hex())
-            print(ref)
-    else:
-        if len(active[:numPoints]) != len(coords):
-            print('ERROR:\n active=%r\ncoords=%r' % (active[:numPoints], coords))
-        event = touchEvt(coordmode, bpc, pressflag, active[:numPoints], coords)
-    
-    buffer = buffer[tmp:]
-    return True, event, tmp - start - 1, buffer
+            # only the tail of an incomplete frame is moved
+            self.view[:self.fill - self.pos] = self.view[self.pos:self.fill]
+            self.fill, self.pos = self.fill - self.pos, 0
+
+    def feed(self, data):
+        '''feed(data)
+        Appends data (at most maxReport bytes) to the buffer.
+        '''
+        self.compact()
+        self.view[self.fill:self.fill + len(data)] = data
+        self.fill += len(data)
+        self.bytes += len(data)
+
+    def decode(self):
+        '''decode()
+        Decodes all complete frames and passes them to the callback.
+        Returns False if a frame could not be decoded after the layout was
+        detected.
+        '''
+        known = self.Len is not None
+        success, events, Len, self.pos = self.decoder.getEvents(self.buffer, self.pos, self.fill)
+        if Len is not None:
+            if not known and debug:
+                print('Set Len to %d' % Len)
+            self.Len = Len
+        if self.coalescer is not None:
+            events = self.coalescer.coalesce(events)
+        if self.latency is not None and events and self.received is not None:
+            received, decoded = self.received, monotonic_ns()
+            for event in events:
+                event.received = received
+                event.decoded = decoded
+        for event in events:
+            self.callback(event)
+        if self.pos >= self.fill:
+            self.fill, self.pos = 0, 0
+        return success or not known
+
+
+class hidrawReader(frameBuffer):
+    '''class hidrawReader(frameBuffer)
+    Reads whole reports from a non-blocking hidraw node into the buffer.
+    '''
+    def __init__(self, path, callback, bufferSize=16384, maxReport=4096, decoder=None, coalescer=None):
+        '''hidrawReader(path, callback, bufferSize=16384, maxReport=4096, decoder=None, coalescer=None)
+        Opens path, see frameBuffer for the other arguments.
+        '''
+        frameBuffer.__init__(self, callback, bufferSize, maxReport, decoder, coalescer)
+        self.path = path
+        self.reads = 0
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+        self.file = open(self.fd, 'rb', buffering=0)
+
+    def readPending(self):
+        '''readPending()
+        Reads pending reports until the device has no more data (returns
+        False) or the buffer is full (returns True).
+        '''
+        self.compact()
+        while len(self.buffer) - self.fill >= self.maxReport:
+            # hidraw hands over a whole report per read
+            n = self.file.readinto(self.view[self.fill:])
+            if n is None:
+                return False
+            elif n == 0:
+                raise EOFError('%r was closed' % self.path)
+            self.fill += n
+            self.bytes += n
+            self.reads += 1
+            if self.latency is not None:
+                self.received = monotonic_ns()
+        return True
+
+    def counters(self):
+        c = frameBuffer.counters(self)
+        c['reads'] = self.reads
+        return c
+
+    def read(self, fd=None):
+        '''read(fd=None)
+        Reads all pending reports and handles the decoded events.
+        Returns False if a frame could not be decoded after the layout was
+        detected.
+        '''
+        more = True
+        while more:
+            more = self.readPending()
+            if not self.decode():
+                return False
+        return True
+
+    def close(self):
+        self.file.close()
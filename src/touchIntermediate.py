@@ -1,29 +1,42 @@
+import sys
+from array import array
+from itertools import compress
 from time import time as now
 
-import screeninfo
+from . import geometry
+
+def typecode(bpc):
+    # the smallest array type holding coordinates of bpc bytes
+    return 'H' if bpc <= 2 else 'L'
+
 
 class touchEvt(object):
     '''class touchEvt(object)
     A class describing touch events
     '''
-    def __init__(self, absmode: bool, bpc, press: bool, aIDs: list, coordinates: list):
-        '''touchEvt(absmode: bool, bpc, press: bool, aIDs: list, coordinates:list)
+    __slots__ = ('time', 'bpc', 'absmode', 'pressed', 'aIDs', 'coords', 'screen', 'absCache', 'relCache',
+        'received', 'decoded')
+
+    def __init__(self, absmode: bool, bpc, press: bool, aIDs: list, coordinates: list, screen=None):
+        '''touchEvt(absmode: bool, bpc, press: bool, aIDs: list, coordinates:list, screen=None)
         Inititalises the class object with:
             - absmode: False for percentage, True for absolute mode
             - bpc: bytes per co-ordinate (normally 1 or 2)
             - press: whether the screen was touched or released
             - aIDs: a list of bools representing how many touches were registered
             - coordinates: a list of tuples (x, y) of bytes objects.
+            - screen: the screenGeometry of the device (default: first monitor)
+        The arguments are validated, see touchEvt.trusted for the decoder.
         '''
         assert isinstance(absmode, bool), 'absmode must be a boolean value, not %s' % type(absmode)
         assert isinstance(bpc, int) and bpc > 0, 'bpc must be a positive, non-zero integer, not %r' % bpc
         assert isinstance(press, bool), 'press must be a boolean value, not %s' % type(press)
         assert isinstance(aIDs, list), 'aIDs must be of type list, not %s' % type(aIDs)
         assert isinstance(coordinates, list), 'coordinates must be a list, not %s' % type(coordinates)
-        assert len(aIDs) is len(coordinates), 'len(aIDs) must be len(coordinates): %d != %d' % (len(aIDs), len(coordinates))
+        assert len(aIDs) == len(coordinates), 'len(aIDs) must be len(coordinates): %d != %d' % (len(aIDs), len(coordinates))
         if len(aIDs) > 0:
             assert all(isinstance(x, (bool, int)) for x in aIDs), 'aIDs elements must be int or bool: %r' % aIDs
-            assert all(isinstance(x, tuple) and len(x) is 2 for x in coordinates), 'coordinates elements must be tuples: %r' % coordinates
+            assert all(isinstance(x, tuple) and len(x) == 2 for x in coordinates), 'coordinates elements must be tuples: %r' % coordinates
             assert all(isinstance(y, int) for x in coordinates for y in x), 'coordinates elements must be tuples of type int'
         else:
             raise ValueError('empty input arguments!')
@@ -34,30 +47,71 @@ class touchEvt(object):
         # if not press:
         #     self.aIDs = [False for x in range(len(aIDs))]
         # else:
+        self.aIDs = tuple(bool(x) for x in aIDs)
+        self.coords = array(typecode(bpc), [c for pt in coordinates for c in pt])
+        self.screen = geometry.default() if screen is None else screen
+        self.absCache = None
+        self.relCache = None
+        # monotonic_ns when the frame was read and decoded, see frameBuffer.latency
+        self.received = self.decoded = None
+
+    @classmethod
+    def trusted(cls, absmode, bpc, press, aIDs, coords, screen):
+        '''touchEvt.trusted(absmode, bpc, press, aIDs, coords, screen)
+        Creates an event from data the decoder produced itself, without any
+        validation, see touchEvt.fill.
+        '''
+        return cls.__new__(cls).fill(absmode, bpc, press, aIDs, coords, screen)
+
+    def fill(self, absmode, bpc, press, aIDs, coords, screen):
+        '''fill(absmode, bpc, press, aIDs, coords, screen)
+        (Re-)initialises the event without any validation and returns it:
+            - aIDs: a tuple of bools
+            - coords: a flat array(typecode(bpc)) x0, y0, x1, y1, ...
+            - screen: a screenGeometry (or None for the first monitor)
+        '''
+        self.time = now()
+        self.bpc = bpc
+        self.absmode = absmode
+        self.pressed = press
         self.aIDs = aIDs
-        self.rawCoords = coordinates
+        self.coords = coords
+        self.screen = geometry.default() if screen is None else screen
+        self.absCache = None
+        self.relCache = None
+        # monotonic_ns when the frame was read and decoded, see frameBuffer.latency
+        self.received = self.decoded = None
+        return self
+
+    @property
+    def rawCoords(self):
+        c = self.coords
+        return list(zip(c[::2], c[1::2]))
 
     @property
     def absCoordinates(self):
-        if self.absmode:
-            return [(int(pt[0]), int(pt[1])) for pt in self.rawCoords]
-        else:
-            monitor = screeninfo.get_monitors()[0]
-            width, height = monitor.width, monitor.height
-            return [(int(pt[0]) * width // 255, int(pt[1]) * height // 255) for pt in self.rawCoords]
-    
+        if self.absCache is None:
+            c = self.coords
+            if self.absmode:
+                self.absCache = list(zip(c[::2], c[1::2]))
+            else:
+                width, height = self.screen.width, self.screen.height
+                self.absCache = [(x * width // 255, y * height // 255) for x, y in zip(c[::2], c[1::2])]
+        return self.absCache
+
     @property
     def relCoordinates(self):
-        if self.absmode:
-            monitor = screeninfo.get_monitors()[0]
-            width, height = monitor.width, monitor.height
-            return [(int(pt[0]) / width, int(pt[1]) / height) for pt in self.rawCoords]
-        else:
-            return [(int(pt[0]) / 255, int(pt[1]) / 255) for pt in self.rawCoords]
+        if self.relCache is None:
+            c = self.coords
+            if self.absmode:
+                sx, sy = self.screen.relX, self.screen.relY
+            else:
+                sx, sy = 1 / 255, 1 / 255
+            self.relCache = [(x * sx, y * sy) for x, y in zip(c[::2], c[1::2])]
+        return self.relCache
 
     # @property
     def activeCoordinates(self, absmode):
-        from itertools import compress
         if absmode:
             return list(compress(self.absCoordinates, self.aIDs))
         else:
@@ -74,9 +128,9 @@ class touchEvt(object):
             print(self.absCoordinates)
             print(self.aIDs)
             print(repr(self))
-            print('DICT DUMP:')
-            for k, v in self.__dict__.items():
-                print('  {0!r:<10}: {1!r}'.format(k, v))
+            print('SLOTS DUMP:')
+            for k in self.__slots__:
+                print('  {0!r:<10}: {1!r}'.format(k, getattr(self, k, None)))
             raise e
             return (-1, -1, 0)
 
@@ -94,7 +148,7 @@ class touchEvt(object):
 
     @property
     def details(self):
-        return self.bpc, self.absmode, len(self.rawCoords)
+        return self.bpc, self.absmode, len(self.aIDs)
     
     @property
     def release(self):
@@ -112,3 +166,35 @@ class touchEvt(object):
 
     def absXY(self, id):
         return self.absCoordinates[id]
+
+
+
+class eventPool(object):
+    '''class eventPool(object)
+    A ring of preallocated touchEvt objects for the decoder. An event is only
+    reused if nothing but the ring references it any more (e.g. it is neither
+    held by the output nor buffered), otherwise it is replaced by a new one.
+    '''
+    def __init__(self, size=64):
+        assert size > 0, 'size must be positive, not %r' % size
+        self.ring = [touchEvt.__new__(touchEvt) for x in range(size)]
+        self.index = 0
+        self.free = self.refs(0)
+        self.reused = 0
+        self.allocated = 0
+
+    def refs(self, i):
+        return sys.getrefcount(self.ring[i])
+
+    def acquire(self):
+        i = self.index
+        self.index = (i + 1) % len(self.ring)
+        if self.refs(i) > self.free:
+            self.ring[i] = touchEvt.__new__(touchEvt)
+            self.allocated += 1
+        else:
+            self.reused += 1
+        return self.ring[i]
+
+    def counters(self):
+        return {'size': len(self.ring), 'reused': self.reused, 'allocated': self.allocated}
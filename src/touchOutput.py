@@ -1,352 +1,461 @@
-import re
-from time import time as now
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from time import time as now, monotonic_ns
 
 from evdev import UInput, AbsInfo, ecodes as e
-import screeninfo
 
-from .typehelper import guess, get
-from .touchIntermediate import touchEvt
-from .vectors import vec
+from .vectors import PLUS_X, PLUS_Y, MINUS_X, MINUS_Y
+from .gestures import gestureEngine
+from . import geometry
+from .calibration import panelCalibration, millimeters
+from .settings import settings as settingsSnapshot
+from .filters import filterFor, retune
+from .formula import steps
 debug = False
 
-DBL   = 0b0001
-MULTI = 0b0010
-LONG  = 0b0100
-DRAG  = 0b1000
+# swipe direction -> (modifiers, key) for three and four fingers
+SWIPE_KEYS = {
+    3: {PLUS_X: ((), e.KEY_BACK), MINUS_X: ((), e.KEY_FORWARD),
+        PLUS_Y: ((), e.KEY_PAGEUP), MINUS_Y: ((), e.KEY_PAGEDOWN)},
+    4: {PLUS_X: ((e.KEY_LEFTCTRL, e.KEY_LEFTALT), e.KEY_LEFT), MINUS_X: ((e.KEY_LEFTCTRL, e.KEY_LEFTALT), e.KEY_RIGHT),
+        PLUS_Y: ((e.KEY_LEFTCTRL, e.KEY_LEFTALT), e.KEY_UP), MINUS_Y: ((e.KEY_LEFTCTRL, e.KEY_LEFTALT), e.KEY_DOWN)},
+}
+
+# struct input_event: struct timeval (the kernel sets the time), type, code, value
+INPUT_EVENT = struct.Struct('llHHi')
 
 
 class touchOut(object):
-    def __init__(self, options, amount=8):
+    def __init__(self, options, amount=8, name='pytouchd', screen=None, calibration=None, settings=None,
+          scheduler=None):
+        self.screen = geometry.default() if screen is None else screen
         if not options.hasValue('pixW') or not options.hasValue('pixH'):
-            try:
-                monitor = screeninfo.get_monitors()[0]
-            except NotImplementedError:
-                monitor = screeninfo.Monitor(0, 0, 1920, 1080)
-            options.setv('pixW', monitor.width)
-            options.setv('pixH', monitor.height)
+            options.setv('pixW', self.screen.width)
+            options.setv('pixH', self.screen.height)
         self.opt = options
-        ppmmX, ppmmM, ppmmY = self.ppmm
+        self.calibration = panelCalibration(options, self.screen) if calibration is None else calibration
+        # the options are read from this snapshot in handle()
+        self.settings = settings.derive(self.calibration) if settings is not None else \
+            settingsSnapshot.compile(options, self.calibration)
+        global debug
+        debug = self.settings.debug
+        ppmmX, ppmmY, ppmmM = self.ppmm
         self.opt.setv('ppmmX', ppmmX)
         self.opt.setv('ppmmMean', ppmmM)
         self.opt.setv('ppmmY', ppmmY)
 
-        self.ebuffer = []
-        self.mode = 0b0000
-
-        self.devs = []
-        for i in range(amount):
-            tmp = emulatedDevice(i)
-            tmp.options = self.opt
-            self.devs.append(tmp)
-            self.__dict__['dev%d' % i] = tmp
-        self.dead = None
-        self.lastPress = 0.0
-        self.pressPos1 = vec([0, 0])
-        self.pressPos2 = vec([0, 0])
-        self.lastEvent = touchEvt(True, 1, False, [0 for x in self.devs], [(0, 0) for x in self.devs])
-        self.lastState = [(0, 0, 0) for x in self.devs]
-        self.relMove = vec([0, 0])
-        global debug
-        debug = options.get('debug', False)
+        # a device per touch point, created on demand (see slot) and closed
+        # after slotIdleTimeout seconds without a press (see reclaim); the
+        # first one is used by the gestures and always kept
+        self.name = name
+        self.amount = amount
+        self.slots = [None] * amount
+        self.creating = {}  # touch point -> Future of its device, registered in the background
+        self.pool = None  # the ThreadPoolExecutor registering the devices, created on first use
+        self.used = [0.0] * amount  # clock time of the last press of every slot
+        self.held = []  # slots pressed by the last passed through frame
+        self.devs = []  # the created devices, the first slot first
+        self.allocated = 0
+        self.reclaimed = 0
+        self.dropped = 0  # touch points of frames dropped while their device was registered
+        self.engine = gestureEngine(self, self.settings, scheduler=scheduler)
+        self.scheduler = self.engine.scheduler  # run by the main loop, see eventLoop.addScheduler
+        self.reclaimTimer = None
+        self.register(0, self.newDevice(0))
+        self.lastRelease = True
+        self.filter = None  # created with the first event, see filters.filterFor
+        self.autoFlush = True  # see handle
+        self.latency = None  # a latencyMonitor, see frameBuffer.latency
+
+    def reconfigure(self, options, calibration, settings):
+        '''reconfigure(options, calibration, settings)
+        Takes over a reloaded configuration between two frames. The emulated
+        devices, the gesture state and the timers are kept.
+        '''
+        if not options.hasValue('pixW') or not options.hasValue('pixH'):
+            options.setv('pixW', self.screen.width)
+            options.setv('pixH', self.screen.height)
+        self.opt = options
+        self.calibration = calibration
+        self.settings = self.engine.opt = settings.derive(calibration)
+        ppmmX, ppmmY, ppmmM = self.ppmm
+        self.opt.setv('ppmmX', ppmmX)
+        self.opt.setv('ppmmMean', ppmmM)
+        self.opt.setv('ppmmY', ppmmY)
+        for x in self.devs:
+            x.options = options
+        self.filter = retune(self.filter, self.settings)
 
     @property
     def ppmm(self):
-        w = self.opt['pixW'] / self.millimeters(self.opt['devW'])
-        h = self.opt['pixH'] / self.millimeters(self.opt['devH'])
-        return (w, h, (w + h) / 2)
-        
+        c = self.calibration
+        return (c.ppmmX, c.ppmmY, c.ppmm)
+
     def pixels(self, value):
-        if isinstance(value, str):
-            m = re.fullmatch('(?P<value>\\d+) ?(?P<unit>[a-z]*)', value)
-            if bool(m):
-                d = m.groupdict()
-                v = d.get('value')
-                u = d.get('unit')
-                if u in ['PX', 'px']:
-                    return int(v)
-                elif u == 'cm':
-                    return int(float(v) * self.ppmm[2] * 10)
-                elif u == 'mm':
-                    return int(float(v) * self.ppmm[2] * 25.4)
-                elif u == 'in':
-                    return int(float(v) * self.ppmm[2])
-                else:
-                    raise ValueError('Unknown unit %r' % u)
-            else:
-                raise ValueError('%r cannot be parsed!' % value)
-        else:
-            return value
-    
+        return self.calibration.pixels(value)
+
     def millimeters(self, value):
-        if isinstance(value, str):
-            m = re.fullmatch('(?P<value>[\\d]+[,.]?[\\d]*) ?(?P<unit>[a-z]*)', value)
-            if bool(m):
-                d = m.groupdict()
-                v = d.get('value')
-                u = d.get('unit')
-                if u == 'in':
-                    return float(v) * 25.4
-                elif u == 'cm':
-                    return float(v) * 10
-                elif u == 'mm':
-                    return float(v)
-                else:
-                    raise ValueError('Unknown unit %r' % u)
-            else:
-                raise ValueError('%r cannot be parsed!' % value)
-        else:
-            return value
-    
+        return millimeters(value)
+
     def close(self):
+        self.scheduler.cancel(self.reclaimTimer)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            for future in self.creating.values():
+                if future.exception() is None:
+                    future.result().close()
+            self.creating = {}
         for x in self.devs:
             x.close()
-    
+
+    def newDevice(self, i):
+        screen = self.calibration.screen
+        return emulatedDevice(i, '%s-emutouchdev-%d' % (self.name, i), screen.width - 1, screen.height - 1)
+
+    def register(self, i, dev):
+        # takes over the new device of the touch point i
+        dev.options = self.opt
+        self.slots[i] = dev
+        self.devs.append(dev)
+        self.__dict__['dev%d' % i] = dev
+        self.allocated += 1
+        if i and self.reclaimTimer is None and self.settings.slotIdleTimeout:
+            self.reclaimTimer = self.scheduler.after(self.settings.slotIdleTimeout, self.reclaim)
+        return dev
+
+    def slot(self, i):
+        '''slot(i)
+        Returns the device of the touch point i, or None while it is being
+        registered. UInput waits up to about 2 s until udev set up the node,
+        so the devices (but the first) are registered in the background and
+        must not stall the input.
+        '''
+        dev = self.slots[i]
+        if dev is not None:
+            return dev
+        future = self.creating.get(i)
+        if future is None:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max(1, self.amount - 1))
+            self.creating[i] = self.pool.submit(self.newDevice, i)
+            return None
+        if not future.done():
+            return None
+        del self.creating[i]
+        return self.register(i, future.result())
+
+    def reclaim(self):
+        '''reclaim()
+        Closes the devices of the touch points (except the first) that were
+        not pressed for slotIdleTimeout seconds. Runs as a timer as long as
+        there are any.
+        '''
+        self.reclaimTimer = None
+        timeout = self.settings.slotIdleTimeout
+        if not timeout:
+            return
+        t = self.scheduler.clock()
+        due = None
+        for i in range(1, self.amount):
+            dev = self.slots[i]
+            if dev is None:
+                continue
+            if dev.state[2]:
+                # still pressed (a resting finger may send no frames)
+                d = t + timeout
+            elif t - self.used[i] >= timeout:
+                dev.close()
+                self.slots[i] = None
+                self.devs.remove(dev)
+                del self.__dict__['dev%d' % i]
+                self.reclaimed += 1
+                continue
+            else:
+                d = self.used[i] + timeout
+            if due is None or d < due:
+                due = d
+        if due is not None:
+            self.reclaimTimer = self.scheduler.at(due, self.reclaim)
+
+    def counters(self):
+        return {'devices': len(self.devs), 'allocated': self.allocated, 'reclaimed': self.reclaimed,
+            'creating': len(self.creating), 'dropped': self.dropped}
+
+    def flush(self):
+        for x in self.devs:
+            if x.pending or x.report:
+                x.flush()
+
+    def takePending(self):
+        '''takePending()
+        Returns [(fd, data), ...] with the pending reports of all devices
+        (for a separate writer, see autoFlush).
+        '''
+        return [(x.dev.fd, x.takePending()) for x in self.devs if x.pending or x.report]
+
     def releaseAll(self, quiet=False):
         for x in self.devs:
             x.release(quiet=quiet)
+        self.held = []
+        if self.autoFlush:
+            self.flush()
     
-    def passThrough(self, event, bufferMode=False):
+    def passThrough(self, event):
         global debug
         if debug:
             print('PASSTHROUGH')
-        if not bufferMode and self.ebuffer:
-            if debug:
-                print('BUFFER playback')
-            for e in self.ebuffer:
-                self.passThrough(e, True)
-            self.ebuffer = []
-        for id, state in enumerate(event.getState()):
-            x, y, a = state
-            if a:
-                self.devs[id].move(x, y)
-                self.devs[id].press()
-            else:
-                self.devs[id].release()
+        # only the touch points that are or were pressed, a frame may have
+        # more touch points than devices (amount)
+        aIDs = event.aIDs
+        for i in self.held:
+            if not aIDs[i]:
+                dev = self.slots[i]
+                dev.release()
+                dev.syn()
+        pressed = [i for i, a in enumerate(aIDs[:self.amount]) if a]
+        held = []
+        if pressed:
+            coords = event.absCoordinates
+            t = self.scheduler.clock()
+            for i in pressed:
+                dev = self.slots[i] or self.slot(i)
+                if dev is None:
+                    # dropped until the device of the touch point is registered
+                    self.dropped += 1
+                    continue
+                x, y = coords[i]
+                dev.move(x, y)
+                dev.press()
+                # one report per passed through event
+                dev.syn()
+                self.used[i] = t
+                held.append(i)
+        self.held = held
 
     def handle(self, event):
-        global debug
-        if self.dead is not None:
-            if now() < self.dead + self.opt.get('gestureDeadTime', 0.1):
-                if debug:
-                    print('discarding event %s' % event)
-
-                    return
+        '''handle(event)
+        Processes a touch event and writes the resulting reports with one
+        write per device (unless autoFlush is False).
+        '''
+        self.process(event)
+        if self.autoFlush:
+            if self.latency is not None and event.received is not None:
+                handled = monotonic_ns()
+                self.flush()
+                self.latency.record(event.received, event.decoded, handled)
             else:
-                self.dead = None
+                self.flush()
 
-        if self.lastEvent.release and event.release:
+    def process(self, event):
+        global debug
+        if debug:
+            print(str(now()).ljust(18, '0') + ' tOut: Handling %s' % event)
+        if self.lastRelease and event.release:
             self.releaseAll(quiet=True)
             return
-        state = event.getState()
-        x0, y0, _ = event.getState(0)
-        x1, y1, _ = event.getState(1)
-        ox0, oy0, _ = self.lastEvent.getState(0)
-        ox1, oy1, _ = self.lastEvent.getState(1)
-        print(str(now()).ljust(18, '0') + ' tOut: Handling %s' % event)
-        
-        if self.opt.get('live', vtype=bool):
+        self.lastRelease = event.release
+        if self.settings.filter:
+            # the gestures see the smoothed coordinates
+            self.filter = filterFor(self.filter, event, self.settings)
+            self.filter.apply(event)
+        if self.settings.live:
             self.passThrough(event)
-        elif (event.activeCount is 1 and not self.mode & MULTI) \
-          or (event.activeCount is 0 and self.lastEvent.activeCount is 1):
-            # sglClick event:
-            # NOTE: if one touch point is still active although one or more other points are released, the event
-            # is still a press event but the activeCount has changed. As an indicator, MULTI is used because it is
-            # set when a 2 pt gesture is registered
-            if event.press and not self.lastEvent.press:
-                if debug:
-                    print('raw: press')
-                if event.time - self.lastPress < self.opt.get('dblClickTime') \
-                  and (vec([ox0, oy0]) - vec(self.devs[0].state[:2])).length < self.pixels(self.opt.get('dragDist')):
-                    self.mode ^= DBL
-                    if debug:
-                        print('enh: dblClick started')
-                self.lastPress = event.time
-                self.pressPos1 = vec(event.absXY(0))
-            elif event.release:
+        else:
+            self.engine.handle(event)
+
+    # actions of the gesture recognizers, see gestures.gestureEngine
+
+    def click(self, x=None, y=None, right=False):
+        '''click(x=None, y=None, right=False)
+        Clicks at (x, y) or at the current position if x is None.
+        '''
+        if x is not None:
+            self.devs[0].move(x, y)
+        self.devs[0].press(key=e.BTN_RIGHT if right else e.BTN_MOUSE)
+        self.devs[0].release()
+
+    def dragStart(self, x, y):
+        # press where the finger touched, the (filtered) move follows
+        self.devs[0].move(x, y)
+        self.devs[0].press()
+        self.devs[0].syn()
+
+    def dragEnd(self, x, y):
+        self.devs[0].move(x, y)
+        self.devs[0].release()
+
+    def tap(self, key):
+        self.devs[0].press(key=key)
+        self.devs[0].release()
+
+    def zoom(self, k, nclicks):
+        global debug
+        opt = self.settings
+        if debug:
+            print('enh: clicking ZOOM%s %d times' % (['OUT', 'IN'][k > 1.0], nclicks))
+        if opt.zoomModeCtrlPlusMinus:
+            self.devs[0].press(e.KEY_LEFTCTRL)
+            self.devs[0].press(e.KEY_LEFTCTRL, value=2)
+            if k < 1.0:
+                for click in range(nclicks):
+                    self.tap(e.KEY_SLASH)
+            elif k > 1.0:
+                for click in range(nclicks):
+                    self.tap(e.KEY_RIGHTBRACE)
+            self.devs[0].release(key=e.KEY_LEFTCTRL)
+        else:
+            if k < 1.0:
+                for click in range(nclicks):
+                    self.tap(e.KEY_ZOOMIN)
+            elif k > 1.0:
+                for click in range(nclicks):
+                    self.tap(e.KEY_ZOOMOUT)
+
+    def swipe(self, fingers, d, l):
+        '''swipe(fingers, d, l)
+        Handles a swipe of all fingers in the direction d (see
+        vectors.direction) with the mean length l.
+        '''
+        global debug
+        opt = self.settings
+        if fingers == 2:
+            # Note: inverse! Finger from top to bottom means a ScrollUp
+            if d == PLUS_Y or d == MINUS_Y:
+                nscroll = steps(opt.scrollAmount, l=l)
+                if nscroll is None:
+                    return
                 if debug:
-                    print('raw: release')
-                if bool(self.mode & DRAG) ^ bool(not self.mode & DBL):
-                    if not self.mode & DRAG:
-                        self.pressPos2 = vec(self.lastEvent.absXY(0))
-                        x, y = tuple(round(self.pressPos1 + 0.5 * (self.pressPos2 - self.pressPos1)))
-                        if debug:
-                            print('enh: position interpolated: (%d, %s)' % (x, y))
-                    else:
-                        x, y = self.lastEvent.absXY(0)
-                    self.devs[0].move(x, y)
-                if not self.mode & DRAG:
-                    if self.mode & LONG and self.opt.get('holdForRightClick'):
-                        if debug:
-                            print('enh: long click -> right click')
-                        self.devs[0].press(key=e.BTN_RIGHT)
-                    else:
-                        self.devs[0].press()
-                self.devs[0].release()
-                
-                self.mode = 0b0000
-                self.relMove = vec([0, 0])
-            else:
-                self.relMove += vec([x0 - ox0, y0 - oy0])
-                if not self.mode & DRAG:
-                    if self.relMove.length > self.pixels(self.opt.get('dragDist')):
-                        if debug:
-                            print('enh: entering DRAG mode')
-                        self.mode ^= DRAG
-                        self.passThrough(event)
-                    if not self.mode & DRAG and now() - self.lastPress > self.opt.get('longClickTime'):
-                        if debug:
-                            print('enh: LONG click detected')
-                        self.mode ^= LONG
-                if self.mode & DRAG:
-                    self.passThrough(event)
-                else:
-                    self.ebuffer.append(event)
-        elif (event.activeCount is 1 and self.mode & MULTI) \
-          or (event.release and self.mode & MULTI and self.lastEvent.activeCount is 2):
-            self.pressPos2 = [vec(self.lastEvent.absXY(0)), vec(self.lastEvent.absXY(1))]
-            if debug:
-                print('enh: end 2ptGesture')
-            v1, v2 = self.relMove[0], self.relMove[1]
-            if v1.isNullVector or v2.isNullVector:
+                    print('enh: Scroll%s %d' % (['Down', 'Up'][d == PLUS_Y], nscroll))
+                self.devs[0].scroll(nscroll if d == PLUS_Y else -nscroll)
+            elif opt.enableHorizontalScroll:
+                nscrollh = steps(opt.horScrollAmount, l=l)
+                if nscrollh is None:
+                    return
                 if debug:
-                    print('ERR: Null vector detected!')
-                    print('v1:\n%r\nv2:\n%r' % (v1, v2))
-                    print('|v1|=%f\n|v2|=%f' % (v1.length, v2.length))
+                    print('enh: Scroll%s %d' % (['Right', 'Left'][d == PLUS_X], nscrollh))
+                self.devs[0].scroll(-nscrollh if d == PLUS_X else nscrollh, horizontal=True)
             else:
-                alpha = v1.angle(v2, todegrees=True)
-                if debug:
-                    print('enh: angle between vectors: %d °' % alpha)
-                if abs(alpha - 180) < self.opt.get('pinchAngleThreshold', 30):
-                    # pinch
-                    d1 = (self.pressPos1[0] - self.pressPos1[1]).length
-                    d2 = (self.pressPos2[0] - self.pressPos2[1]).length
-                    k = d2 / d1 
-                    p = k * 100
-                    if debug:
-                        print('enh: pinch detected: %f -> %f (%f %%)' % (d1, d2, p))
-                    nclicks = int(eval(self.opt.get('pinchToZoomClicksFormula', '1', vtype=str)))
-                    if debug:
-                        print('enh: clicking ZOOM%s %d times' % (['OUT', 'IN'][k > 1.0], nclicks))
-                    if self.opt.get('zoomModeCtrlPlusMinus', True):
-                        #
-                        self.devs[0].press(e.KEY_LEFTCTRL)
-                        self.devs[0].press(e.KEY_LEFTCTRL, value=2)
-                        if k < 1.0:
-                            for click in range(nclicks):
-                                self.devs[0].press(key=e.KEY_SLASH)
-                                self.devs[0].release()
-                        elif k > 1.0:
-                            for click in range(nclicks):
-                                self.devs[0].press(key=e.KEY_RIGHTBRACE)
-                                self.devs[0].release()
-                        self.devs[0].release(key=e.KEY_LEFTCTRL)
-                    else:
-                        if k < 1.0:
-                            for click in range(nclicks):
-                                self.devs[0].press(key=e.KEY_ZOOMIN)
-                                self.devs[0].release()
-                        elif k > 1.0:
-                            for click in range(nclicks):
-                                self.devs[0].press(key=e.KEY_ZOOMOUT)
-                                self.devs[0].release()
-                elif alpha < self.opt.get('parallelAngleThreshold', 30):
-                    vm = 0.5 * (v1 + v2)
-                    l = vm.length
-                    nscroll = int(eval(self.opt.get('scrollAmountFormula', 'l / 10')))
-                    nscrollh = int(eval(self.opt.get('horScrollAmountFormula', 'l / 15')))
-                    nmove = int(eval(self.opt.get('moveGestureFormula', 'l / 10')))
-                    if debug:
-                        print('enh: ean movement: %r' % vm)
-
-                    # Note: inverse! Finger from top to bottom means a ScrollUp
-                    beta_up = vm.angle(vec([0, 1]), todegrees=True)
-                    beta_down = vm.angle(vec([0, -1]), todegrees=True)
-                    beta_left = vm.angle(vec([1, 0]), todegrees=True)
-                    beta_right = vm.angle(vec([-1, 0]), todegrees=True)
-
-                    dt = self.opt.get('directionAngleThreshold', 15)  # max angle between gesture mean and axis
-                    if beta_up < dt:
-                        if debug:
-                            print('enh: ScrollUp %d' % nscroll)
-                        self.devs[0].scroll(nscroll)
-                    elif beta_down < dt:
-                        if debug:
-                            print('enh: ScrollDown %d' % nscroll)
-                        self.devs[0].scroll(-nscroll)
-                    elif beta_left < dt:
-                        if self.opt.get('enableHorizontalScroll', True):
-                            if debug:
-                                print('enh: ScrollLeft %d' % nscrollh)
-                            self.devs[0].scroll(-nscrollh, horizontal=True)
-                        else:
-                            if debug:
-                                print('enh: left')
-                            self.devs[0].press(key=e.KEY_LEFT)
-                            self.devs[0].release()
-                    elif beta_right < dt:
-                        if self.opt.get('enableHorizontalScroll', True):
-                            if debug:
-                                print('enh: ScrollRight %d' % nscrollh)
-                            self.devs[0].scroll(nscrollh, horizontal=True)
-                        else:
-                            if debug:
-                                print('enh: right')
-                            self.devs[0].press(key=e.KEY_RIGHT)
-                            self.devs[0].release()
-                    else:
-                        if debug:
-                            print('enh: unhandled diagonal gesture')
-
-            self.relMove = vec([0, 0])
-            self.pressPos1 = vec([0, 0])
-            self.pressPos2 = vec([0, 0])
-            self.mode = 0
-            self.dead = now()
-        elif event.activeCount is 2:
-            if not self.mode & MULTI:
                 if debug:
-                    print('enh: entering 2ptGesture mode')
-                self.ebuffer = []
-                self.mode ^= MULTI
-                self.pressPos1 = [vec(event.absXY(0)), vec(event.absXY(1))]
-                self.relMove = [vec([0, 0]), vec([0, 0])]
-            else:
-                self.relMove[0] += vec([x0 - ox0, y0 - oy0])
-                self.relMove[1] += vec([x1 - ox1, y1 - oy1])
-        else:
+                    print('enh: %s' % ['right', 'left'][d == PLUS_X])
+                self.tap(e.KEY_LEFT if d == PLUS_X else e.KEY_RIGHT)
+        elif (fingers == 3 and opt.threeFingerSwipe) or (fingers == 4 and opt.fourFingerSwipe):
+            modifiers, key = SWIPE_KEYS[fingers][d]
             if debug:
-                print('raw: %d active touch input points' % event.activeCount)
-        self.lastEvent = event
-        self.lastState = state
+                print('enh: %d finger swipe -> %r' % (fingers, (modifiers, key)))
+            for m in modifiers:
+                self.devs[0].press(m)
+            self.tap(key)
+            for m in modifiers[::-1]:
+                self.devs[0].release(key=m)
 
         
-class emulatedDevice(object):
+class batchedDevice(object):
+    '''class batchedDevice(object)
+    Collects the input_events of a uinput device (self.dev) and writes all
+    reports of a frame at once.
+    '''
+    def __init__(self):
+        self.pending = bytearray()  # input_events not yet written
+        self.report = False  # pending events after the last SYN_REPORT
+        self.toggled = set()  # keys changed in the current report
+        self.down = set()  # keys the device reports as pressed
+        self.writes = 0
+        self.skipped = 0
+
+    def emit(self, etype, code, value):
+        self.pending += INPUT_EVENT.pack(0, 0, etype, code, value)
+        self.report = True
+
+    def syn(self):
+        '''syn()
+        Ends the current report with a SYN_REPORT (if it has any events).
+        '''
+        if self.report:
+            self.pending += INPUT_EVENT.pack(0, 0, e.EV_SYN, e.SYN_REPORT, 0)
+            self.report = False
+            self.toggled.clear()
+
+    def flush(self):
+        '''flush()
+        Ends the current report and writes all pending reports at once.
+        '''
+        self.syn()
+        if self.pending:
+            os.write(self.dev.fd, self.pending)
+            self.writes += 1
+            del self.pending[:]
+
+    def takePending(self):
+        '''takePending()
+        Ends the current report and returns the pending reports instead of
+        writing them (see flush).
+        '''
+        self.syn()
+        data = bytes(self.pending)
+        del self.pending[:]
+        return data
+
+    def key(self, key, value):
+        if value == 2:
+            self.emit(e.EV_KEY, key, value)
+            return
+        if (key in self.down) == bool(value):
+            self.skipped += 1
+            return
+        if key in self.toggled:
+            # a second change of the same key needs its own report
+            self.syn()
+        self.toggled.add(key)
+        if value:
+            self.down.add(key)
+        else:
+            self.down.discard(key)
+        self.emit(e.EV_KEY, key, value)
+
+
+class emulatedDevice(batchedDevice):
     cap = {
             e.EV_KEY: [e.BTN_MOUSE, e.BTN_WHEEL, e.BTN_MIDDLE, e.BTN_RIGHT, e.BTN_SIDE,
                 e.KEY_ZOOM, e.KEY_ZOOMIN, e.KEY_ZOOMOUT, e.KEY_ZOOMRESET,
                 e.KEY_LEFTCTRL, e.KEY_SLASH, e.KEY_RIGHTBRACE,
-                e.KEY_LEFT, e.KEY_UP, e.KEY_RIGHT, e.KEY_DOWN],
-            e.EV_ABS: [
-                (e.ABS_X, AbsInfo(value=0, min=0, max=1023, fuzz=0, flat=0, resolution=0)),
-                (e.ABS_Y, AbsInfo(value=0, min=0, max=599, fuzz=0, flat=0, resolution=0))
-            ],
+                e.KEY_LEFT, e.KEY_UP, e.KEY_RIGHT, e.KEY_DOWN,
+                e.KEY_LEFTALT, e.KEY_BACK, e.KEY_FORWARD, e.KEY_PAGEUP, e.KEY_PAGEDOWN],
             e.EV_REL: [
                 e.REL_WHEEL, e.REL_HWHEEL
             ],
             e.EV_MSC: [e.MSC_SCAN]
     }
-    def __init__(self, id):
-        print('Creating emulated touch device #%d' % id)
+    keys = frozenset(cap[e.EV_KEY])
+
+    def __init__(self, id, name=None, maxX=1023, maxY=599):
+        '''emulatedDevice(id, name=None, maxX=1023, maxY=599)
+        Registers the device with:
+            - id: the touch point it emulates
+            - maxX, maxY: the axis ranges, the screen pixels the coordinates are clamped to
+        '''
+        if name is None:
+            name = 'pytouchd-emutouchdev-%d' % id
+        if debug:
+            print('Creating emulated touch device %r (%dx%d)' % (name, maxX + 1, maxY + 1))
         self.id = id
-        self.dev = UInput(self.cap, name='pytouchd-emutouchdev-%d' % id, version=0x0001)
+        cap = dict(self.cap)
+        cap[e.EV_ABS] = [
+            (e.ABS_X, AbsInfo(value=0, min=0, max=maxX, fuzz=0, flat=0, resolution=0)),
+            (e.ABS_Y, AbsInfo(value=0, min=0, max=maxY, fuzz=0, flat=0, resolution=0))
+        ]
+        self.dev = UInput(cap, name=name, version=0x0001)
         self.state = (0, 0, 0)  # (x, y, which key pressed)
         self.keydownstamp = None
         self.movebuffer = []
+        batchedDevice.__init__(self)
+        self.abs = [None, None]  # ABS_X, ABS_Y the device reports
 
     def close(self):
         global debug
         if debug:
             print('Closing emulated touch device #%d' % self.id)
+        self.flush()
         self.dev.close()
         del(self)
 
@@ -358,31 +467,30 @@ class emulatedDevice(object):
             print('REL #%d' % self.id)
         if key is None:
             key = self.state[2]
-            noupdate = True
-        else:
-            noupdate = False
-        self.dev.write(e.EV_KEY, key, 0)
-        self.dev.syn()
-        if not noupdate:
+        self.key(key, 0)
+        if key == self.state[2]:
             self.state = (self.state[0], self.state[1], 0)
 
     def press(self, key=e.BTN_MOUSE, quiet=False, *, value=1):
         global debug
-        if not key in self.cap[e.EV_KEY]:
+        if not key in self.keys:
             raise ValueError('Keycode %d is not valid!' % key)
         if debug and not quiet:
             print('PRS #%d, %d' % (self.id, key))
-        self.dev.write(e.EV_KEY, key, value)
-        self.dev.syn()
+        self.key(key, value)
         self.state = (self.state[0], self.state[1], key)
 
     def move(self, x, y, quiet=False):
         global debug
         if debug and not quiet:
             print('MOV #%d, (%d, %d)' % (self.id, x, y))
-        self.dev.write(e.EV_ABS, e.ABS_X, x)
-        self.dev.write(e.EV_ABS, e.ABS_Y, y)
-        self.dev.syn()
+        a = self.abs
+        if a[0] != x:
+            self.emit(e.EV_ABS, e.ABS_X, x)
+            a[0] = x
+        if a[1] != y:
+            self.emit(e.EV_ABS, e.ABS_Y, y)
+            a[1] = y
         self.state = (x, y, self.state[2])
 
     def scroll(self, amount, horizontal=False):
@@ -390,8 +498,8 @@ class emulatedDevice(object):
             wheel = e.REL_HWHEEL
         else:
             wheel = e.REL_WHEEL
-        self.dev.write(e.EV_REL, wheel, amount)
-        self.dev.syn()
+        self.emit(e.EV_REL, wheel, amount)
+        self.syn()
 
     def runBuffer(self):
         global debug
@@ -430,3 +538,176 @@ class emulatedDevice(object):
     #            self.movebuffer.append(event)
     #    else:
     #        self.release()
+
+
+class multitouchDevice(batchedDevice):
+    '''class multitouchDevice(batchedDevice)
+    One multitouch (protocol B) uinput device with a slot per touch point.
+    '''
+    def __init__(self, slots, maxX, maxY, name='pytouchd-mt'):
+        '''multitouchDevice(slots, maxX, maxY, name='pytouchd-mt')
+        Registers the device with:
+            - slots: number of touch points (ABS_MT_SLOT)
+            - maxX, maxY: the axis ranges of the coordinates
+        '''
+        batchedDevice.__init__(self)
+        if debug:
+            print('Creating multitouch device %r (%d slots, %dx%d)' % (name, slots, maxX + 1, maxY + 1))
+        cap = {
+            e.EV_KEY: [e.BTN_TOUCH],
+            e.EV_ABS: [
+                (e.ABS_X, AbsInfo(value=0, min=0, max=maxX, fuzz=0, flat=0, resolution=0)),
+                (e.ABS_Y, AbsInfo(value=0, min=0, max=maxY, fuzz=0, flat=0, resolution=0)),
+                (e.ABS_MT_SLOT, AbsInfo(value=0, min=0, max=slots - 1, fuzz=0, flat=0, resolution=0)),
+                (e.ABS_MT_TRACKING_ID, AbsInfo(value=0, min=0, max=0xffff, fuzz=0, flat=0, resolution=0)),
+                (e.ABS_MT_POSITION_X, AbsInfo(value=0, min=0, max=maxX, fuzz=0, flat=0, resolution=0)),
+                (e.ABS_MT_POSITION_Y, AbsInfo(value=0, min=0, max=maxY, fuzz=0, flat=0, resolution=0))
+            ]
+        }
+        self.name = name
+        self.dev = UInput(cap, name=name, version=0x0001, input_props=[e.INPUT_PROP_DIRECT])
+        self.slots = slots
+        self.slot = 0  # the current ABS_MT_SLOT
+        self.tracking = [None] * slots  # tracking ids of the slots, None: released
+        self.held = []  # the tracked slots, ascending
+        self.positions = [(None, None)] * slots
+        self.nextID = 0
+        self.abs = (None, None)  # single touch ABS_X, ABS_Y
+
+    def select(self, slot):
+        if self.slot != slot:
+            self.emit(e.EV_ABS, e.ABS_MT_SLOT, slot)
+            self.slot = slot
+
+    def frame(self, aIDs, coords):
+        '''frame(aIDs, coords)
+        Updates all slots from the active flags and the flat coordinates
+        x0, y0, x1, y1, ... and ends the report.
+        '''
+        first = None
+        # only the slots that are or were tracked
+        for slot in self.held:
+            if not aIDs[slot]:
+                self.releaseSlot(slot)
+        held = [slot for slot, active in enumerate(aIDs[:self.slots]) if active]
+        for slot in held:
+            x, y = coords[2 * slot], coords[2 * slot + 1]
+            if first is None:
+                first = (x, y)
+            if self.tracking[slot] is None:
+                self.select(slot)
+                self.tracking[slot] = self.nextID
+                self.nextID = (self.nextID + 1) & 0xffff
+                self.emit(e.EV_ABS, e.ABS_MT_TRACKING_ID, self.tracking[slot])
+            ox, oy = self.positions[slot]
+            if x != ox:
+                self.select(slot)
+                self.emit(e.EV_ABS, e.ABS_MT_POSITION_X, x)
+            if y != oy:
+                self.select(slot)
+                self.emit(e.EV_ABS, e.ABS_MT_POSITION_Y, y)
+            self.positions[slot] = (x, y)
+        self.held = held
+        self.key(e.BTN_TOUCH, first is not None)
+        if first is not None and first != self.abs:
+            if first[0] != self.abs[0]:
+                self.emit(e.EV_ABS, e.ABS_X, first[0])
+            if first[1] != self.abs[1]:
+                self.emit(e.EV_ABS, e.ABS_Y, first[1])
+            self.abs = first
+        self.syn()
+
+    def releaseSlot(self, slot):
+        self.select(slot)
+        self.emit(e.EV_ABS, e.ABS_MT_TRACKING_ID, -1)
+        self.tracking[slot] = None
+        self.positions[slot] = (None, None)
+
+    def releaseAll(self):
+        for slot in self.held:
+            self.releaseSlot(slot)
+        self.held = []
+        self.key(e.BTN_TOUCH, 0)
+        self.syn()
+
+    def close(self):
+        self.releaseAll()
+        self.flush()
+        self.dev.close()
+
+
+class multitouchOut(object):
+    '''class multitouchOut(object)
+    Forwards all touch points to one multitouch device instead of emulating
+    gestures (outputMode = multitouch). The device is registered with the
+    first event, when the layout of the touch device is known.
+    '''
+    def __init__(self, options, name='pytouchd', screen=None, calibration=None, settings=None):
+        self.opt = options
+        self.name = name
+        self.screen = geometry.default() if screen is None else screen
+        self.calibration = calibration
+        self.settings = settingsSnapshot.compile(options, calibration) if settings is None else settings
+        self.filter = None
+        self.scheduler = None  # no timers
+        self.dev = None
+        self.autoFlush = True  # see touchOut.handle
+        self.latency = None
+
+    @property
+    def devs(self):
+        return [] if self.dev is None else [self.dev]
+
+    def reconfigure(self, options, calibration, settings):
+        # see touchOut.reconfigure, the axes of a registered device are kept
+        self.opt = options
+        self.calibration = calibration
+        self.settings = settings
+        self.filter = retune(self.filter, settings)
+
+    def axes(self, event):
+        bpc, absmode, numPoints = event.details
+        if absmode and self.calibration is not None:
+            # calibrated screen pixels, see touchDecoder
+            return self.screen.width - 1, self.screen.height - 1
+        if absmode:
+            # absolute pixel coordinates of the touch device
+            return self.opt.get('pixW', self.screen.width, vtype=int) - 1, self.opt.get('pixH', self.screen.height, vtype=int) - 1
+        return (1 << 8 * bpc) - 1, (1 << 8 * bpc) - 1
+
+    def handle(self, event):
+        if self.dev is None:
+            maxX, maxY = self.axes(event)
+            self.dev = multitouchDevice(len(event.aIDs), maxX, maxY, '%s-mt' % self.name)
+        if self.settings.filter:
+            self.filter = filterFor(self.filter, event, self.settings)
+            self.filter.apply(event)
+        self.dev.frame(event.aIDs if event.pressed else (False,) * len(event.aIDs), event.coords)
+        if self.autoFlush:
+            handled = monotonic_ns()
+            self.dev.flush()
+            if self.latency is not None and event.received is not None:
+                self.latency.record(event.received, event.decoded, handled)
+
+    def counters(self):
+        return {'devices': len(self.devs), 'slots': 0 if self.dev is None else self.dev.slots,
+            'held': 0 if self.dev is None else len(self.dev.held)}
+
+    def releaseAll(self, quiet=False):
+        if self.dev is not None:
+            self.dev.releaseAll()
+            if self.autoFlush:
+                self.dev.flush()
+
+    def flush(self):
+        if self.dev is not None:
+            self.dev.flush()
+
+    def takePending(self):
+        if self.dev is None or not (self.dev.pending or self.dev.report):
+            return []
+        return [(self.dev.dev.fd, self.dev.takePending())]
+
+    def close(self):
+        if self.dev is not None:
+            self.dev.close()
@@ -0,0 +1,332 @@
+import os
+import asyncio
+from collections import deque
+from time import monotonic_ns
+
+from .touchInput import frameBuffer
+
+debug = False
+
+POLICIES = ('block', 'dropMoves')
+
+
+def isMove(previous, event, following):
+    # a move frame (the same active points as the frame before it) is superseded
+    # by the next frame with the same active points, like coalescer.stale; None
+    # (the idle marker of the events queue) is never dropped nor superseding
+    if previous is None or event is None or following is None:
+        return False
+    return previous.pressed and event.pressed and following.pressed and previous.aIDs == event.aIDs == following.aIDs
+
+
+class stageQueue(object):
+    '''class stageQueue(object)
+    A bounded queue between two pipeline stages that keeps track of its depth.
+    '''
+    def __init__(self, name, maxsize, policy='block', droppable=None):
+        '''stageQueue(name, maxsize, policy='block', droppable=None)
+        Inititalises the queue with:
+            - maxsize: maximum number of queued items
+            - policy: 'block' waits for free space, 'dropMoves' drops the oldest
+              item that is droppable (and blocks if there is none)
+            - droppable: droppable(previous, item, following) -> bool, previous
+              is the item before (the last one taken for the first item)
+        '''
+        assert maxsize > 0, 'maxsize must be positive, not %r' % maxsize
+        assert policy in POLICIES, 'policy must be one of %r, not %r' % (POLICIES, policy)
+        self.name = name
+        self.items = deque()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.droppable = droppable
+        self.last = None  # the item get() returned last
+        self.notEmpty = asyncio.Event()
+        self.notFull = asyncio.Event()
+        self.notFull.set()
+        self.passed = 0
+        self.dropped = 0
+        self.maxDepth = 0
+
+    @property
+    def depth(self):
+        return len(self.items)
+
+    @property
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+    def dropOne(self, incoming):
+        # drops the oldest droppable item, the last one is followed by incoming
+        if self.droppable is None:
+            return False
+        previous = self.last
+        items = self.items
+        for i in range(len(items)):
+            item = items[i]
+            if self.droppable(previous, item, items[i + 1] if i + 1 < len(items) else incoming):
+                del self.items[i]
+                self.dropped += 1
+                return True
+            previous = item
+        return False
+
+    async def put(self, item):
+        while self.full:
+            if self.policy == 'dropMoves' and self.dropOne(item):
+                break
+            self.notFull.clear()
+            await self.notFull.wait()
+        self.items.append(item)
+        self.maxDepth = max(self.maxDepth, len(self.items))
+        self.notEmpty.set()
+
+    async def get(self):
+        while not self.items:
+            self.notEmpty.clear()
+            await self.notEmpty.wait()
+        self.passed += 1
+        self.notFull.set()
+        self.last = self.items.popleft()
+        return self.last
+
+    def stats(self):
+        return {'depth': self.depth, 'maxDepth': self.maxDepth, 'passed': self.passed, 'dropped': self.dropped}
+
+
+class touchPipeline(object):
+    '''class touchPipeline(object)
+    Runs the daemon as four asyncio stages connected by bounded queues:
+        reader -> raw -> decoder -> events -> gestures -> output -> writer
+    The timers of the gesture engine (tout.scheduler) run in a fifth stage
+    that also writes to the output queue.
+    '''
+    def __init__(self, reader, tout, queueSize=64, policy='block', idleTimeout=1.0, onIdle=None):
+        '''touchPipeline(reader, tout, queueSize=64, policy='block', idleTimeout=1.0, onIdle=None)
+        Inititalises the pipeline with:
+            - reader: an open hidrawReader (only used for reading)
+            - tout: the touchOut instance that recognizes gestures
+            - queueSize: size of each queue
+            - policy: overflow policy of the event queue, see stageQueue
+            - idleTimeout: seconds without input after which all touch points
+              are released (None: never)
+            - onIdle: called after the touch points were released
+        '''
+        assert policy in POLICIES, 'policy must be one of %r, not %r' % (POLICIES, policy)
+        self.reader = reader
+        self.tout = tout
+        self.queueSize = queueSize
+        self.policy = policy
+        self.idleTimeout = idleTimeout
+        self.onIdle = onIdle
+        self.reason = None
+        self.queues = []
+        self.decoder = frameBuffer(None, len(reader.buffer), reader.maxReport, reader.decoder)
+        # stale moves are dropped from the event queue, see gestureStage
+        self.coalescer = reader.coalescer
+        # the frames carry their stamps through the queues, see writeStage
+        self.latency = self.decoder.latency = reader.latency
+        # the writer stage writes the reports of the gesture stage
+        tout.autoFlush = False
+        self.tasks = []
+        self.onFirstRead = None  # called with the reader when it is readable for the first time
+
+    def stats(self):
+        return {q.name: q.stats() for q in self.queues}
+
+    def release(self):
+        '''release()
+        Releases all touch points after the queued frames: the idle marker
+        goes through the event queue and the writer stage like an idle timeout.
+        Call it from the running loop.
+        '''
+        asyncio.ensure_future(self.events.put(None))
+
+    def counters(self):
+        c = self.decoder.counters()
+        c['reads'] = self.reader.reads
+        if self.coalescer is not None:
+            c['coalesced'] = self.coalescer.counters()
+        return c
+
+    async def readable(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(self.reader.fd, ready.set_result, None)
+        try:
+            await ready
+        finally:
+            loop.remove_reader(self.reader.fd)
+
+    async def readStage(self):
+        r = self.reader
+        while True:
+            try:
+                await asyncio.wait_for(self.readable(), self.idleTimeout)
+            except asyncio.TimeoutError:
+                await self.raw.put(None)
+                await self.readable()
+            if self.onFirstRead is not None:
+                self.onFirstRead(r)
+                self.onFirstRead = None
+            more = True
+            while more:
+                more = r.readPending()
+                # the decoder accepts at most maxReport bytes at once
+                for i in range(r.pos, r.fill, r.maxReport):
+                    await self.raw.put((r.received, bytes(r.view[i:min(i + r.maxReport, r.fill)])))
+                r.fill, r.pos = 0, 0
+
+    async def decodeStage(self):
+        decoded = []
+        self.decoder.callback = decoded.append
+        while True:
+            data = await self.raw.get()
+            if data is None:
+                await self.events.put(None)
+                continue
+            self.decoder.received, data = data
+            self.decoder.feed(data)
+            if not self.decoder.decode():
+                self.stop('getEvent() failed')
+            for event in decoded:
+                await self.events.put(event)
+            decoded.clear()
+
+    async def gestureStage(self):
+        coalescer = self.coalescer
+        queued = self.events.items
+        while True:
+            event = await self.events.get()
+            if coalescer is not None and event is not None:
+                # skip the moves a pending frame supersedes
+                while queued and queued[0] is not None and coalescer.stale(event, queued[0]):
+                    event = await self.events.get()
+                coalescer.passed(event)
+            if event is None:
+                self.tout.releaseAll(quiet=True)
+                if self.onIdle is not None:
+                    self.onIdle()
+                if debug:
+                    print('queues: %r' % self.stats())
+            else:
+                self.tout.handle(event)
+            stamps = None
+            if self.latency is not None and event is not None and event.received is not None:
+                stamps = (event.received, event.decoded, monotonic_ns())
+            pending = self.tout.takePending()
+            if pending:
+                await self.output.put((pending, stamps))
+            elif stamps is not None:
+                # nothing to write
+                self.latency.record(*stamps, stamps[2])
+            # let the reader run between two events
+            await asyncio.sleep(0)
+
+    async def timerStage(self):
+        scheduler = self.tout.scheduler
+        scheduler.onChange = self.timerChanged.set
+        while True:
+            self.timerChanged.clear()
+            try:
+                await asyncio.wait_for(self.timerChanged.wait(), scheduler.timeout())
+            except asyncio.TimeoutError:
+                pass
+            if scheduler.runDue():
+                pending = self.tout.takePending()
+                if pending:
+                    await self.output.put((pending, None))
+
+    async def writeStage(self):
+        while True:
+            pending, stamps = await self.output.get()
+            for fd, data in pending:
+                os.write(fd, data)
+            if stamps is not None:
+                self.latency.record(*stamps)
+            await asyncio.sleep(0)
+
+    def stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+        for t in self.tasks:
+            t.cancel()
+
+    async def main(self):
+        '''main()
+        Runs all stages until stop() is called and returns the reason.
+        '''
+        # the queues are created here so that they belong to the running loop
+        self.raw = stageQueue('raw', self.queueSize)
+        self.events = stageQueue('events', self.queueSize, self.policy, isMove)
+        self.output = stageQueue('output', self.queueSize)
+        self.queues = [self.raw, self.events, self.output]
+        self.tasks = [
+            asyncio.ensure_future(self.readStage()),
+            asyncio.ensure_future(self.decodeStage()),
+            asyncio.ensure_future(self.gestureStage()),
+            asyncio.ensure_future(self.writeStage())
+        ]
+        if self.tout.scheduler is not None:
+            self.timerChanged = asyncio.Event()
+            self.tasks.append(asyncio.ensure_future(self.timerStage()))
+        try:
+            await asyncio.gather(*self.tasks)
+        except asyncio.CancelledError:
+            pass
+        return self.reason
+
+
+class pipelineGroup(object):
+    '''class pipelineGroup(object)
+    Runs the pipelines of several devices in one asyncio loop.
+    '''
+    def __init__(self, pipelines):
+        self.pipelines = pipelines
+        self.reason = None
+        self.readers = {}  # fd -> callback, see addReader
+        self.loop = None
+
+    def addReader(self, fd, callback):
+        '''addReader(fd, callback)
+        Calls callback(fd) from the loop whenever fd is readable (see
+        eventLoop.addReader), e.g. for the control socket.
+        '''
+        self.readers[fd] = callback
+        if self.loop is not None:
+            self.loop.add_reader(fd, callback, fd)
+
+    def removeReader(self, fd):
+        if self.readers.pop(fd, None) is not None and self.loop is not None:
+            self.loop.remove_reader(fd)
+
+    def stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+        for p in self.pipelines:
+            p.stop(reason)
+
+    async def main(self, signals={}):
+        '''main(signals={})
+        Runs all pipelines until one of them stops and returns the reason.
+        signals maps signal numbers to handlers called with the signal number.
+        '''
+        loop = self.loop = asyncio.get_running_loop()
+        for signum, handler in signals.items():
+            loop.add_signal_handler(signum, handler, signum)
+        for fd, callback in self.readers.items():
+            loop.add_reader(fd, callback, fd)
+        tasks = [asyncio.ensure_future(p.main()) for p in self.pipelines]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            # re-raises fatal errors of a stage
+            self.stop(t.result())
+        for p in self.pipelines:
+            p.stop(self.reason)
+        await asyncio.gather(*pending)
+        for fd in self.readers:
+            loop.remove_reader(fd)
+        self.loop = None
+        return self.reason
+
+    def run(self, signals={}):
+        return asyncio.run(self.main(signals))
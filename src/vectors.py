@@ -1,4 +1,15 @@
 import math
+from math import hypot, atan2, degrees
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# swipe directions, see direction()
+PLUS_X, PLUS_Y, MINUS_X, MINUS_Y = range(4)
+# 90° sector (centered on an axis) -> direction
+SECTORS = (PLUS_X, PLUS_Y, MINUS_X, MINUS_Y)
 
 class vec(object):
     def __init__(self, coords: tuple):
@@ -86,22 +97,9 @@ class vec(object):
         return len(self.coordinates)
     
     def __iter__(self):
-        assert isinstance(self, vec)
-        self.itervar = 0
-        return self
-        
-    def __next__(self):
-        assert isinstance(self, vec)
-        if not hasattr(self,'itervar'):
-            raise IndexError
-        if self.itervar < len(self.coordinates):
-            self.itervar += 1
-            return self.coordinates[self.itervar - 1]
-        else:
-            del(self.itervar)
-            # raise IndexError
-            raise StopIteration
-    
+        # a new iterator each time, so that nested loops over one vec work
+        return iter(self.coordinates)
+
     def __getitem__(self, val):
         assert isinstance(self, vec)
         if isinstance(val, slice):
@@ -165,3 +163,149 @@ class vec(object):
     @property
     def isNullVector(self):
         return self.length == 0.0
+
+
+class vec2(object):
+    '''class vec2(object)
+    A lightweight 2D vector for the per-frame gesture code.
+    '''
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def of(cls, pair):
+        '''vec2.of(pair)
+        Returns a vec2 for an (x, y) tuple.
+        '''
+        x, y = pair
+        return cls(x, y)
+
+    def __add__(self, other):
+        return vec2(self.x + other[0], self.y + other[1])
+
+    __radd__ = __add__
+
+    def __iadd__(self, other):
+        self.x += other[0]
+        self.y += other[1]
+        return self
+
+    def __sub__(self, other):
+        return vec2(self.x - other[0], self.y - other[1])
+
+    def __rsub__(self, other):
+        return vec2(other[0] - self.x, other[1] - self.y)
+
+    def __mul__(self, other):
+        if isinstance(other, vec2):
+            return self.x * other.x + self.y * other.y
+        return vec2(self.x * other, self.y * other)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return vec2(-self.x, -self.y)
+
+    def __round__(self):
+        return vec2(round(self.x), round(self.y))
+
+    def __eq__(self, other):
+        return self.x == other[0] and self.y == other[1]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __getitem__(self, i):
+        return (self.x, self.y)[i]
+
+    def __str__(self):
+        return 'vec2(%s, %s)' % (self.x, self.y)
+
+    def __repr__(self):
+        return '<vec2 x=%r y=%r length=%r>' % (self.x, self.y, self.length)
+
+    @property
+    def length(self):
+        return hypot(self.x, self.y)
+
+    @property
+    def heading(self):
+        # direction in radians, see math.atan2
+        return atan2(self.y, self.x)
+
+    def angle(self, other, *, todegrees=False):
+        '''angle(other, *, todegrees=False)
+        The angle between both vectors (0 to pi), like vec.angle.
+        '''
+        if (self.x == 0 and self.y == 0) or (other[0] == 0 and other[1] == 0):
+            raise ValueError('null vector!')
+        alpha = abs(atan2(self.x * other[1] - self.y * other[0], self.x * other[0] + self.y * other[1]))
+        if todegrees:
+            alpha = degrees(alpha)
+        return alpha
+
+    def dot(self, other):
+        return self.x * other[0] + self.y * other[1]
+
+    def cross(self, other):
+        # z component of the 3D cross product
+        return self.x * other[1] - self.y * other[0]
+
+    @property
+    def isNullVector(self):
+        return self.x == 0 and self.y == 0
+
+
+def direction(x, y, threshold=15):
+    '''direction(x, y, threshold=15)
+    Classifies the vector (x, y) as PLUS_X, PLUS_Y, MINUS_X or MINUS_Y if it
+    deviates less than threshold degrees from that axis, else returns None.
+    '''
+    if x == 0 and y == 0:
+        return None
+    alpha = degrees(atan2(y, x)) % 360
+    sector = int((alpha + 45) // 90) % 4
+    if abs((alpha - 90 * sector + 180) % 360 - 180) < threshold:
+        return SECTORS[sector]
+    return None
+
+
+# batch versions for arrays of displacement vectors with the shape (..., 2)
+
+def lengths(d):
+    '''lengths(d)
+    Returns the lengths of all vectors in d (numpy only).
+    '''
+    return np.hypot(d[..., 0], d[..., 1])
+
+def headings(d):
+    '''headings(d)
+    Returns the directions in radians of all vectors in d (numpy only).
+    '''
+    return np.arctan2(d[..., 1], d[..., 0])
+
+def angles(a, b):
+    '''angles(a, b)
+    Returns the angles (0 to pi) between the vectors of a and b (numpy only).
+    '''
+    cross = a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+    dot = a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1]
+    return np.abs(np.arctan2(cross, dot))
+
+def directions(d, threshold=15):
+    '''directions(d, threshold=15)
+    Like direction() for all vectors in d (numpy only), -1 instead of None.
+    '''
+    alpha = np.degrees(headings(d)) % 360
+    sector = ((alpha + 45) // 90).astype(int) % 4
+    deviation = np.abs((alpha - 90 * sector + 180) % 360 - 180)
+    result = np.asarray(SECTORS)[sector]
+    result[(deviation >= threshold) | (lengths(d) == 0)] = -1
+    return result
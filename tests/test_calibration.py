@@ -0,0 +1,96 @@
+'''Tests of the panel calibration (raw touch coordinates -> screen pixels).'''
+import pytest
+import screeninfo
+
+from src import calibration, geometry
+from src.calibration import panelCalibration, affineTransform, parsePoints, fitAffine, millimeters
+from src.config import Configuration
+
+W, H = 1024, 600
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    monkeypatch.setattr(geometry, 'monitors', [screeninfo.Monitor(0, 0, W, H)])
+    return geometry.screenGeometry(0)
+
+def panel(screen, **options):
+    cfg = Configuration()
+    for name, value in options.items():
+        cfg.setv(name, value)
+    return panelCalibration(cfg, screen)
+
+def corners(transform, rawW, rawH):
+    return transform([0, 0, rawW, 0, 0, rawH, rawW, rawH])
+
+
+def test_identity(screen):
+    t = panel(screen).compile(2, True)
+    assert corners(t, W, H) == [0, 0, W - 1, 0, 0, H - 1, W - 1, H - 1]
+    assert t([512, 300]) == [512, 300]
+
+def test_relative_coordinates(screen):
+    # bpc 1 without absmode: 0 .. 255 covers the screen
+    t = panel(screen).compile(1, False)
+    assert corners(t, 255, 255) == [0, 0, W - 1, 0, 0, H - 1, W - 1, H - 1]
+
+def test_rotation_and_mirror(screen):
+    t = panel(screen, rotation=90).compile(2, True)
+    # the top left corner of the panel is the top right corner of the screen
+    assert corners(t, W, H) == [W - 1, 0, W - 1, H - 1, 0, 0, 0, H - 1]
+    t = panel(screen, mirrorX=True).compile(2, True)
+    assert corners(t, W, H) == [W - 1, 0, 0, 0, W - 1, H - 1, 0, H - 1]
+    t = panel(screen, rotation=180).compile(2, True)
+    assert corners(t, W, H) == [W - 1, H - 1, 0, H - 1, W - 1, 0, 0, 0]
+
+def test_calibration_points(screen):
+    points = '100 100 0 0; 900 100 1000 0; 100 500 0 500'
+    c = panel(screen, calibrationPoints=points)
+    m = fitAffine(parsePoints(points))
+    for x, y, X, Y in parsePoints(points):
+        assert m[0][0] * x + m[0][1] * y + m[0][2] == pytest.approx(X)
+        assert m[1][0] * x + m[1][1] * y + m[1][2] == pytest.approx(Y)
+    # the points replace the rotation and the panel size
+    assert c.compile(2, True)([500, 300]) == [500, 250]
+
+@pytest.mark.parametrize('points', [
+    '',  # accepted, no calibration
+    '1 2 3 4; 5 6 7 8',
+    '1 2 3; 4 5 6 7; 8 9 10 11',
+    '1 2 3 4 5; 4 5 6 7; 8 9 10 11',
+])
+def test_parse_points(points):
+    if not points:
+        assert parsePoints(points) == []
+        return
+    with pytest.raises(ValueError):
+        parsePoints(points)
+
+@pytest.mark.parametrize('options', [
+    {'calibrationPoints': '0 0 0 0; 10 10 10 10; 20 20 20 20'},  # collinear touch points
+    {'calibrationPoints': '0 0 0 0; 10 0 10 10; 0 10 20 20'},  # collinear screen points
+    {'rotation': 45},
+    {'pixW': 0},
+    {'devW': '0 cm'},
+    {'devH': '9 furlong'},
+])
+def test_invalid_setup(screen, options):
+    with pytest.raises(ValueError):
+        panel(screen, **options)
+
+def test_millimeters():
+    assert millimeters('1 in') == pytest.approx(25.4)
+    assert millimeters('15,5cm') == pytest.approx(155)
+    assert millimeters(12) == 12
+
+def test_clamping():
+    t = affineTransform(((2, 0, -10), (0, 1, 0), (0, 0, 1)), 99, 49)
+    assert t([0, 0, 30, 20, 100, 100]) == [0, 0, 50, 20, 99, 49]
+
+def test_array_equals_call():
+    np = pytest.importorskip('numpy')
+    # exact binary fractions, both sides round the same sums
+    t = affineTransform(((0.75, 0.25, -5.5), (-0.125, 1.5, 3), (0, 0, 1)), W - 1, H - 1)
+    coords = np.array([[[x, (x * 7) % 700] for x in range(i, i + 5)] for i in range(0, 1200, 37)], dtype='H')
+    assert t.applyArray(coords).reshape(-1).tolist() == [
+        v for frame in coords for v in t(frame.reshape(-1).tolist())]
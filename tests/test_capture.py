@@ -0,0 +1,103 @@
+'''Replays tests/data/gestures.cap through the decoder and the gesture engine.
+
+The capture holds the reports of one bpc 2 device with 5 touch points: a
+tap at (100, 200), a zero line, a drag from (300, 300) to (400, 300) (the
+second half with two frames per report) and a two finger swipe down by 140
+pixels, one second apart.
+'''
+import os
+
+import pytest
+import screeninfo
+
+from src import geometry
+from src.calibration import panelCalibration
+from src.capture import captureReader, captureTarget, captureWriter, capturePlayer
+from src.config import Configuration
+from src.gestures import gestureEngine
+from src.settings import settings
+from src.timers import deadlineScheduler
+from src.touchInput import touchDecoder
+from src.vectors import direction
+
+from .test_gestures import recorder
+
+CAPTURE = os.path.join(os.path.dirname(__file__), 'data', 'gestures.cap')
+
+
+class timedCapture(object):
+    # a captureReader that keeps the recorded time of the current report
+    def __init__(self, capture):
+        self.capture = capture
+        self.path = capture.path
+        self.devices = capture.devices
+        self.now = 0.0
+
+    def __iter__(self):
+        for t, index, data in self.capture:
+            self.now = t
+            yield t, index, data
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    monkeypatch.setattr(geometry, 'monitors', [screeninfo.Monitor(0, 0, 1024, 600)])
+    return geometry.screenGeometry(0)
+
+def replay(screen):
+    capture = timedCapture(captureReader(CAPTURE))
+    out = recorder()
+    scheduler = deadlineScheduler(clock=lambda: capture.now)
+    engine = gestureEngine(out, settings.compile({}), scheduler=scheduler)
+
+    def handle(event):
+        # the gestures see the recorded timing
+        event.time = capture.now
+        engine.handle(event)
+
+    calibration = panelCalibration(Configuration(), screen)
+    targets = [captureTarget(path, handle, decoder=touchDecoder(calibration=calibration))
+        for path in capture.devices]
+    player = capturePlayer(capture, targets, realtime=False)
+    player.addScheduler(scheduler)
+    return player.run(), out
+
+def test_header():
+    capture = captureReader(CAPTURE)
+    assert capture.devices == ['/dev/hidraw0']
+    assert len(list(capture)) == 28
+
+def test_replay(screen):
+    counters, out = replay(screen)
+    assert counters['reports'] == 28
+    assert counters['frames'] == 30
+    assert out.actions() == [
+        ('click', 100, 200, False),
+        ('dragStart', 300, 300),
+        ('dragEnd', 400, 300),
+        ('swipe', 2, direction(0, 1, 15), pytest.approx(140)),
+    ]
+
+def test_roundtrip(tmp_path):
+    t = [10.0]
+    path = str(tmp_path / 'test.cap')
+    writer = captureWriter(path, ['/dev/hidraw0', '/dev/hidraw1'], clock=lambda: t[0])
+    writer.write(1, b'\xaa\x01')
+    t[0] = 10.25
+    writer.write(0, b'\xbb')
+    writer.close()
+    capture = captureReader(path)
+    assert capture.devices == ['/dev/hidraw0', '/dev/hidraw1']
+    assert [(t, i, bytes(d)) for t, i, d in capture] == [(0.0, 1, b'\xaa\x01'), (0.25, 0, b'\xbb')]
+
+def test_truncated(tmp_path):
+    path = tmp_path / 'truncated.cap'
+    with open(CAPTURE, 'rb') as f:
+        path.write_bytes(f.read()[:-10])
+    assert len(list(captureReader(str(path)))) == 27
+
+def test_no_capture(tmp_path):
+    path = tmp_path / 'other.cap'
+    path.write_bytes(b'XXXX\x01\x00')
+    with pytest.raises(ValueError):
+        captureReader(str(path))
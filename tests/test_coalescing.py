@@ -0,0 +1,49 @@
+'''Tests of the moveCoalescer, which drops stale moves of pending frames.'''
+from src.coalescing import moveCoalescer
+from src.touchIntermediate import touchEvt
+
+POINTS = 5
+
+
+def frame(x, slots=(0,), pressed=True):
+    aIDs = [i in slots for i in range(POINTS)]
+    return touchEvt(True, 2, pressed, aIDs, [(x, 100) if i in slots else (0, 0) for i in range(POINTS)])
+
+def xs(events):
+    return [(e.pressed, sum(e.aIDs), e.coords[0]) for e in events]
+
+
+def test_moves_are_dropped():
+    c = moveCoalescer()
+    press = frame(10)
+    c.coalesce([press])
+    kept = c.coalesce([frame(x) for x in (20, 30, 40, 50)])
+    assert xs(kept) == [(True, 1, 50)]
+    assert c.counters() == {'merged': 1, 'dropped': 3}
+
+def test_presses_and_releases_are_kept():
+    c = moveCoalescer()
+    events = [frame(10), frame(20), frame(30, (0, 1)), frame(40, (0, 1)), frame(50, (0, 1)),
+        frame(0, (), False), frame(60), frame(70)]
+    kept = c.coalesce(events)
+    # the first frame is a press, the last of each run of moves is kept
+    assert xs(kept) == [(True, 1, 10), (True, 1, 20), (True, 2, 30), (True, 2, 50),
+        (False, 0, 0), (True, 1, 60), (True, 1, 70)]
+    assert c.counters() == {'merged': 1, 'dropped': 1}
+
+def test_first_frame_after_a_batch():
+    # the last frame of a batch is compared to the next batch
+    c = moveCoalescer()
+    c.coalesce([frame(0, (), False)])
+    kept = c.coalesce([frame(10), frame(20)])
+    assert xs(kept) == [(True, 1, 10), (True, 1, 20)]
+    kept = c.coalesce([frame(30), frame(40)])
+    assert xs(kept) == [(True, 1, 40)]
+
+def test_stale():
+    c = moveCoalescer()
+    c.passed(frame(10))
+    assert c.stale(frame(20), frame(30))
+    assert not c.stale(frame(20), frame(30, (0, 1)))
+    assert not c.stale(frame(20), frame(0, (), False))
+    assert c.counters() == {'merged': 1, 'dropped': 1}
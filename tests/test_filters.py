@@ -0,0 +1,49 @@
+import pytest
+
+from src import filters
+from src.filters import oneEuroFilter
+from src.touchIntermediate import touchEvt
+
+POINTS = 5
+
+
+@pytest.fixture(params=['numpy', 'list'])
+def backend(request, monkeypatch):
+    if request.param == 'list':
+        monkeypatch.setattr(filters, 'np', None)
+    elif filters.np is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+def event(t, x, y, pressed=True):
+    e = touchEvt(True, 2, pressed, [pressed] + [False] * (POINTS - 1), [(x, y)] + [(0, 0)] * (POINTS - 1))
+    e.time = t
+    return e
+
+def test_press_starts_unfiltered(backend):
+    f = oneEuroFilter(POINTS)
+    e = event(0.0, 100, 200)
+    f.apply(e)
+    assert e.absCoordinates[0] == (100, 200)
+
+def test_burst_is_smoothed(backend):
+    # frames decoded from one read have (nearly) the same time
+    f = oneEuroFilter(POINTS)
+    f.apply(event(0.0, 100, 200))
+    out = []
+    for i in range(1, 6):
+        e = event(0.1, 100 + (i % 2) * 4, 200)
+        f.apply(e)
+        out.append(e.absCoordinates[0][0])
+    # the jitter of +-4 pixels does not reach the output
+    assert all(100 <= x < 104 for x in out)
+    assert out != [104, 100, 104, 100, 104]
+
+def test_release_resets(backend):
+    f = oneEuroFilter(POINTS)
+    f.apply(event(0.0, 100, 200))
+    f.apply(event(0.01, 150, 200))
+    f.apply(event(0.02, 0, 0, pressed=False))
+    e = event(0.03, 300, 400)
+    f.apply(e)
+    assert e.absCoordinates[0] == (300, 400)
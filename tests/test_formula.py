@@ -0,0 +1,70 @@
+import pytest
+
+from src.config import readConfig
+from src.formula import compileFormula, steps
+from src.settings import settings
+
+REJECTED = [
+    '9**9**9**9',
+    'int(l) ** 99999999',
+    '2 ** l',
+    'l ** (1 + 1)',
+    '(l ** 2) ** 2',
+    '__import__("os")',
+    'l.real',
+    'open',
+    '[l]',
+    'l if l else 1',
+    'max(l, key=abs)',
+    'True + l',
+    'l +',
+]
+
+
+@pytest.mark.parametrize('text', REJECTED)
+def test_rejected(text):
+    with pytest.raises(ValueError):
+        compileFormula(text)
+
+@pytest.mark.parametrize('text, expected', [
+    ('l / 10', 5.5),
+    ('max(1, l // 10)', 5),
+    ('l ** 2', 3025),
+    ('l ** -1', 1 / 55),
+    ('l ** 0.5 * 2', 55 ** 0.5 * 2),
+    ('round(abs(-l) % 7)', 6),
+])
+def test_allowed(text, expected):
+    assert compileFormula(text)(l=55) == pytest.approx(expected)
+
+def test_steps_skips_errors():
+    assert steps(compileFormula('10 / (l - 1)'), l=1) is None
+    assert steps(compileFormula('l * 1e308 * 10'), l=5) is None
+    assert steps(compileFormula('l / 10'), l=55) == 5
+
+def write(path, formula):
+    path.write_text('[default]\n    scrollAmountFormula = %s\n' % formula)
+
+def test_rejected_at_load(tmp_path):
+    write(tmp_path / 'touchd.ini', '9**9**9**9')
+    path, cfg = readConfig(str(tmp_path), str(tmp_path / 'touchd.ini'))
+    with pytest.raises(ValueError):
+        settings.compile(cfg)
+
+def test_rejected_at_reload(tmp_path):
+    # the daemon compiles the new configuration before it swaps anything
+    write(tmp_path / 'touchd.ini', 'l / 10')
+    path, cfg = readConfig(str(tmp_path), str(tmp_path / 'touchd.ini'))
+    active = settings.compile(cfg)
+    write(tmp_path / 'touchd.ini', 'int(l) ** 99999999')
+    path, cfg = readConfig(str(tmp_path), str(tmp_path / 'touchd.ini'))
+    with pytest.raises(ValueError):
+        settings.compile(cfg).reloaded(active)
+    assert active.scrollAmount(l=55) == 5.5
+
+def test_rejected_in_device_section(tmp_path):
+    (tmp_path / 'touchd.ini').write_text('[device:/dev/hidraw1]\n    moveGestureFormula = 2 ** l\n')
+    path, cfg = readConfig(str(tmp_path), str(tmp_path / 'touchd.ini'))
+    settings.compile(cfg)
+    with pytest.raises(ValueError):
+        settings.compile(cfg.forDevice('/dev/hidraw1'))
@@ -0,0 +1,181 @@
+'''Regression tests of the gesture engine with synthetic frames.
+
+The engine calls a recording output instead of touchOut and runs its
+timers on a clock driven by the tests, so no uinput device is needed.
+'''
+import pytest
+
+from src.gestures import gestureEngine, IDLE, DEAD
+from src.settings import settings
+from src.timers import deadlineScheduler
+from src.touchIntermediate import touchEvt
+from src.vectors import direction
+
+POINTS = 5  # touch points per frame
+
+
+class recorder(object):
+    # stands in for touchOut, records the actions of the recognizers
+    def __init__(self):
+        self.calls = []
+
+    def click(self, x=None, y=None, right=False):
+        self.calls.append(('click', x, y, right))
+
+    def dragStart(self, x, y):
+        self.calls.append(('dragStart', x, y))
+
+    def passThrough(self, event):
+        self.calls.append(('passThrough',))
+
+    def dragEnd(self, x, y):
+        self.calls.append(('dragEnd', x, y))
+
+    def zoom(self, k, nclicks):
+        self.calls.append(('zoom', k, nclicks))
+
+    def swipe(self, fingers, d, l):
+        self.calls.append(('swipe', fingers, d, l))
+
+    def actions(self):
+        return [c for c in self.calls if c[0] != 'passThrough']
+
+
+class session(object):
+    # feeds frames at the times of a fake clock
+    def __init__(self, **options):
+        self.now = 0.0
+        self.out = recorder()
+        self.scheduler = deadlineScheduler(clock=lambda: self.now)
+        self.engine = gestureEngine(self.out, settings.compile(options), scheduler=self.scheduler)
+
+    def frame(self, points, pressed=True, flags=None):
+        '''frame(points, pressed=True, flags=None)
+        Handles a frame with points {slot: (x, y)}, flags are the active
+        slots (default: the slots of points).
+        '''
+        active = set(points) if flags is None else set(flags)
+        aIDs = [i in active for i in range(POINTS)]
+        coords = [points.get(i, (0, 0)) for i in range(POINTS)]
+        event = touchEvt(True, 2, pressed, aIDs, coords)
+        event.time = self.now
+        self.engine.handle(event)
+
+    def release(self, flags=()):
+        self.frame({}, pressed=False, flags=flags)
+
+    def wait(self, seconds):
+        # the main loop runs the due timers
+        self.now += seconds
+        self.scheduler.runDue()
+
+    def tap(self, x, y, flags=()):
+        self.frame({0: (x, y)})
+        self.wait(0.05)
+        self.release(flags)
+
+
+def test_tap():
+    s = session()
+    s.tap(100, 200)
+    assert s.out.actions() == [('click', 100, 200, False)]
+    assert s.engine.state == IDLE
+
+def test_double_tap():
+    s = session()
+    s.tap(100, 200)
+    s.wait(0.1)
+    s.tap(105, 202)
+    # the second click at the position of the first one
+    assert s.out.actions() == [('click', 100, 200, False), ('click', None, None, False)]
+
+@pytest.mark.parametrize('flags', [(), (0,)])
+def test_taps_after_release_with_flags(flags):
+    s = session()
+    for i in range(3):
+        s.tap(100 + 100 * i, 200, flags)
+        s.wait(1.0)
+    assert s.out.actions() == [('click', 100 + 100 * i, 200, False) for i in range(3)]
+
+def test_drag():
+    s = session()
+    for i in range(10):
+        s.frame({0: (100 + 10 * i, 200)})
+        s.wait(0.01)
+    s.release((0,))
+    actions = s.out.actions()
+    assert actions == [('dragStart', 100, 200), ('dragEnd', 190, 200)]
+    assert s.out.calls.count(('passThrough',)) > 0
+
+def test_long_press():
+    s = session(holdForRightClick=True)
+    s.frame({0: (100, 200)})
+    s.wait(0.5)
+    s.release()
+    assert s.out.actions() == [('click', 100, 200, True)]
+
+def test_long_press_disabled():
+    s = session(holdForRightClick=False)
+    s.frame({0: (100, 200)})
+    s.wait(0.5)
+    s.release()
+    assert s.out.actions() == [('click', 100, 200, False)]
+
+def test_pinch_starts_when_the_second_finger_lands():
+    s = session()
+    # the first finger moves a little (less than dragDist) on its own
+    s.frame({0: (400, 300)})
+    s.frame({0: (380, 300)})
+    for i in range(11):
+        s.frame({0: (380 - 10 * i, 300), 1: (500 + 10 * i, 300)})
+        s.wait(0.01)
+    s.release((0, 1))
+    (name, k, nclicks), = s.out.actions()
+    assert name == 'zoom'
+    # the distance at the start is the one when both fingers were down
+    assert k == pytest.approx(320 / 120)
+    assert s.engine.state == DEAD
+
+def test_pinch_formula_error_skips_the_zoom():
+    s = session(pinchToZoomClicksFormula='1 / (d1 - d1)')
+    for i in range(11):
+        s.frame({0: (380 - 10 * i, 300), 1: (500 + 10 * i, 300)})
+        s.wait(0.01)
+    s.release((0, 1))
+    assert s.out.actions() == []
+    s.wait(0.5)
+    s.tap(500, 100)
+    assert s.out.actions() == [('click', 500, 100, False)]
+
+@pytest.mark.parametrize('fingers', [2, 3])
+def test_swipe(fingers):
+    s = session()
+    for i in range(15):
+        s.frame({f: (100 + 100 * f, 200 + 10 * i) for f in range(fingers)})
+        s.wait(0.01)
+    s.release(range(fingers))
+    (name, n, d, l), = s.out.actions()
+    assert (name, n, d) == ('swipe', fingers, direction(0, 1, 15))
+    assert l == pytest.approx(140)
+
+def test_swipe_starts_when_the_second_finger_lands():
+    s = session()
+    s.frame({0: (100, 200)})
+    s.frame({0: (100, 220)})
+    for i in range(6):
+        s.frame({0: (100 + 10 * i, 220), 1: (300 + 10 * i, 220)})
+    s.release()
+    (name, n, d, l), = s.out.actions()
+    # the vertical move of the first finger alone is not part of the swipe
+    assert (name, n, d) == ('swipe', 2, direction(1, 0, 15))
+    assert l == pytest.approx(50)
+
+def test_tap_after_multi_finger_release_with_flags():
+    s = session()
+    for i in range(5):
+        s.frame({0: (100, 200 + 10 * i), 1: (300, 200 + 10 * i)})
+    s.release((0, 1))
+    s.wait(0.5)
+    assert s.engine.state == IDLE
+    s.tap(500, 100, (0,))
+    assert s.out.actions()[-1] == ('click', 500, 100, False)
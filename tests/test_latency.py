@@ -0,0 +1,49 @@
+'''Tests of the latency histograms.'''
+import pytest
+
+from src.latency import bucket, upperBound, logHistogram, latencyMonitor, formatSummary, BUCKETS, STAGES
+
+
+def test_buckets():
+    previous = 0
+    for ns in sorted(set(range(5000)) | {int(1.1 ** e) for e in range(400)}):
+        i = bucket(ns)
+        assert previous <= i < BUCKETS
+        previous = i
+        # ns lies in its bucket, whose bounds are less than 25 % apart
+        assert ns < upperBound(i)
+        assert i == 0 or upperBound(i - 1) <= ns
+        assert upperBound(i) - 1 <= max(ns * 1.25, ns + 1)
+
+def test_percentiles():
+    h = logHistogram()
+    assert h.percentile(50) == 0
+    for us in range(1, 1001):
+        h.add(us * 1000)
+    h.add(-5)  # clock skew counts as 0
+    assert h.count == 1001
+    assert h.max == 10 ** 6
+    for p in (50, 95, 99):
+        assert h.percentile(p) == pytest.approx(p * 10 ** 4, rel=0.25)
+        assert h.percentile(p) >= p * 10 ** 4
+    assert h.percentile(100) == 10 ** 6
+    assert h.summary()['max'] == 1000
+
+def test_monitor():
+    m = latencyMonitor('/dev/hidraw0')
+    for i in range(10):
+        t = i * 10 ** 6
+        m.record(t, t + 1000, t + 3000, t + 7000)
+    s = m.summary()
+    assert set(s) == set(STAGES)
+    assert [s[stage]['max'] for stage in STAGES] == [1, 2, 4, 7]
+    assert all(s[stage]['count'] == 10 for stage in STAGES)
+
+def test_format():
+    m = latencyMonitor()
+    m.record(0, 1000, 2000, 3000)
+    lines = formatSummary('/dev/hidraw0', m.summary()).splitlines()
+    assert lines[0] == '/dev/hidraw0 (microseconds)'
+    assert lines[1].split() == ['stage', 'frames', 'p50', 'p95', 'p99', 'max']
+    assert [l.split()[:2] for l in lines[2:]] == [[stage, '1'] for stage in STAGES]
+    assert lines[-1].split()[-1] == '3.0'
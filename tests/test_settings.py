@@ -0,0 +1,64 @@
+'''Tests of the option schema (see test_formula for the formulas).'''
+import pytest
+import screeninfo
+
+from src import geometry
+from src.calibration import panelCalibration
+from src.config import Configuration
+from src.settings import settings, SCHEMA, RESTART
+
+
+def test_defaults():
+    s = settings.compile({})
+    for o in SCHEMA:
+        assert s.get(o.name) == o.default
+    assert (s.dragDistPx, s.dragDistSq, s.ppmm) == (30, 900, None)
+    assert s.scrollAmount(l=55) == 5.5
+
+def test_conversion():
+    s = settings.compile({'debug': 'true', 'sglClickTime': '1', 'queueSize': '8',
+        'dragDist': '40 px', 'outputMode': 'multitouch', 'rotation': '90'})
+    assert (s.debug, s.sglClickTime, s.queueSize, s.outputMode, s.rotation) == (True, 1.0, 8, 'multitouch', 90)
+    assert type(s.sglClickTime) is float
+    assert (s.dragDistPx, s.dragDistSq) == (40, 1600)
+
+def test_physical_length(monkeypatch):
+    s = settings.compile({'dragDist': '1 cm'})
+    assert s.dragDistPx is None
+    monkeypatch.setattr(geometry, 'monitors', [screeninfo.Monitor(0, 0, 1600, 900)])
+    calibration = panelCalibration(Configuration(), geometry.screenGeometry(0))
+    s = settings.compile({'dragDist': '1 cm'}, calibration)
+    # 16 x 9 cm panel on 1600 x 900 pixels
+    assert (s.ppmm, s.dragDistPx) == (10, 100)
+
+@pytest.mark.parametrize('options', [
+    {'outputMode': 'touchpad'},
+    {'overflowPolicy': 'drop'},
+    {'rotation': 45},
+    {'queueSize': 'many'},
+    {'sglClickTime': 'soon'},
+    {'dragDist': '3 furlong'},
+    {'dragDist': 'far'},
+    {'filterMinCutoff': 0},
+    {'filterDCutoff': -1},
+    {'slotIdleTimeout': -1},
+    {'moveGestureFormula': 'l.real'},
+])
+def test_rejected(options):
+    with pytest.raises(ValueError):
+        settings.compile(options)
+
+def test_reloaded_keeps_restart_options():
+    active = settings.compile({'queueSize': 8, 'dragDist': 30})
+    new = settings.compile({'queueSize': 16, 'outputMode': 'multitouch', 'dragDist': 50})
+    snapshot, restart = new.reloaded(active)
+    assert set(restart) == {'queueSize', 'outputMode'}
+    assert all(snapshot.get(name) == active.get(name) for name in RESTART)
+    assert (snapshot.dragDist, snapshot.dragDistPx) == (50, 50)
+    assert snapshot.changes(active) == ['dragDist']
+    assert active.changes(active) == []
+
+def test_get():
+    s = settings.compile({})
+    assert s.get('queueSize') == s.queueSize
+    assert s.get('unknown', 'fallback') == 'fallback'
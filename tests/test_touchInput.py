@@ -0,0 +1,115 @@
+'''Tests of the frame decoder.
+
+The same stream is decoded with struct (lockedDecoder.decode) and with numpy
+(lockedDecoder.decodeBatch), both must return the same events.
+'''
+import pytest
+
+from src import touchInput
+from src.touchInput import touchDecoder, frameBuffer
+
+
+def frame(press, points, flags, bpc=2, numPoints=5):
+    # aa <press> <x> <y> bb <activeFlags> (<y> <x>) * (numPoints - 1) cc <pad>
+    def c(v):
+        return v.to_bytes(bpc, 'big')
+    points = list(points) + [(0, 0)] * (numPoints - len(points))
+    data = bytes([0xaa, press]) + c(points[0][0]) + c(points[0][1]) + bytes([0xbb, flags])
+    for x, y in points[1:]:
+        data += c(y) + c(x)
+    return data + bytes([0xcc, 0x00])
+
+def zeroLine(bpc=2, numPoints=5):
+    return bytes([0xaa]) + bytes(2 * bpc + 1) + bytes([0xbb]) + bytes(2 * bpc * (numPoints - 1) + 3)
+
+def stream(n, bpc=2, numPoints=5):
+    # a drag with a second finger landing halfway, then the release
+    top = 256 ** bpc - 1
+    data = b''
+    for i in range(n):
+        points = [(i % top, (2 * i) % top)]
+        if i >= n // 2:
+            points.append(((top - i) % top, (3 * i) % top))
+        data += frame(1, points, (1 << len(points)) - 1, bpc, numPoints)
+    return data + frame(0, [], 0, bpc, numPoints)
+
+def decode(data, batchMin):
+    touchInput.batchMin = batchMin
+    decoder = touchDecoder(poolSize=0)
+    events = []
+    pos = 0
+    # the first frame detects the layout, the rest is decoded at once
+    while pos < len(data):
+        ok, decoded, Len, pos = decoder.getEvents(data, pos)
+        assert ok
+        events.extend(decoded)
+        if not decoded:
+            break
+    return decoder, events
+
+def summary(events):
+    return [(e.pressed, tuple(e.aIDs), list(e.coords), e.bpc, e.absmode) for e in events]
+
+
+@pytest.fixture(autouse=True)
+def restore(monkeypatch):
+    monkeypatch.setattr(touchInput, 'batchMin', touchInput.batchMin)
+
+@pytest.mark.parametrize('bpc', [1, 2])
+def test_layout_detection(bpc):
+    decoder, events = decode(stream(4, bpc), 1000)
+    assert (decoder.bpc, decoder.numPoints, decoder.coordmode) == (bpc, 5, bpc == 2)
+    assert decoder.locked is not None
+    assert len(events) == 5
+    assert list(events[0].coords) == [0, 0] * 5
+    assert events[2].aIDs == (True, True, False, False, False)
+    assert list(events[2].coords[:4]) == [2, 4, 256 ** bpc - 3, 6]
+    assert not events[-1].pressed
+
+@pytest.mark.parametrize('bpc', [1, 2])
+def test_struct_and_numpy_decode_the_same(bpc):
+    pytest.importorskip('numpy')
+    data = stream(100, bpc)
+    decoded = []
+    for batchMin in (10 ** 6, 1):
+        decoder, events = decode(data, batchMin)
+        assert decoder.frames == 101
+        decoded.append(summary(events))
+    assert decoded[0] == decoded[1]
+    assert len(decoded[0]) == 101
+
+def test_zero_line():
+    data = frame(1, [(10, 20)], 1) + zeroLine() + frame(0, [], 0)
+    decoder, events = decode(data, 1000)
+    assert [e.pressed for e in events] == [True, False, False]
+    assert events[1].aIDs == (False,) * 5
+    assert decoder.counters() == {'frames': 2, 'zeroLines': 1, 'errors': 0}
+
+def test_zero_line_not_allowed():
+    decoder = touchDecoder(allowZeroLine=False)
+    ok, event, Len, pos = decoder.getEvent(frame(1, [(10, 20)], 1))
+    assert ok
+    ok, event, Len, end = decoder.getEvent(zeroLine(), 0)
+    assert (ok, end) == (False, 0)
+    assert decoder.errors == 1
+
+def test_incomplete_frame_is_kept():
+    data = stream(3)
+    cut = len(data) - 5
+    decoder = touchDecoder()
+    ok, events, Len, pos = decoder.getEvents(data, 0, cut)
+    assert ok
+    assert len(events) == 3
+    assert pos == 3 * len(frame(0, [], 0))
+    ok, events, Len, pos = decoder.getEvents(data, pos)
+    assert [e.pressed for e in events] == [False]
+    assert pos == len(data)
+
+def test_frame_buffer_split_reports():
+    events = []
+    buffer = frameBuffer(events.append, bufferSize=256, maxReport=64, decoder=touchDecoder())
+    data = stream(8)
+    for i in range(0, len(data), 7):
+        buffer.feed(data[i:i + 7])
+        buffer.decode()
+    assert summary(events) == summary(decode(data, 1000)[1])
@@ -0,0 +1,49 @@
+import asyncio
+
+from src.touchIntermediate import touchEvt
+from src.touchPipeline import stageQueue, isMove
+
+
+def move(x, aIDs=(True, False)):
+    return touchEvt(True, 2, True, list(aIDs), [(x, 0), (0, 0)])
+
+def release():
+    return touchEvt(True, 2, False, [False, False], [(0, 0), (0, 0)])
+
+async def fill(q, items):
+    for item in items:
+        await q.put(item)
+
+
+def test_drop_moves_skips_idle_markers():
+    q = stageQueue('events', 3, 'dropMoves', isMove)
+    first, second, last = move(1), move(2), move(3)
+
+    asyncio.run(asyncio.wait_for(fill(q, (None, first, second, last)), 1.0))
+    # first is the first frame after the idle marker, second is a move
+    assert list(q.items) == [None, first, last]
+    assert q.dropped == 1
+
+def test_drop_moves_keeps_the_press():
+    q = stageQueue('events', 3, 'dropMoves', isMove)
+    press, two, moved, last = move(1), move(2, (True, True)), move(3, (True, True)), move(4, (True, True))
+
+    async def run():
+        await fill(q, (release(), press))
+        # the release was handled before the press
+        await q.get()
+        await fill(q, (two, moved, last))
+
+    asyncio.run(asyncio.wait_for(run(), 1.0))
+    # press and two change the active touch points, moved is superseded by last
+    assert list(q.items) == [press, two, last]
+
+def test_idle_marker_is_not_a_move():
+    assert not isMove(None, move(1), move(2))
+    assert not isMove(move(1), None, move(2))
+    assert not isMove(move(1), move(2), None)
+    assert isMove(move(1), move(2), move(3))
+
+def test_transition_is_not_a_move():
+    assert not isMove(release(), move(1), move(2))
+    assert not isMove(move(1), move(2, (True, True)), move(3, (True, True)))
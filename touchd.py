@@ -1,22 +1,20 @@
 #!/usr/bin/python3
 import os
 import sys
-import math
+import json
 import signal
 import atexit
-from gc import collect
-from time import sleep, time as now
+from time import time as now
 from argparse import ArgumentParser as ap
 
-from psutil import pid_exists
-
-from src.vectors import vec
-from src.touchInput import getEvent
-from src.touchIntermediate import touchEvt
-from src.touchOutput import touchOut
-from src.config import readConfig, writeConfig
+# the client actions (stop, status, ...) only need these, the daemon imports
+# numpy, evdev, screeninfo and the rest of src below
+from src.startup import startupReport
+from src.control import request
+from src.latency import formatSummary
 
 if __name__ == '__main__':
+    startup = startupReport()
     rdir = os.path.dirname(os.path.realpath(__file__))
 
 def single(value):
@@ -25,14 +23,22 @@ def single(value):
     else:
         return value
 
-def handleEvent(event):
-    global tout
-    tout.handle(event)
-    collect()
+def showStatus(status, latency, counters):
+    # prints the replies of the status, metrics and counters commands
+    print('daemon running with pid %r for %.0f s (%s)' % (status['pid'], status['uptime'], status['mode']))
+    if 'startup' in status:
+        print('startup: %s' % ', '.join('%s %.1f ms' % item for item in status['startup'].items()))
+    for path, counters in counters['devices'].items():
+        if path in latency:
+            print(formatSummary(path, latency[path]))
+        else:
+            print(path)
+        print('    counters: %r' % counters)
 
 if __name__ == '__main__':
     isroot = os.getuid() is 0
     pidfile = '/tmp/pytouchd.pid'
+    sockfile = '/tmp/pytouchd.sock'  # the control socket, see controlServer
     byteorder = 'big'  # sys.byteorder
 
     p = ap(
@@ -42,17 +48,26 @@ if __name__ == '__main__':
     )
     p.add_argument(
         'action',
-        choices=['start', 'stop', 'status', 'zombie'],
-        help='start the daemon or stop the running instance',
+        choices=['start', 'stop', 'status', 'zombie', 'record', 'replay', 'counters', 'metrics', 'release', 'reload'],
+        help='start the daemon or stop the running instance, record the raw reports of the devices to a capture file or replay one; '
+            'counters, metrics, release (all touch points) and reload are sent to the running daemon',
         action='store'
     )
     p.add_argument(
         '--device', '-d',
-        help='path to the device, e.g. /dev/hidraw0',
+        help='path to the device(s), e.g. /dev/hidraw0 /dev/hidraw1',
         action='store',
         type=str,
-        nargs=1,
-        default='/dev/hidraw0'
+        nargs='+',
+        default=['/dev/hidraw0']
+    )
+    p.add_argument(
+        '--monitor', '-m',
+        help='index of the monitor each device maps to (default: the monitor option)',
+        action='store',
+        type=int,
+        nargs='+',
+        default=[]
     )
     p.add_argument(
         '--debug', '-D',
@@ -60,6 +75,13 @@ if __name__ == '__main__':
         action='store_true',
         default=False
     )
+    p.add_argument(
+        '--async',
+        dest='asyncMode',
+        help='run reader, decoder, gesture recognition and output as separate asyncio stages',
+        action='store_true',
+        default=False
+    )
     p.add_argument(
         '--show-config',
         dest='show_config',
@@ -67,6 +89,19 @@ if __name__ == '__main__':
         default=False,
         help='Show configuration details'
     )
+    p.add_argument(
+        '--capture', '-c',
+        help='capture file of record and replay',
+        action='store',
+        type=str,
+        default='touchd.cap'
+    )
+    p.add_argument(
+        '--fast',
+        help='replay as fast as possible instead of with the recorded timing',
+        action='store_true',
+        default=False
+    )
     p.add_argument(
         '--config',
         help='specify an alternative config file',
@@ -74,11 +109,19 @@ if __name__ == '__main__':
         nargs=1,
         default='touchd.ini'
     )
+    p.add_argument(
+        '--startup-report',
+        dest='startupReport',
+        help='print the duration of every startup phase and the time to the first frame',
+        action='store_true',
+        default=False
+    )
 
     args = p.parse_args()
+    startup.phase('arguments')
 
     action = single(args.action)
-    device = single(args.device)
+    devices = args.device
     debug = args.debug
 
     if action == 'zombie':
@@ -87,6 +130,12 @@ if __name__ == '__main__':
         action = 'start'
 
     if action == 'stop':
+        try:
+            request(sockfile, 'stop')
+            print('Stopping daemon...')
+            exit(0)
+        except OSError:
+            pass  # no control socket (or no permission), fall back to the pidfile
         if os.path.isfile(pidfile):
             print('Stopping daemon...')
             with open(pidfile) as f:
@@ -98,7 +147,18 @@ if __name__ == '__main__':
             exit(1)
 
     if action == 'status':
+        replies = None
+        try:
+            replies = [request(sockfile, c) for c in ('status', 'metrics', 'counters')]
+        except PermissionError:
+            print('run status as root to see the statistics')
+        except OSError:
+            pass  # no control socket, fall back to the pidfile
+        if replies is not None:
+            showStatus(*replies)
+            exit(0)
         if os.path.isfile(pidfile):
+            from psutil import pid_exists
             print('pidfile %r exists' % pidfile)
             with open(pidfile) as f:
                 pid = f.read()
@@ -113,6 +173,92 @@ if __name__ == '__main__':
             print('pidfile does not exist, the daemon is not running')
         exit(0)
 
+    if action in ('counters', 'metrics', 'release', 'reload'):
+        try:
+            print(json.dumps(request(sockfile, action), indent=2))
+        except PermissionError:
+            print('Must be root!')
+            exit(1)
+        except OSError:
+            print('No daemon running!')
+            exit(1)
+        except ValueError as err:
+            print('%s failed: %s' % (action, err))
+            exit(1)
+        exit(0)
+
+    if action == 'record':
+        # reading the devices needs no root and no pidfile
+        from src import capture as captureModule
+        from src.capture import record
+        stopped = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+        captureModule.debug = debug
+        print('Recording %s to %r, stop with Ctrl+C' % (', '.join(devices), args.capture))
+        try:
+            c = record(devices, args.capture, lambda: bool(stopped))
+        except OSError as err:
+            print('Could not record: %s' % err)
+            exit(1)
+        print('Recorded %r' % c)
+        exit(0)
+
+    # start or replay: the daemon
+    import struct
+    from psutil import pid_exists
+    from src.touchInput import hidrawReader, touchDecoder
+    from src.touchOutput import touchOut, multitouchOut
+    from src.config import readConfig
+    from src.settings import settings
+    from src.eventLoop import eventLoop
+    from src import geometry
+    from src.geometry import screenGeometry
+    from src import calibration as calibrationModule
+    from src.calibration import panelCalibration
+    from src import gcPolicy as gcModule
+    from src import gestures
+    from src import filters
+    from src import coalescing
+    from src.coalescing import moveCoalescer
+    from src import capture as captureModule
+    from src.capture import captureReader, captureTarget, capturePlayer
+    from src.latency import latencyMonitor
+    from src import control as controlModule
+    from src.control import controlServer
+    from src.gcPolicy import gcPolicy, parseThresholds
+    from src.touchPipeline import touchPipeline, pipelineGroup
+    from src import touchInput as inputModule
+    from src import eventLoop as loopModule
+    from src import touchPipeline as pipelineModule
+    from src import timers as timerModule
+    from src import formula as formulaModule
+    from src import latency as latencyModule
+    # --debug applies to every module, before the configuration compiles its formulas
+    geometry.debug = debug
+    calibrationModule.debug = debug
+    gestures.debug = debug
+    filters.debug = debug
+    coalescing.debug = debug
+    captureModule.debug = debug
+    controlModule.debug = debug
+    gcModule.debug = debug
+    inputModule.debug = debug
+    loopModule.debug = debug
+    pipelineModule.debug = debug
+    timerModule.debug = debug
+    formulaModule.debug = debug
+    latencyModule.debug = debug
+    startup.phase('imports')
+
+    capture = None
+    if action == 'replay':
+        try:
+            capture = captureReader(args.capture)
+        except (OSError, ValueError, struct.error) as err:
+            print('Could not read capture %r: %s' % (args.capture, err))
+            exit(1)
+        devices = capture.devices
+
     # else: start daemon:
 
     if not isroot:
@@ -136,19 +282,25 @@ if __name__ == '__main__':
         print('Could not create PID file!')
         exit(3)
 
-    cpath, cfg = readConfig(rdir, args.config)
+    cpath, cfg = readConfig(rdir, single(args.config))
     if args.show_config:
         print(cfg)
-    rawBuffer = []
-    bpc = None
-    coordmode = None  # 0->%, 1->absolute
-    minPoints, maxPoints, numPoints = 5, 8, None  # how many touch points
-    allowZeroLine = True  # allow aa 00 00 .. bb 00 00 .. with 00 instead of cc
-    minLen, maxLen = 5 + minPoints * [bpc, 1][bpc is None], 5 + maxPoints * [bpc, 2][bpc is None]
-    Len = None
-    tout = touchOut(cfg)
+    try:
+        opts = settings.compile(cfg)
+        # the options of every device, see Configuration.forDevice
+        deviceCfgs = [cfg.forDevice(device) for device in devices]
+        deviceOpts = [settings.compile(c) for c in deviceCfgs]
+    except ValueError as err:
+        print('Invalid configuration %r: %s' % (cpath, err))
+        os.remove(pidfile)
+        exit(4)
+    startup.phase('config')
     s = now()
     exitreason = None
+    idleTimeout = opts.idleTimeout or None
+    touts, readers = [], []
+    gcp = None
+    server = None
 
     ## for i in range(maxPoints):
         ## devs.append(emulatedDevice(i))
@@ -156,9 +308,19 @@ if __name__ == '__main__':
 
     @atexit.register
     def prepareExit():
-        global tout, pidfile, exitreason
-        signal.alarm(0)
-        tout.close()
+        global touts, readers, pidfile, exitreason
+        for tout in touts:
+            tout.close()
+        if debug:
+            for reader in readers:
+                print('%s: %r' % (reader.path, reader.counters()))
+                if reader.latency is not None:
+                    print(formatSummary(reader.path, reader.latency.summary()))
+            for tout in touts:
+                if tout.scheduler is not None:
+                    print('timers: %r' % tout.scheduler.counters())
+            if gcp is not None:
+                print('gc: %r' % gcp.counters())
         if os.path.isfile(pidfile):
             os.remove(pidfile)
         if exitreason is None:
@@ -167,18 +329,139 @@ if __name__ == '__main__':
         else:
             print(exitreason)
             print('Good-bye.')
-    
-    def timeout(sig, frame):
-        raise TimeoutError('input timed out')
 
-    def stop(sig, frame):
-        global pidfile, exitreason
+    def idle():
+        global touts, gcp
+        for tout in touts:
+            tout.releaseAll(quiet=True)
+        gcp.idle()
+
+    def reloadConfig():
+        '''reloadConfig()
+        Reads and validates the configuration again and swaps the options of
+        all devices between two frames; the uinput devices, the detected
+        layouts and the gesture state are kept. Raises ValueError (the old
+        options stay active) if the configuration is invalid.
+        '''
+        global cpath, cfg, opts, deviceCfgs, deviceOpts
+        try:
+            path, newCfg = readConfig(rdir, single(args.config))
+        except (OSError, AssertionError) as err:
+            raise ValueError('could not read the configuration: %s' % err)
+        if not newCfg:
+            raise ValueError('could not read %r' % path)
+        try:
+            newOpts, restart = settings.compile(newCfg).reloaded(opts)
+            prepared = []
+            for reader, tout, active in zip(readers, touts, deviceOpts):
+                dcfg = newCfg.forDevice(reader.path)
+                calibration = panelCalibration(dcfg, tout.screen)
+                dopts, r = settings.compile(dcfg).reloaded(active)
+                restart.extend(r)
+                prepared.append((dcfg, calibration, dopts))
+        except ValueError as err:
+            raise ValueError('invalid configuration %r: %s' % (path, err))
+        # everything is valid (panelCalibration fits and checks the matrix), nothing below raises
+        changed = set(newOpts.changes(opts))
+        for (dcfg, calibration, dopts), reader, tout, active in zip(prepared, readers, touts, deviceOpts):
+            changed.update(dopts.changes(active))
+            reader.decoder.recalibrate(calibration)
+            tout.reconfigure(dcfg, calibration, dopts)
+        cpath, cfg, opts = path, newCfg, newOpts
+        deviceCfgs = [c for c, calibration, o in prepared]
+        deviceOpts = [o for c, calibration, o in prepared]
+        return {'config': path, 'changed': sorted(changed), 'restart': sorted(set(restart))}
+
+    def reload(sig):
+        if debug:
+            print('SIGHUP: re-resolving monitor geometry, reloading the configuration')
+        geometry.invalidate()
+        try:
+            result = reloadConfig()
+        except ValueError as err:
+            print('reload failed, keeping the active configuration: %s' % err)
+            return
+        print('reloaded %r, changed: %s' % (result['config'], ', '.join(result['changed']) or 'nothing'))
+        if result['restart']:
+            print('%s only change with a restart' % ', '.join(result['restart']))
+
+    # the commands of the control socket, see controlServer
+    def controlStop():
+        runner.stop('STOP requested - control socket')
+        return 'stopping'
+
+    def controlStatus():
+        return {
+            'pid': os.getpid(),
+            'uptime': now() - s,
+            'mode': 'replay' if capture is not None else 'async' if args.asyncMode else 'sync',
+            'devices': [reader.path for reader in readers],
+            'config': cpath,
+            'startup': startup.summary()
+        }
+
+    def controlCounters():
+        c = {'devices': {reader.path: reader.counters() for reader in readers}, 'timers': {}, 'filter': {}, 'output': {}}
+        for reader, tout in zip(readers, touts):
+            if tout.scheduler is not None:
+                c['timers'][reader.path] = tout.scheduler.counters()
+            if tout.filter is not None:
+                c['filter'][reader.path] = tout.filter.counters()
+            c['output'][reader.path] = tout.counters()
+        c['gc'] = gcp.counters()
+        c['control'] = {'requests': server.requests}
+        return c
+
+    def controlMetrics():
+        return {reader.path: reader.latency.summary() for reader in readers if reader.latency is not None}
+
+    def controlRelease():
+        if isinstance(runner, pipelineGroup):
+            # in order with the queued frames, the writer stage writes the releases
+            for p in runner.pipelines:
+                p.release()
+            return 'released'
+        for tout in touts:
+            tout.releaseAll(quiet=True)
+            tout.flush()
+        return 'released'
+
+    def controlReload():
+        geometry.invalidate()
+        return reloadConfig()
+
+    def stop(sig):
+        global pidfile
+        runner.stop('STOP requested - SIGTERM')
         try:
-            exitreason = 'STOP requested - SIGTERM'
             os.remove(pidfile)
         except Exception:
             pass
 
+    def readInput(fd):
+        global byFd
+        reader = byFd[fd]
+        if not reader.read():
+            runner.stop('getEvent() failed (%s)' % reader.path)
+
+    def ready():
+        # the main loop starts, see --startup-report
+        startup.started()
+        if args.startupReport:
+            print(startup.format())
+
+    def firstFrame(reader):
+        if startup.first is None:
+            startup.firstFrame()
+            print('first frame (%s) %.1f ms after the start of the main loop' % (reader.path, startup.first * 1e3))
+
+    def firstInput(fd):
+        # readInput of the first read of a device with --startup-report
+        firstFrame(byFd[fd])
+        runner.removeReader(fd)
+        runner.addReader(fd, readInput)
+        readInput(fd)
+
     def handleFatal(err):
         global exitreason
         import traceback
@@ -186,47 +469,95 @@ if __name__ == '__main__':
         fmt = traceback.format_exc()
         exitreason = 'FATAL: %r (file %r, line %s)\n%s' % (str(err), etb.tb_frame.f_code.co_filename, etb.tb_lineno, fmt)
 
-    if debug:
-        print('opening device %r' % device)
-    with open(device, 'rb') as f:
-        try:
-            signal.signal(signal.SIGALRM, timeout)
-            signal.signal(signal.SIGTERM, stop)
-            while True:  # os.path.isfile(pidfile):
-                if not os.path.isfile(pidfile):
-                    if exitreason is None:
-                        exitreason = 'STOP requested - pidfile deleted'
-                if exitreason is not None:
-                    break
-                signal.alarm(1)
-                try:
-                    print(str(int(now()))[-3:], end='\r')
-                    rawBuffer.append(f.read(1))
-                    signal.alarm(0)
-                except TimeoutError as err:
-                    print('##', end='\r')
-                    # releaseAll()
-                    collect()
-                if Len is None:
-                    if rawBuffer and rawBuffer[-1] == b'\xcc':
-                        success, event, Len, rawBuffer = getEvent(rawBuffer)
-                        if debug:
-                            print('Set Len to %d' % Len)
-                        if event is not None:
-                            handleEvent(event)
-                elif len(rawBuffer) >= Len:
-                    success, event, Len, rawBuffer = getEvent(rawBuffer)
-                    if bpc is None and success:
-                        bpc, coordmode, numPoints = event.details
-                    if not success:
-                        pass
-                        exitreason = 'getEvent() failed'
-                    elif event is not None:
-                        handleEvent(event)
-        except KeyboardInterrupt:
-            print('\rKeyboardInterrupt. Exiting...')
-            exitreason = 'KeyboardInterrupt'
-        except Exception as err:
-            handleFatal(err)
-
-    
+    runner = None
+    try:
+        # open the input devices first, the kernel queues their reports until the loop runs
+        for device in devices:
+            if debug:
+                print('opening device %r' % device)
+            decoder = touchDecoder(poolSize=opts.eventPoolSize)
+            if capture is not None:
+                readers.append(captureTarget(device, None, decoder=decoder))
+            else:
+                readers.append(hidrawReader(device, None, decoder=decoder))
+        startup.phase('input')
+        screens, calibrations = [], []
+        for i, device in enumerate(devices):
+            if i < len(args.monitor):
+                screens.append(screenGeometry(args.monitor[i]))
+            else:
+                screens.append(screenGeometry(opts.monitor))
+            calibrations.append(panelCalibration(deviceCfgs[i], screens[i]))
+        startup.phase('geometry')
+        for i, (reader, screen, calibration) in enumerate(zip(readers, screens, calibrations)):
+            name = 'pytouchd' if i == 0 else 'pytouchd%d' % i
+            dcfg, dopts = deviceCfgs[i], deviceOpts[i]
+            if dopts.outputMode == 'multitouch':
+                tout = multitouchOut(dcfg, name=name, screen=screen, calibration=calibration, settings=dopts)
+            else:
+                tout = touchOut(dcfg, name=name, screen=screen, calibration=calibration, settings=dopts)
+            touts.append(tout)
+            reader.callback = tout.handle
+            reader.decoder.recalibrate(calibration)
+            if dopts.coalesceMoves:
+                reader.coalescer = moveCoalescer()
+            if dopts.latencyStats:
+                reader.latency = tout.latency = latencyMonitor(reader.path)
+        startup.phase('output')
+        gcp = gcPolicy(parseThresholds(opts.gcThresholds), opts.gcFreeze, opts.gcIdleCollect, opts.gcIdleOnly)
+        if capture is None:
+            server = controlServer(sockfile, {
+                'stop': controlStop,
+                'status': controlStatus,
+                'counters': controlCounters,
+                'metrics': controlMetrics,
+                'release': controlRelease,
+                'reload': controlReload
+            })
+        if capture is not None:
+            runner = capturePlayer(capture, readers, not args.fast)
+            for tout in touts:
+                if tout.scheduler is not None:
+                    runner.addScheduler(tout.scheduler, tout.flush)
+            gcp.start()
+            ready()
+            exitreason = 'replayed %r: %r' % (args.capture, runner.run())
+        elif args.asyncMode:
+            runner = pipelineGroup([touchPipeline(reader, tout,
+                opts.queueSize, opts.overflowPolicy,
+                idleTimeout, gcp.idle) for reader, tout in zip(readers, touts)])
+            if args.startupReport:
+                for p in runner.pipelines:
+                    p.onFirstRead = firstFrame
+            server.attach(runner)
+            gcp.start()
+            ready()
+            exitreason = runner.run({signal.SIGTERM: stop, signal.SIGHUP: reload})
+        else:
+            runner = eventLoop(idleTimeout)
+            byFd = {}
+            for reader in readers:
+                byFd[reader.fd] = reader
+                runner.addReader(reader.fd, firstInput if args.startupReport else readInput)
+            runner.addSignal(signal.SIGTERM, stop)
+            runner.addSignal(signal.SIGHUP, reload)
+            server.attach(runner)
+            runner.addIdle(idle)
+            for tout in touts:
+                if tout.scheduler is not None:
+                    runner.addScheduler(tout.scheduler, tout.flush)
+            gcp.start()
+            ready()
+            exitreason = runner.run()
+    except KeyboardInterrupt:
+        print('\rKeyboardInterrupt. Exiting...')
+        exitreason = 'KeyboardInterrupt'
+    except Exception as err:
+        handleFatal(err)
+    finally:
+        if server is not None:
+            server.close()
+        if isinstance(runner, eventLoop):
+            runner.close()
+        for reader in readers:
+            reader.close()